@@ -0,0 +1,404 @@
+import os
+import re
+import sys
+import random
+import subprocess
+
+from   typing import Any
+from   typing import Dict
+from   typing import List
+from   typing import Tuple
+from   typing import Optional
+from   time   import sleep
+
+from concurrent.futures import ThreadPoolExecutor
+
+# Specific LightTable stuff
+from general_functions   import NEXUS_PATHS
+from general_functions   import get_host_name
+from sim_functions       import make_majorana_script
+from sim_functions       import make_harvard_script
+from sim_functions       import get_run_macro
+from index_functions     import add_to_completion_index
+from index_functions     import get_index_shell_line
+from synthetic_functions import SYNTHETIC_SENSORS
+from synthetic_functions import write_synthetic_job_dst
+from vertex_functions    import get_macro_vertices
+from metrics_functions   import ProgressReporter
+from pack_functions      import pack_job
+from pack_functions      import get_pack_shell_line
+from reduction_functions import reduce_dst_file
+from reduction_functions import get_raw_dst_path
+
+
+# Valid simulation backends
+VALID_SIM_BACKENDS = ["local", "majorana", "harvard", "fake_nexus"]
+
+# PATH of the fake nexus run by the Slurm job arrays of the fake_nexus backend
+FAKE_NEXUS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "utils", "fake_slurm", "")
+
+# Seconds between the polls of the running jobs
+SIM_POLL_SECONDS = 1.
+
+# Max. number of jobs queued at once in the queue systems
+QUEUE_MAX_JOBS = 400
+
+# A simulation job is a Dict with:
+#   'init_fnames', 'dst_fnames', 'log_fnames' : the files of its points
+#   'num_evts'    : number of events of every point
+#   'index_fname' : completion index recording the finished points (or None)
+#   'num_photons' : photons recorded in the completion index for every point
+#   'index_lines' : shell lines recording every point in the completion index (or None)
+#   'pack_files'  : (pack_fname, tar_fname, pack_index_fname) of the packed outputs (or None)
+#   'pack_line'   : shell line packing the points of the job (or None)
+#   'reduce_sensors' : sensor names kept by the on-node reduction of the DSTs (or None)
+#   'keep_raw_dsts'  : whether the raw DSTs reduced are kept (in <dst_path>/raw/)
+SimJob = Dict
+
+
+
+###
+class SimBackend :
+
+    # Backend running the simulation jobs:
+    #   prepare : the job (and its scripts) to simulate a set of points
+    #   submit  : launches the job, returning a handle to follow it
+    #   poll    : whether the job of a handle has finished
+    #   collect : init file names of the failed points of a finished job
+    # Queue backends do not follow their jobs (submit returns None): the points
+    # failed are found, and re-run, by the next run.
+
+    def __init__(self, exe_path : str) :
+        self.exe_path = exe_path
+
+
+    def prepare(self,
+                init_fnames : List[str],
+                dst_fnames  : List[str],
+                log_fnames  : List[str],
+                num_evts    : int,
+                index_fname : Optional[str] = None,
+                num_photons : int           = 0,
+                pack_files  : Optional[Tuple[str, str, str]] = None,
+                reduce_sensors : Optional[List[str]] = None,
+                keep_raw_dsts  : bool                = True
+               )           -> SimJob :
+
+        # Lines recording every point in the completion index once finished
+        # (recorded by the packer with packed outputs)
+        index_lines = None
+        pack_line   = None
+        if pack_files:
+            pack_line = get_pack_shell_line(*pack_files, index_fname, num_photons)
+        elif index_fname:
+            index_lines = [get_index_shell_line(index_fname, dst_fname + '.h5', num_photons)
+                           for dst_fname in dst_fnames]
+
+        return {'init_fnames' : init_fnames,
+                'dst_fnames'  : dst_fnames,
+                'log_fnames'  : log_fnames,
+                'num_evts'    : num_evts,
+                'index_fname' : index_fname,
+                'num_photons' : num_photons,
+                'index_lines' : index_lines,
+                'pack_files'  : pack_files,
+                'pack_line'   : pack_line,
+                'reduce_sensors' : reduce_sensors,
+                'keep_raw_dsts'  : keep_raw_dsts}
+
+
+    def submit(self, job : SimJob) -> Any :
+        raise NotImplementedError
+
+
+    def poll(self, handle : Any) -> bool :
+        return True
+
+
+    def collect(self, handle : Any) -> List[str] :
+        return []
+
+
+    def shutdown(self) -> None :
+        pass
+
+
+
+###
+class LocalBackend(SimBackend) :
+
+    # nexus jobs run in the background on this machine, up to max_jobs at once
+
+    def __init__(self,
+                 exe_path : str,
+                 max_jobs : int = 1
+                ) :
+        super().__init__(exe_path)
+        self.executor = ThreadPoolExecutor(max_workers = max_jobs)
+
+
+    def run_point(self,
+                  init_fname : str,
+                  dst_fname  : str,
+                  log_fname  : str,
+                  num_evts   : int
+                 )          -> bool :
+
+        # Running nexus on a point, returning whether it succeeded
+        inst = [self.exe_path + "nexus", "-b", init_fname, "-n", str(num_evts)]
+        try:
+            with open(log_fname, 'w') as log_file:
+                result = subprocess.run(inst, stdout = log_file, stderr = subprocess.STDOUT,
+                                        env = os.environ.copy())
+            return (result.returncode == 0) and os.path.isfile(dst_fname + '.h5')
+        except OSError:
+            return False
+
+
+    def reduce_point(self,
+                     dst_fname : str,
+                     job       : SimJob
+                    )         -> bool :
+
+        # Reducing the DST of a point right after its run, returning whether it succeeded
+        raw_path = get_raw_dst_path(dst_fname) if job['keep_raw_dsts'] else None
+        try:
+            reduce_dst_file(dst_fname + '.h5', job['reduce_sensors'], raw_path)
+            return True
+        except Exception:
+            print(f"  WARNING: {dst_fname}.h5 NOT reduced")
+            return False
+
+
+    def run_job(self, job : SimJob) -> List[str] :
+
+        # Running the points of the job one after the other, returning the failed ones
+        # (reducing their DSTs right after their runs with reduce_sensors)
+        failed_fnames = []
+        done_fnames   = []
+        for init_fname, dst_fname, log_fname in zip(job['init_fnames'], job['dst_fnames'],
+                                                    job['log_fnames']):
+            if not self.run_point(init_fname, dst_fname, log_fname, job['num_evts']):
+                failed_fnames.append(init_fname)
+            elif job['reduce_sensors'] and not self.reduce_point(dst_fname, job):
+                failed_fnames.append(init_fname)
+            elif job['pack_files']:
+                done_fnames.append((init_fname, dst_fname + '.h5', log_fname))
+            elif job['index_fname']:
+                add_to_completion_index(job['index_fname'], dst_fname + '.h5', job['num_photons'],
+                                        os.path.getsize(dst_fname + '.h5'))
+
+        # Packing the points done (the ones not packed are failed too)
+        if done_fnames:
+            packed = pack_job(*job['pack_files'], job['index_fname'], job['num_photons'], done_fnames)
+            failed_fnames += [init_fname for init_fname, dst_h5_fname, _ in done_fnames
+                              if dst_h5_fname not in packed]
+
+        return failed_fnames
+
+
+    def submit(self, job : SimJob) -> Any :
+        return self.executor.submit(self.run_job, job)
+
+
+    def poll(self, handle : Any) -> bool :
+        return handle.done()
+
+
+    def collect(self, handle : Any) -> List[str] :
+        return handle.result()
+
+
+    def shutdown(self) -> None :
+        self.executor.shutdown()
+
+
+
+###
+class MajoranaBackend(SimBackend) :
+
+    # Every job submitted to the MAJORANA PBS queue
+
+    def submit(self, job : SimJob) -> Any :
+        script_fname = "sim.script"
+        make_majorana_script(script_fname, self.exe_path, job['init_fnames'], job['log_fnames'],
+                             job['num_evts'], job['index_lines'], job['dst_fnames'], job['pack_line'],
+                             job['reduce_sensors'], job['keep_raw_dsts'])
+        os.system(f"qsub -N tst {script_fname}")
+        return None
+
+
+
+###
+class HarvardBackend(SimBackend) :
+
+    # Every job submitted to the HARVARD Slurm queue
+
+    def submit(self, job : SimJob) -> Any :
+
+        # Limit the maximum number of jobt to run at the same time
+        while int(os.popen('squeue -u $USER | wc -l').read()) > QUEUE_MAX_JOBS:
+            sleep(30)
+
+        script_fname = "sim.slurm"
+        make_harvard_script(script_fname, self.exe_path, job['init_fnames'], job['dst_fnames'],
+                            job['log_fnames'], job['num_evts'], job['index_lines'], job['pack_line'],
+                            job['reduce_sensors'], job['keep_raw_dsts'])
+        os.system(f"sbatch {script_fname}")
+        return None
+
+
+
+###
+class FakeNexusBackend(LocalBackend) :
+
+    # Stand-in of the local backend writing synthetic DSTs instead of running
+    # nexus, to test the scheduling, skipping and re-running of the points
+    # on any machine. Every point takes a random time of mean latency seconds,
+    # fails with probability failure_rate (writing no DST) and crashes while
+    # writing its DST with probability corrupt_rate (leaving a truncated one).
+
+    def __init__(self,
+                 det_name     : str,
+                 max_jobs     : int   = 1,
+                 latency      : float = 0.,
+                 failure_rate : float = 0.,
+                 corrupt_rate : float = 0.,
+                 seed         : Optional[int] = None
+                ) :
+        assert det_name in SYNTHETIC_SENSORS, f"No synthetic sensors for {det_name}"
+        super().__init__("", max_jobs)
+        self.det_name     = det_name
+        self.latency      = latency
+        self.failure_rate = failure_rate
+        self.corrupt_rate = corrupt_rate
+        self.rng          = random.Random(seed)
+
+
+    def run_point(self,
+                  init_fname : str,
+                  dst_fname  : str,
+                  log_fname  : str,
+                  num_evts   : int
+                 )          -> bool :
+
+        # Photons & seed from the config macro, and the vertices simulated
+        # from it and the vertices macro of multi-vertex jobs (if any)
+        run_macro   = get_run_macro(init_fname)
+        num_photons = int(re.search(r"/Generator/ScintGenerator/nphotons\s+(\d+)",
+                                    run_macro).group(1))
+        seed        = int(re.search(r"/nexus/random_seed\s+(\d+)", run_macro).group(1))
+        vertices    = get_macro_vertices(run_macro, num_evts)
+
+        with open(log_fname, 'w') as log_file:
+            log_file.write(f"Fake nexus - {init_fname} - {num_evts} events\n")
+
+            # Every vertex run with a Geant4 like run summary, as timed by the cost model
+            for _, _, vertex_evts in vertices:
+                run_seconds = self.rng.expovariate(1. / self.latency) if self.latency > 0 else 0.
+                sleep(run_seconds)
+                log_file.write(f" Run terminated.\nRun Summary\n" +
+                               f"  Number of events processed : {vertex_evts}\n" +
+                               f"  User={run_seconds:.2f}s Real={run_seconds:.2f}s Sys=0s\n")
+
+            draw = self.rng.random()
+            if draw < self.failure_rate:
+                log_file.write("Fake nexus - FAILED\n")
+                return False
+
+            write_synthetic_job_dst(dst_fname + '.h5', self.det_name, vertices, num_photons,
+                                    seed = seed)
+
+            if draw < self.failure_rate + self.corrupt_rate:
+                os.truncate(dst_fname + '.h5', os.path.getsize(dst_fname + '.h5') // 2)
+                log_file.write("Fake nexus - CRASHED writing the DST\n")
+                return False
+
+            log_file.write("Fake nexus - DONE\n")
+        return True
+
+
+
+###
+def get_sim_backend(backend_name : Optional[str]   = None,
+                    det_name     : str             = "",
+                    exe_path     : Optional[str]   = None,
+                    max_jobs     : int             = 1,
+                    fake_config  : Optional[Dict]  = None
+                   )            -> SimBackend :
+
+    # Backend of the host by default, with its nexus PATH unless given.
+    # fake_config: latency, failure_rate, corrupt_rate & seed of the fake_nexus backend.
+    if backend_name is None:
+        backend_name = get_host_name()
+
+    if backend_name not in VALID_SIM_BACKENDS:
+        print(f"Light Table simulations in {backend_name} are not supported yet.")
+        sys.exit()
+
+    if backend_name == "fake_nexus":
+        return FakeNexusBackend(det_name, max_jobs, **(fake_config or {}))
+
+    if exe_path is None:
+        exe_path = NEXUS_PATHS[backend_name]
+
+    if   backend_name == "local"   : return LocalBackend(exe_path, max_jobs)
+    elif backend_name == "majorana": return MajoranaBackend(exe_path)
+    else                           : return HarvardBackend(exe_path)
+
+
+
+###
+def get_max_running_jobs(backend_name   : Optional[str],
+                         local_max_jobs : int
+                        )              -> int :
+    # Max. number of jobs of a backend running at once
+    if backend_name is None:
+        backend_name = get_host_name()
+    if backend_name in ["local", "fake_nexus"]:
+        return local_max_jobs
+    return QUEUE_MAX_JOBS
+
+
+
+###
+def run_sims(backend     : SimBackend,
+             init_fnames : List[str],
+             dst_fnames  : List[str],
+             log_fnames  : List[str],
+             num_evts    : int,
+             index_fname : Optional[str] = None,
+             num_photons : int           = 0,
+             pack_files  : Optional[Tuple[str, str, str]] = None,
+             reduce_sensors : Optional[List[str]] = None,
+             keep_raw_dsts  : bool                = True
+            )           -> Any :
+
+    # Submitting a job with the points, returning its handle (None if not followed)
+    job = backend.prepare(init_fnames, dst_fnames, log_fnames, num_evts,
+                          index_fname, num_photons, pack_files, reduce_sensors, keep_raw_dsts)
+    return backend.submit(job)
+
+
+
+###
+def wait_sims(backend : SimBackend,
+              handles : List[Any]
+             )       -> List[str] :
+
+    # Waiting for the jobs, reporting the progress and the failed points
+    failed_fnames = []
+    pending       = list(handles)
+    progress      = ProgressReporter("Jobs finished", len(handles))
+    while pending:
+        for handle in [handle for handle in pending if backend.poll(handle)]:
+            failed_fnames += backend.collect(handle)
+            pending.remove(handle)
+            progress.update(info = f"Failed points: {len(failed_fnames)}")
+        if pending:
+            sleep(SIM_POLL_SECONDS)
+
+    for init_fname in failed_fnames:
+        print(f"  FAILED: {init_fname}")
+
+    return failed_fnames
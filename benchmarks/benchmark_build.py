@@ -0,0 +1,220 @@
+"""
+This SCRIPT benchmarks the table building pipeline on synthetic DSTs:
+position generation, build_energy_table and build_tracking_table, reporting
+points/s, MB/s and peak RSS of every step.
+
+Usage (from the repository root):
+    python -m benchmarks.benchmark_build det_name [num_points] [num_workers] [report.json]
+"""
+
+# General Importings
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+import resource
+import traceback
+import numpy  as np
+
+from typing          import Callable
+from typing          import Dict
+from multiprocessing import get_context
+
+# Light Table stuff
+from pos_functions       import get_table_positions
+from pos_functions       import get_position_tuples
+from plan_functions      import CampaignPlan
+from plan_functions      import get_base_fname
+from plan_functions      import get_plan_settings
+from table_functions     import build_energy_table
+from table_functions     import build_tracking_table
+from synthetic_functions import SYNTHETIC_SENSORS
+from synthetic_functions import write_synthetic_dst
+
+
+# Table settings of every benchmark
+ENERGY_PITCH      = (10.0, 10.0, 10.0)
+TRACKING_PITCH    = ( 1.0,  1.0,  1.0)
+TRACKING_MAX_DIST = 100.
+PHOTONS_PER_EVENT = 1000000
+TIME_BINS         = 4
+
+# ru_maxrss units per MB: bytes on macOS, KiB on Linux
+RSS_UNITS_PER_MB  = 1.e6 if sys.platform == "darwin" else 1.e3
+
+
+
+###
+def make_benchmark_plan(det_name         : str,
+                        table_type       : str,
+                        signal_type      : str,
+                        pitch            : tuple,
+                        tracking_maxDist : float,
+                        num_points       : int,
+                        work_path        : str
+                       )                -> CampaignPlan :
+
+    # Campaign plan of num_points positions (evenly taken from the table ones)
+    # with all its files in work_path
+    positions = get_table_positions(det_name, table_type, signal_type, pitch, tracking_maxDist)
+    positions = positions[np.unique(np.linspace(0, len(positions) - 1, num_points).astype(int))]
+
+    return {'settings'        : get_plan_settings(det_name, table_type, signal_type, pitch,
+                                                  tracking_maxDist, 1, None),
+            'positions'       : positions,
+            'symmetry'        : None,
+            'table_positions' : positions,
+            'config_path'     : work_path,
+            'log_path'        : work_path,
+            'dst_path'        : work_path,
+            'table_path'      : work_path,
+            'base_fnames'     : [get_base_fname(det_name, pos) for pos in get_position_tuples(positions)],
+            'jobs'            : []}
+
+
+
+###
+def write_plan_dsts(det_name : str,
+                    plan     : CampaignPlan
+                   )        -> float :
+
+    # Synthetic DST of every plan point, returning their total size (MB)
+    total_size = 0
+    for point_idx, pos in enumerate(get_position_tuples(plan['positions'])):
+        dst_fname = plan['dst_path'] + plan['base_fnames'][point_idx] + ".next.h5"
+        write_synthetic_dst(dst_fname, det_name, pos, PHOTONS_PER_EVENT,
+                            time_bins = TIME_BINS, seed = point_idx)
+        total_size += os.path.getsize(dst_fname)
+    return total_size / 1.e6
+
+
+
+###
+def run_measured(func : Callable,
+                 *args
+                ) -> Dict :
+
+    # Running func in a forked process, so its peak RSS (and the one of its
+    # workers) is not mixed up with the one of the previous steps.
+    # The errors of func are sent back and raised, as well as the death of
+    # the process with nothing sent.
+    def measured(conn, *args) :
+        try:
+            start  = time.perf_counter()
+            result = func(*args)
+            conn.send({'time'       : time.perf_counter() - start,
+                       'num_points' : len(result),
+                       'peak_rss_mb': max(resource.getrusage(resource.RUSAGE_SELF)    .ru_maxrss,
+                                          resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss) / RSS_UNITS_PER_MB})
+        except BaseException:
+            conn.send({'error': traceback.format_exc()})
+        finally:
+            conn.close()
+
+    context = get_context("fork")
+    parent_conn, child_conn = context.Pipe()
+    process = context.Process(target = measured, args = (child_conn,) + args)
+    process.start()
+    child_conn.close()
+    try:
+        metrics = parent_conn.recv()
+    except EOFError:
+        metrics = None
+    process.join()
+
+    if metrics is None:
+        raise RuntimeError(f"{func.__name__} died with exit code {process.exitcode}")
+    if 'error' in metrics:
+        raise RuntimeError(f"{func.__name__} failed:\n{metrics['error']}")
+    return metrics
+
+
+
+###
+def print_metrics(step    : str,
+                  metrics : Dict
+                 )       -> None :
+    line = f"* {step:24}: {metrics['num_points']:8} points in {metrics['time']:8.3f} s -> " + \
+           f"{metrics['points_per_s']:10.0f} points/s"
+    if 'mb_per_s' in metrics:
+        line += f" - {metrics['mb_per_s']:8.1f} MB/s"
+    print(line + f" - Peak RSS {metrics['peak_rss_mb']:8.1f} MB")
+
+
+
+#################### SETTINGS ####################
+try:
+    det_name = sys.argv[1]
+    assert det_name in SYNTHETIC_SENSORS, f"No synthetic sensors for {det_name}"
+except IndexError:
+    print("\nUsage: python -m benchmarks.benchmark_build det_name [num_points] [num_workers] [report.json]\n")
+    sys.exit()
+
+num_points   = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+num_workers  = int(sys.argv[3]) if len(sys.argv) > 3 else 1
+report_fname = sys.argv[4]      if len(sys.argv) > 4 else None
+
+
+
+#################### BENCHMARKING ####################
+
+print(f"\n*** Benchmarking {det_name} table building - {num_points} points - {num_workers} workers\n")
+report = {'det_name': det_name, 'num_points': num_points, 'num_workers': num_workers}
+
+# Position generation
+for table_type, signal_type, pitch in [("energy",   "S2", ENERGY_PITCH),
+                                       ("energy",   "S1", ENERGY_PITCH),
+                                       ("tracking", "S2", TRACKING_PITCH)]:
+    step    = f"positions_{table_type}_{signal_type}"
+    metrics = run_measured(get_table_positions, det_name, table_type, signal_type,
+                           pitch, TRACKING_MAX_DIST)
+    metrics['points_per_s'] = metrics['num_points'] / metrics['time']
+    print_metrics(step, metrics)
+    report[step] = metrics
+
+# Table building from synthetic DSTs
+work_path = tempfile.mkdtemp(prefix = "LightTableBenchmark.") + "/"
+try:
+    for table_type, sensor_name, pitch, builder in [
+            ("energy",   "PmtR11410", ENERGY_PITCH,   build_energy_table),
+            ("energy",   "SiPM",      ENERGY_PITCH,   build_energy_table),
+            ("tracking", "SiPM",      TRACKING_PITCH, build_tracking_table)]:
+
+        plan = make_benchmark_plan(det_name, table_type, "S2", pitch, TRACKING_MAX_DIST,
+                                   num_points, work_path)
+        dsts_mb = write_plan_dsts(det_name, plan)
+
+        if table_type == "energy":
+            args = (det_name, "S2", sensor_name, pitch, num_workers, None, plan)
+        else:
+            args = (det_name, "S2", sensor_name, pitch, TRACKING_MAX_DIST, num_workers, None, plan)
+
+        # Silencing the per point prints of the builders
+        with open(os.devnull, 'w') as devnull:
+            stdout, sys.stdout = sys.stdout, devnull
+            try:
+                metrics = run_measured(builder, *args)
+            finally:
+                sys.stdout = stdout
+
+        metrics['num_points']   = len(plan['positions'])
+        metrics['points_per_s'] = metrics['num_points'] / metrics['time']
+        metrics['mb_per_s']     = dsts_mb / metrics['time']
+        metrics['dsts_mb']      = dsts_mb
+
+        step = f"build_{table_type}_{sensor_name}"
+        print_metrics(step, metrics)
+        report[step] = metrics
+
+        for dst_name in os.listdir(work_path):
+            os.remove(work_path + dst_name)
+finally:
+    shutil.rmtree(work_path, ignore_errors = True)
+
+if report_fname:
+    with open(report_fname, 'w') as report_file:
+        json.dump(report, report_file, indent = 2)
+    print(f"\n*** Report stored in {report_fname}")
+print()
@@ -0,0 +1,143 @@
+"""
+This SCRIPT benchmarks the LightTable batch queries against point by point
+pandas .loc lookups.
+
+Usage (from the repository root):
+    python -m benchmarks.benchmark_lookup light_table.h5 [num_points]
+"""
+
+# General Importings
+import sys
+import time
+import numpy  as np
+import pandas as pd
+
+from typing import List
+
+# Light Table stuff
+from lookup_functions import LightTable
+from dense_functions  import is_dense_table
+from dense_functions  import read_dense_table
+
+
+# Number of points looked up one by one with .loc (the slow baseline)
+LOC_POINTS = 10000
+
+
+
+###
+def get_random_points(light_table : LightTable,
+                      num_points  : int,
+                      seed        : int = 0
+                     )           -> np.ndarray :
+
+    # Random points uniformly distributed within the table limits
+    rng = np.random.default_rng(seed)
+    if light_table.table_type == "energy":
+        radius = light_table.max_radius * np.sqrt(rng.uniform(0, 1, num_points))
+        phi    = rng.uniform(0, 2 * np.pi, num_points)
+        coords = [radius * np.cos(phi), radius * np.sin(phi)]
+    else:
+        coords = [rng.uniform(0, light_table.max_dist, num_points)]
+
+    for axis in light_table.axes[len(coords):]:
+        coords.append(rng.uniform(axis[0], axis[-1], num_points))
+
+    return np.column_stack(coords)
+
+
+
+###
+def get_loc_keys(light_table : LightTable,
+                 points      : np.ndarray
+                )           -> List :
+
+    # Table keys of the grid nodes closest to the points, as used with .loc
+    node_coords = []
+    for axis_num, axis in enumerate(light_table.axes):
+        idx = np.abs(points[:, axis_num, np.newaxis] - axis[np.newaxis, :]).argmin(axis = 1)
+        node_coords.append(axis[idx])
+
+    if light_table.table_type == "tracking":
+        return [(dist, f"z_m{int(-z)}") for dist, z in zip(*node_coords)]
+    if len(node_coords) == 1:
+        return list(node_coords[0])
+    return list(zip(*node_coords))
+
+
+
+###
+def loc_lookups(pandas_table : pd.DataFrame,
+                table_type   : str,
+                keys         : List
+               )            -> np.ndarray :
+
+    # Point by point .loc lookups, NaN for the keys not in the table
+    values = []
+    for key in keys:
+        try:
+            if table_type == "tracking":
+                values.append([pandas_table.loc[key[0], key[1]]])
+            else:
+                values.append(pandas_table.loc[key].values)
+        except KeyError:
+            values.append(np.full(pandas_table.shape[1] if table_type == "energy" else 1, np.nan))
+    return np.array(values, dtype = float)
+
+
+
+###
+def time_it(func, *args) :
+    start  = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+
+#################### SETTINGS ####################
+try:
+    table_fname = sys.argv[1]
+except IndexError:
+    print("\nUsage: python -m benchmarks.benchmark_lookup light_table.h5 [num_points]\n")
+    sys.exit()
+
+num_points = int(sys.argv[2]) if len(sys.argv) > 2 else 1000000
+
+
+
+#################### BENCHMARKING ####################
+
+light_table, load_time = time_it(LightTable, table_fname)
+print(f"\n*** {table_fname}")
+print(f"*** {light_table.table_type} table - axes {light_table.axis_names} - " +
+      f"{len(light_table.columns)} columns - loaded in {load_time:.2f} s\n")
+
+if is_dense_table(table_fname):
+    pandas_table = read_dense_table(table_fname)[0]
+else:
+    pandas_table = pd.read_hdf(table_fname, '/LightTable')
+
+points = get_random_points(light_table, num_points)
+
+# Baseline: pandas .loc lookups, one point at a time
+loc_points = points[:LOC_POINTS]
+loc_keys   = get_loc_keys(light_table, loc_points)
+
+loc_values, loc_time = time_it(loc_lookups, pandas_table, light_table.table_type, loc_keys)
+loc_rate = len(loc_keys) / loc_time
+print(f"* pandas .loc  : {len(loc_keys):9} points in {loc_time:8.3f} s -> {loc_rate:12.0f} points/s")
+
+# Batch queries
+nearest_values, nearest_time = time_it(light_table.nearest, points)
+nearest_rate = num_points / nearest_time
+print(f"* nearest      : {num_points:9} points in {nearest_time:8.3f} s -> {nearest_rate:12.0f} points/s " +
+      f"(x {nearest_rate / loc_rate:.0f})")
+
+interp_values, interp_time = time_it(light_table.interpolate, points)
+interp_rate = num_points / interp_time
+print(f"* interpolate  : {num_points:9} points in {interp_time:8.3f} s -> {interp_rate:12.0f} points/s " +
+      f"(x {interp_rate / loc_rate:.0f})")
+
+# Checking the nearest node values against the .loc ones
+same_values = np.allclose(nearest_values[:len(loc_keys)], loc_values, equal_nan = True)
+print(f"\n* nearest values equal to .loc ones: {same_values}\n")
@@ -0,0 +1,92 @@
+import numpy      as np
+from   typing import List
+from   typing import Optional
+
+# Specific LightTable stuff
+from cache_functions   import ReductionCache
+from table_functions   import reduce_point_sets
+from table_functions   import get_sensor_ids
+from detectors         import get_detector_dimensions
+
+
+
+###
+def get_extra_photons(num_photons      : int,
+                      num_detected     : float,
+                      target_rel_error : float,
+                      max_photons      : int
+                     )                -> int :
+
+    # Photons to add to a point so the relative error of its table entry,
+    # 1 / sqrt(num_detected), gets down to target_rel_error. The detection
+    # probability (num_detected / num_photons) is estimated from the photons
+    # already simulated, and the total photons are limited to max_photons.
+    if num_detected > 0:
+        needed_photons = num_photons / (num_detected * target_rel_error**2)
+    else:
+        needed_photons = max_photons
+
+    return int(np.ceil(max(0., min(needed_photons, max_photons) - num_photons)))
+
+
+
+###
+def get_budget_sensor_ids(det_name    : str,
+                          table_type  : str,
+                          sensor_name : str,
+                          dst_sets    : List[List[str]]
+                         )           -> List[int] :
+
+    # Sensors whose charge sets the photon budgets: the reference sensor for
+    # tracking tables, and every sensor_name sensor for energy ones.
+    if table_type == "tracking":
+        return [get_detector_dimensions(det_name)["ref_sensor"][0]]
+
+    dst_fnames = [dst_fname for dst_set in dst_sets for dst_fname in dst_set]
+    if not dst_fnames:
+        return []
+
+    return get_sensor_ids(dst_fnames[0], sensor_name)
+
+
+
+###
+def get_entry_detected(sns_charges  : np.ndarray,
+                       charge_floor : float
+                      )            -> float :
+
+    # Photons detected by the table entry (sensor) with the largest relative
+    # error, 1 / sqrt(num_detected), among the sensors detecting at least
+    # charge_floor times the charge of the brightest one (the dimmer ones
+    # being left out, as their relative error can not be bounded)
+    max_charge = sns_charges.max(initial = 0.)
+    if max_charge <= 0:
+        return 0.
+    return sns_charges[sns_charges >= charge_floor * max_charge].min()
+
+
+
+###
+def get_photon_budgets(dst_sets         : List[List[str]],
+                       sensor_ids       : List[int],
+                       pilot_photons    : int,
+                       target_rel_error : float,
+                       max_photons      : int,
+                       charge_floor     : float                    = 0.01,
+                       num_workers      : int                      = 1,
+                       cache            : Optional[ReductionCache] = None
+                      )                -> List[int] :
+
+    # Photons to simulate for every point: the pilot photons for the points
+    # with no DST, and the extra photons needed to reach the target error
+    # in every table entry (sensor of sensor_ids) over the charge floor for the rest.
+    budgets = []
+    for point_data in reduce_point_sets(dst_sets, sensor_ids, num_workers, cache):
+        if point_data is None:
+            budgets.append(pilot_photons)
+        else:
+            num_photons, sns_charges = point_data
+            budgets.append(get_extra_photons(num_photons,
+                                             get_entry_detected(sns_charges, charge_floor),
+                                             target_rel_error, max_photons))
+    return budgets
@@ -0,0 +1,69 @@
+import os
+import pickle
+
+import numpy      as np
+from   typing import Dict
+from   typing import Tuple
+from   typing import Optional
+
+
+# Cache entries: dst_fname -> (dst_stamp, sensor_selection, num_photons, sns_charges)
+ReductionCache = Dict[str, Tuple[Tuple[int, int], Tuple[int, ...], int, np.ndarray]]
+
+
+
+###
+def get_dst_stamp(dst_fname : str
+                 )         -> Optional[Tuple[int, int]] :
+
+    # (size, mtime) of the DST, None if it does NOT EXIST
+    try:
+        dst_stat = os.stat(dst_fname)
+    except FileNotFoundError:
+        return None
+    return dst_stat.st_size, dst_stat.st_mtime_ns
+
+
+
+###
+def is_cached(cache     : ReductionCache,
+              dst_fname : str,
+              dst_stamp : Tuple[int, int],
+              selection : Tuple[int, ...]
+             )         -> bool :
+
+    # A DST re-simulated (different size or mtime) or read with a different
+    # sensor selection is not valid anymore.
+    if dst_fname not in cache: return False
+    cached_stamp, cached_selection, _, _ = cache[dst_fname]
+    return (cached_stamp == dst_stamp) and (cached_selection == selection)
+
+
+
+###
+def load_reduction_cache(cache_fname : str
+                        )           -> ReductionCache :
+
+    if not os.path.isfile(cache_fname):
+        return {}
+
+    try:
+        with open(cache_fname, 'rb') as cache_file:
+            return pickle.load(cache_file)
+    except Exception:
+        print(f"  WARNING: {cache_fname} corrupted. Rebuilding it ...")
+        return {}
+
+
+
+###
+def save_reduction_cache(cache_fname : str,
+                         cache       : ReductionCache
+                        )           -> None :
+
+    # Writing to a temporary file first, so an interrupted build never
+    # leaves a truncated cache behind.
+    tmp_fname = cache_fname + ".tmp"
+    with open(tmp_fname, 'wb') as cache_file:
+        pickle.dump(cache, cache_file, protocol = pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_fname, cache_fname)
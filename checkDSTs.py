@@ -0,0 +1,46 @@
+"""
+This SCRIPT checks the health of all the DSTs of a path, in parallel,
+moving the unhealthy ones into quarantine if requested.
+"""
+
+# General Importings
+import os
+import sys
+
+# Light Table stuff
+from health_functions import scan_dsts
+from health_functions import print_health_report
+from health_functions import quarantine_dsts
+from pack_functions   import is_pack_fname
+
+
+
+#################### SETTINGS ####################
+try:
+    dst_path = os.path.join(sys.argv[1], "")
+except IndexError:
+    print("\nUsage: python checkDSTs.py dst_path [num_workers] [--repair]\n")
+    sys.exit()
+
+args        = sys.argv[2:]
+repair      = "--repair" in args
+num_workers = int(([arg for arg in args if arg != "--repair"] + [1])[0])
+
+
+
+#################### CHECKING DSTS ####################
+
+print(f"\n*** Checking the DSTs of {dst_path} with {num_workers} workers ...")
+
+# (the packs are checked by the packer when written)
+dst_fnames = sorted(dst_path + dst_name for dst_name in os.listdir(dst_path)
+                    if dst_name.endswith(".h5") and not is_pack_fname(dst_name))
+dst_health = scan_dsts(dst_fnames, num_workers = num_workers)
+
+unhealthy_fnames = print_health_report(dst_health)
+
+if unhealthy_fnames and repair:
+    print(f"\n*** Moving {len(unhealthy_fnames)} unhealthy DSTs into quarantine ...")
+    quarantine_dsts(unhealthy_fnames)
+
+print()
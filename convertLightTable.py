@@ -0,0 +1,46 @@
+"""
+This SCRIPT converts Light Tables between the pandas and the dense formats.
+"""
+
+# General Importings
+import sys
+import pandas as pd
+
+# Light Table stuff
+from dense_functions  import is_dense_table
+from dense_functions  import read_dense_table
+from dense_functions  import write_dense_table
+
+
+
+#################### SETTINGS ####################
+try:
+    input_fname  = sys.argv[1]
+    output_fname = sys.argv[2]
+except IndexError:
+    print("\nUsage: python convertLightTable.py input_table.h5 output_table.h5\n")
+    sys.exit()
+
+
+
+#################### CONVERTING LIGHT TABLE ####################
+
+# Dense -> pandas
+if is_dense_table(input_fname):
+    print(f"\n*** Converting dense {input_fname} into pandas {output_fname} ...\n")
+
+    light_table, config_table = read_dense_table(input_fname)
+
+    light_table.to_hdf(output_fname, key = '/LightTable', mode   = 'w',
+                       format = 'table', data_columns = True)
+    config_table.to_hdf(output_fname, key = '/Config', mode   = 'a',
+                        format = 'table', data_columns = True)
+
+# pandas -> Dense
+else:
+    print(f"\n*** Converting pandas {input_fname} into dense {output_fname} ...\n")
+
+    light_table  = pd.read_hdf(input_fname, '/LightTable')
+    config_table = pd.read_hdf(input_fname, '/Config')
+
+    write_dense_table(output_fname, light_table, config_table)
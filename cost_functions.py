@@ -0,0 +1,246 @@
+import os
+import re
+import heapq
+import tarfile
+import numpy as np
+
+from   typing import Dict
+from   typing import List
+from   typing import Tuple
+
+# Specific LightTable stuff
+from general_functions import SLURM_TIME_LIMIT_MINUTES
+from sim_functions     import get_run_macro
+from vertex_functions  import get_macro_vertices
+
+
+# Photons simulated per second with no timed runs to fit the cost model with
+# (the 60.e4 photons / minute measured at Harvard)
+DEFAULT_PHOTONS_PER_SECOND = 1.e4
+
+# Seconds taken by every nexus run to start (geometry & physics initialization),
+# not included in the run summaries
+NEXUS_STARTUP_SECONDS = 60.
+
+# Number of positions compared at once when looking for the nearest timed one
+NEAREST_CHUNK_SIZE = 1000
+
+# A cost model is a Dict with:
+#   'positions'          : (n, 3) array with the positions timed in the logs
+#   'seconds_per_photon' : seconds per photon simulated at every one of them
+#   'default_seconds_per_photon' : median of them (default one with no timed runs)
+#   'num_runs'           : number of runs timed in the logs
+CostModel = Dict
+
+
+
+###
+def get_log_timings(log_content : str
+                   )           -> List[Tuple[int, float]] :
+
+    # (events, real seconds) of every run finished, from the Geant4 run summaries
+    num_evts   = re.findall(r"Number of events processed\s*:\s*(\d+)", log_content)
+    real_times = re.findall(r"Real=\s*([\d.eE+-]+)\s*s", log_content)
+    return [(int(evts), float(secs)) for evts, secs in zip(num_evts, real_times)]
+
+
+
+###
+def get_macro_timings(run_macro   : str,
+                      log_content : str
+                     )           -> List[Tuple[Tuple[float, float, float], int, float]] :
+
+    # (pos, photons, real seconds) of every vertex run by a nexus job,
+    # matching its run summaries with the vertices of its macros
+    num_photons = int(re.search(r"/Generator/ScintGenerator/nphotons\s+(\d+)",
+                                run_macro).group(1))
+    vertices    = get_macro_vertices(run_macro, 0)
+
+    return [(pos, num_evts * num_photons, seconds)
+            for (pos, _, _), (num_evts, seconds) in zip(vertices, get_log_timings(log_content))]
+
+
+
+###
+def get_run_timings(init_fname : str,
+                    log_fname  : str
+                   )          -> List[Tuple[Tuple[float, float, float], int, float]] :
+    return get_macro_timings(get_run_macro(init_fname),
+                             open(log_fname, errors = 'replace').read())
+
+
+
+###
+def get_tar_timings(tar_fname : str
+                   )         -> List[Tuple[Tuple[float, float, float], int, float]] :
+
+    # Timings of the runs packed into a tar (packed outputs), with the macros
+    # registered by every init macro and its log in the same tar
+    run_timings = []
+    with tarfile.open(tar_fname, 'r') as tar_file:
+        contents = {member.name: tar_file.extractfile(member).read().decode(errors = 'replace')
+                    for member in tar_file.getmembers() if member.isfile()}
+
+    for init_name, init_content in contents.items():
+        log_name = init_name.replace(".init", ".log")
+        if not (init_name.endswith(".init") and (log_name in contents)):
+            continue
+        macro_names = re.findall(r"/nexus/Register(?:Delayed)?Macro\s+(\S+)", init_content)
+        try:
+            run_macro = "".join(contents[os.path.basename(macro_name)] for macro_name in macro_names)
+            run_timings += get_macro_timings(run_macro, contents[log_name])
+        except (KeyError, AttributeError, ValueError):
+            continue
+
+    return run_timings
+
+
+
+###
+def fit_cost_model(config_path : str,
+                   log_path    : str
+                  )           -> CostModel :
+
+    # Seconds per photon of every position timed in the logs of this host
+    # (every log with the init macro of its run in config_path, and the ones
+    # packed into tars with their macros)
+    run_costs = {}
+    num_runs  = 0
+    for log_name in os.listdir(log_path):
+        try:
+            if log_name.endswith(".tar"):
+                run_timings = get_tar_timings(log_path + log_name)
+            else:
+                init_fname = config_path + log_name.replace(".log", ".init")
+                if not (log_name.endswith(".log") and os.path.isfile(init_fname)):
+                    continue
+                run_timings = get_run_timings(init_fname, log_path + log_name)
+        except (OSError, tarfile.TarError, AttributeError, ValueError):
+            continue
+
+        for pos, num_photons, seconds in run_timings:
+            if num_photons > 0:
+                pos_cost = run_costs.setdefault(pos, [0, 0.])
+                pos_cost[0] += num_photons
+                pos_cost[1] += seconds
+                num_runs    += 1
+
+    positions          = np.array(list(run_costs.keys()), dtype = float).reshape(-1, 3)
+    seconds_per_photon = np.array([seconds / photons for photons, seconds in run_costs.values()])
+
+    default_seconds_per_photon = 1. / DEFAULT_PHOTONS_PER_SECOND
+    if len(seconds_per_photon):
+        default_seconds_per_photon = float(np.median(seconds_per_photon))
+
+    return {'positions'                  : positions,
+            'seconds_per_photon'         : seconds_per_photon,
+            'default_seconds_per_photon' : default_seconds_per_photon,
+            'num_runs'                   : num_runs}
+
+
+
+###
+def get_point_seconds(cost_model  : CostModel,
+                      positions   : np.ndarray,
+                      num_photons : int
+                     )           -> np.ndarray :
+
+    # Predicted seconds to simulate num_photons at every position (structured
+    # array), with the seconds per photon of the nearest position timed
+    point_seconds = np.full(len(positions), cost_model['default_seconds_per_photon'] * num_photons)
+    if not len(cost_model['positions']):
+        return point_seconds
+
+    xyz = np.column_stack([positions['x'], positions['y'], positions['z']]).astype(float)
+    for first in range(0, len(xyz), NEAREST_CHUNK_SIZE):
+        chunk    = xyz[first : first + NEAREST_CHUNK_SIZE]
+        dists    = ((chunk[:, None, :] - cost_model['positions'][None, :, :])**2).sum(axis = 2)
+        nearest  = dists.argmin(axis = 1)
+        point_seconds[first : first + len(chunk)] = \
+            cost_model['seconds_per_photon'][nearest] * num_photons
+
+    return point_seconds
+
+
+
+###
+def get_job_seconds(point_seconds : np.ndarray,
+                    jobs          : List[List[int]],
+                    multi_vertex  : bool = False
+                   )             -> np.ndarray :
+
+    # Predicted wall time of every job: its points plus the start-up of every
+    # nexus run (a single one for multi-vertex jobs)
+    return np.array([point_seconds[job].sum() +
+                     NEXUS_STARTUP_SECONDS * (1 if multi_vertex else len(job))
+                     for job in jobs])
+
+
+
+###
+def pack_jobs(point_seconds  : np.ndarray,
+              target_seconds : float,
+              multi_vertex   : bool = False
+             )              -> List[List[int]] :
+
+    # Packing the points into jobs of up to target_seconds predicted wall time.
+    # Points sorted by decreasing cost, every one into the job with the most
+    # time left (a new one if it fits in none), so the jobs are balanced.
+    # Points over target_seconds get a job of their own.
+    point_startup = 0. if multi_vertex else NEXUS_STARTUP_SECONDS
+    job_capacity  = target_seconds - (NEXUS_STARTUP_SECONDS if multi_vertex else 0.)
+
+    jobs      = []
+    time_left = []     # heap of (- seconds left, job index)
+    for point_idx in np.argsort(-point_seconds, kind = 'stable'):
+        point_cost = point_seconds[point_idx] + point_startup
+        if time_left and (-time_left[0][0] >= point_cost):
+            minus_left, job_idx = heapq.heappop(time_left)
+            jobs[job_idx].append(int(point_idx))
+            heapq.heappush(time_left, (minus_left + point_cost, job_idx))
+        else:
+            jobs.append([int(point_idx)])
+            heapq.heappush(time_left, (point_cost - job_capacity, len(jobs) - 1))
+
+    # Jobs with their points in the plan order
+    return sorted([sorted(job) for job in jobs])
+
+
+
+###
+def get_makespan(job_seconds : np.ndarray,
+                 num_slots   : int
+                )           -> float :
+
+    # Predicted wall time of running the jobs on num_slots slots, every job
+    # (longest first) started on the first slot free
+    slots_end = [0.] * max(1, num_slots)
+    for seconds in sorted(job_seconds, reverse = True):
+        heapq.heapreplace(slots_end, slots_end[0] + seconds)
+    return max(slots_end)
+
+
+
+###
+def print_cost_report(label       : str,
+                      job_seconds : np.ndarray,
+                      num_slots   : int,
+                      cost_model  : CostModel
+                     )           -> None :
+
+    print(f"\n*** Predicted cost of {len(job_seconds)} {label} " +
+          f"(cost model from {cost_model['num_runs']} timed runs) ...\n")
+    if not len(job_seconds):
+        return
+
+    job_minutes = job_seconds / 60.
+    print(f"* Minutes/Job: {job_minutes.mean():10.1f} (mean) - " +
+          f"{job_minutes.min():.1f} (min) - {job_minutes.max():.1f} (max)")
+    print(f"* CPU hours:   {job_seconds.sum() / 3600.:10.1f}")
+    print(f"* Makespan:    {get_makespan(job_seconds, num_slots) / 3600.:10.1f} hours " +
+          f"with {num_slots} jobs running at once")
+
+    num_long_jobs = (job_minutes > SLURM_TIME_LIMIT_MINUTES).sum()
+    if num_long_jobs:
+        print(f"  WARNING: {num_long_jobs} jobs over the {SLURM_TIME_LIMIT_MINUTES} minutes " +
+              "Slurm runtime limit")
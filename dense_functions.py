@@ -0,0 +1,165 @@
+import numpy      as np
+import pandas     as pd
+import tables     as tb
+from   typing import Dict
+from   typing import List
+from   typing import Tuple
+
+# Specific LightTable stuff
+from table_functions   import get_table_fname
+
+
+# Dense light tables: a single chunked, compressed N-D array (grid axes x columns)
+#   /LightTable/data    : data array, NaN for the grid points with no data
+#   /LightTable/<axis>  : coordinates of every grid axis (x, y, z or dist_xy)
+#   /LightTable/columns : column names (sensors for energy tables, z for tracking ones)
+# with the /Config parameters as attributes of /LightTable.
+DENSE_TABLE_GROUP   = "LightTable"
+DENSE_TABLE_FILTERS = tb.Filters(complevel = 4, complib = "zlib", shuffle = True)
+
+# Approx. size (bytes) of every data chunk, and max. number of columns per chunk
+DENSE_CHUNK_BYTES   = 1000000
+DENSE_CHUNK_COLUMNS = 256
+
+
+
+###
+def get_dense_table_fname(det_name    : str,
+                          table_type  : str,
+                          signal_type : str,
+                          sensor_name : str
+                         )           -> str :
+    return get_table_fname(det_name, table_type, signal_type, sensor_name).replace(".h5", ".dense.h5")
+
+
+
+###
+def is_dense_table(table_fname : str
+                  )           -> bool :
+    with tb.open_file(table_fname, 'r') as h5file:
+        return f"/{DENSE_TABLE_GROUP}/data" in h5file
+
+
+
+###
+def get_dense_chunkshape(shape : Tuple[int, ...]
+                        )     -> Tuple[int, ...] :
+
+    # All the grid axes with the same chunk length, so slices along any of
+    # them read a similar number of chunks.
+    chunk_columns = min(shape[-1], DENSE_CHUNK_COLUMNS)
+    num_axes      = len(shape) - 1
+    axis_chunk    = max(1, int((DENSE_CHUNK_BYTES / (8 * chunk_columns)) ** (1. / num_axes)))
+
+    return tuple(min(axis_len, axis_chunk) for axis_len in shape[:-1]) + (chunk_columns,)
+
+
+
+###
+def write_dense_table(table_fname  : str,
+                      light_table  : pd.DataFrame,
+                      config_table : pd.DataFrame
+                     )            -> None :
+
+    # Grid axes from the table index levels
+    index      = light_table.index
+    axis_names = list(index.names)
+    axes       = [np.unique(index.get_level_values(name)) for name in axis_names]
+    axis_idx   = [np.searchsorted(axis, index.get_level_values(name))
+                  for name, axis in zip(axis_names, axes)]
+
+    shape      = tuple(len(axis) for axis in axes) + (light_table.shape[1],)
+    table_data = light_table.values
+
+    with tb.open_file(table_fname, 'w') as h5file:
+        group = h5file.create_group('/', DENSE_TABLE_GROUP)
+
+        for name, axis in zip(axis_names, axes):
+            h5file.create_array(group, name, axis)
+        h5file.create_array(group, 'columns', np.array(light_table.columns, dtype = 'S'))
+
+        data = h5file.create_carray(group, 'data', tb.Float64Atom(dflt = np.nan), shape,
+                                    filters = DENSE_TABLE_FILTERS,
+                                    chunkshape = get_dense_chunkshape(shape))
+        data.attrs.axes = axis_names + ['columns']
+
+        # Written one slab (first axis value) at a time, so the dense array
+        # is never fully in memory.
+        slab_rows = np.argsort(axis_idx[0], kind = 'stable')
+        slab_ends = np.searchsorted(axis_idx[0][slab_rows], np.arange(len(axes[0])), side = 'right')
+        slab_init = 0
+        for slab_idx, slab_end in enumerate(slab_ends):
+            rows = slab_rows[slab_init:slab_end]
+            slab = np.full(shape[1:], np.nan)
+            slab[tuple(idx[rows] for idx in axis_idx[1:])] = table_data[rows]
+            data[slab_idx] = slab
+            slab_init = slab_end
+
+        for parameter, value in config_table['value'].items():
+            group._v_attrs[parameter] = value
+
+
+
+###
+def read_dense_axes(table_fname : str
+                   )           -> Tuple[Dict[str, np.ndarray], List[str]] :
+
+    # Coordinates of every grid axis and column names, to locate slices
+    with tb.open_file(table_fname, 'r') as h5file:
+        group = h5file.get_node('/', DENSE_TABLE_GROUP)
+        axis_names = group.data.attrs.axes[:-1]
+        axes       = {name: h5file.get_node(group, name).read() for name in axis_names}
+        columns    = [column.decode() for column in group.columns.read()]
+    return axes, columns
+
+
+
+###
+def read_dense_slice(table_fname : str,
+                     ranges      : Dict[str, Tuple[float, float]]
+                    )           -> np.ndarray :
+
+    # Data of the grid points with coordinates within the [min, max] ranges
+    # given for some axes (whole axis for the rest). Only the chunks needed
+    # are read.
+    axes, _ = read_dense_axes(table_fname)
+    slices  = []
+    for name, axis in axes.items():
+        axis_min, axis_max = ranges.get(name, (axis[0], axis[-1]))
+        slices.append(slice(np.searchsorted(axis, axis_min, side = 'left'),
+                            np.searchsorted(axis, axis_max, side = 'right')))
+
+    with tb.open_file(table_fname, 'r') as h5file:
+        return h5file.get_node('/', DENSE_TABLE_GROUP).data[tuple(slices)]
+
+
+
+###
+def read_dense_table(table_fname : str
+                    )           -> Tuple[pd.DataFrame, pd.DataFrame] :
+
+    # Dense table converted to the pandas layout: (LightTable, Config)
+    axes, columns = read_dense_axes(table_fname)
+
+    with tb.open_file(table_fname, 'r') as h5file:
+        group = h5file.get_node('/', DENSE_TABLE_GROUP)
+        data  = group.data.read()
+        config_data = [[parameter, str(group._v_attrs[parameter])]
+                       for parameter in group._v_attrs._f_list('user')]
+
+    # Keeping only the grid points with data
+    table_data = data.reshape(-1, data.shape[-1])
+    with_data  = ~np.isnan(table_data).all(axis = 1)
+
+    axis_names = list(axes)
+    if len(axis_names) > 1:
+        index = pd.MultiIndex.from_product([axes[name] for name in axis_names], names = axis_names)
+    else:
+        index = pd.Index(axes[axis_names[0]], name = axis_names[0])
+
+    light_table = pd.DataFrame(table_data[with_data], index = index[with_data], columns = columns)
+
+    config_table = pd.DataFrame(config_data, columns = ['parameter', 'value'])
+    config_table.set_index("parameter", inplace = True)
+
+    return light_table, config_table
@@ -14,7 +14,8 @@ def get_detector_dimensions(det_name : str
             'ACTIVE_length' : 532.0 * units.mm,
             'BUFFER_length' : 129.9 * units.mm,
             'EL_gap'        :   6.0 * units.mm,
-            'ref_sensor'    : (17018, (25.0, 25.0))   # Reference sensor (id, (x,y))
+            'ref_sensor'    : (17018, (25.0, 25.0)),  # Reference sensor (id, (x,y))
+            'symmetry'      : None                    # Sensor plane symmetry (None, 'quadrant', 'octant')
         },
 
         'DEMOpp-Run5': {
@@ -22,7 +23,8 @@ def get_detector_dimensions(det_name : str
             'ACTIVE_length' :  309.55 * units.mm,
             'BUFFER_length' :  117.85 * units.mm,
             'EL_gap'        :    9.8  * units.mm,
-            'ref_sensor'    : (14000, (-5.0, 5.0))   # Reference sensor (id, (x,y))
+            'ref_sensor'    : (14000, (-5.0, 5.0)),  # Reference sensor (id, (x,y))
+            'symmetry'      : None                   # Sensor plane symmetry (None, 'quadrant', 'octant')
         },
 
         'DEMOpp-Run7': {
@@ -30,7 +32,8 @@ def get_detector_dimensions(det_name : str
             'ACTIVE_length' :  309.55 * units.mm,
             'BUFFER_length' :  117.85 * units.mm,
             'EL_gap'        :    5.0  * units.mm,
-            'ref_sensor'    : (14000, (-5.0, 5.0))   # Reference sensor (id, (x,y))
+            'ref_sensor'    : (14000, (-5.0, 5.0)),  # Reference sensor (id, (x,y))
+            'symmetry'      : None                   # Sensor plane symmetry (None, 'quadrant', 'octant')
         },
 
         'DEMOpp-Run8': {
@@ -38,7 +41,8 @@ def get_detector_dimensions(det_name : str
             'ACTIVE_length' :  309.55 * units.mm,
             'BUFFER_length' :  117.85 * units.mm,
             'EL_gap'        :    5.0  * units.mm,
-            'ref_sensor'    : (14000, (-5.0, 5.0))   # Reference sensor (id, (x,y))
+            'ref_sensor'    : (14000, (-5.0, 5.0)),  # Reference sensor (id, (x,y))
+            'symmetry'      : None                   # Sensor plane symmetry (None, 'quadrant', 'octant')
         },
 
         'NEXT100': {
@@ -46,7 +50,8 @@ def get_detector_dimensions(det_name : str
             'ACTIVE_length' : 1204.95 * units.mm,
             'BUFFER_length' :  254.6  * units.mm,
             'EL_gap'        :   10.0  * units.mm,
-            'ref_sensor'    : (33000, (7.83, 7.83))   # Reference sensor (id, (x,y))
+            'ref_sensor'    : (33000, (7.83, 7.83)),  # Reference sensor (id, (x,y))
+            'symmetry'      : None                    # Sensor plane symmetry (None, 'quadrant', 'octant')
         },
 
         'FLEX100': {
@@ -54,7 +59,8 @@ def get_detector_dimensions(det_name : str
             'ACTIVE_length' : 1204.95 * units.mm,
             'BUFFER_length' :  254.6  * units.mm,
             'EL_gap'        :   10.0  * units.mm,
-            'ref_sensor'    : (2546, (0.0, 0.0))   # Reference sensor (id, (x,y))
+            'ref_sensor'    : (2546, (0.0, 0.0)),  # Reference sensor (id, (x,y))
+            'symmetry'      : None                 # Sensor plane symmetry (None, 'quadrant', 'octant')
         },
 
         'FLEX100_M10': {
@@ -62,7 +68,8 @@ def get_detector_dimensions(det_name : str
             'ACTIVE_length' : 1204.95 * units.mm,
             'BUFFER_length' :  254.6  * units.mm,
             'EL_gap'        :   10.0  * units.mm,
-            'ref_sensor'    : (2546, (0.0, 0.0))   # Reference sensor (id, (x,y))
+            'ref_sensor'    : (2546, (0.0, 0.0)),  # Reference sensor (id, (x,y))
+            'symmetry'      : None                 # Sensor plane symmetry (None, 'quadrant', 'octant')
         },
 
         'FLEX100_M12': {
@@ -70,7 +77,8 @@ def get_detector_dimensions(det_name : str
             'ACTIVE_length' : 1204.95 * units.mm,
             'BUFFER_length' :  254.6  * units.mm,
             'EL_gap'        :   10.0  * units.mm,
-            'ref_sensor'    : (2546, (0.0, 0.0))   # Reference sensor (id, (x,y))
+            'ref_sensor'    : (2546, (0.0, 0.0)),  # Reference sensor (id, (x,y))
+            'symmetry'      : None                 # Sensor plane symmetry (None, 'quadrant', 'octant')
         },
 
         'FLEX100_M6_O6': {
@@ -78,7 +86,8 @@ def get_detector_dimensions(det_name : str
             'ACTIVE_length' : 1204.95 * units.mm,
             'BUFFER_length' :  254.6  * units.mm,
             'EL_gap'        :   10.0  * units.mm,
-            'ref_sensor'    : (2546, (0.0, 0.0))   # Reference sensor (id, (x,y))
+            'ref_sensor'    : (2546, (0.0, 0.0)),  # Reference sensor (id, (x,y))
+            'symmetry'      : None                 # Sensor plane symmetry (None, 'quadrant', 'octant')
         },
 
         'FLEX100_7_3': {
@@ -86,7 +95,8 @@ def get_detector_dimensions(det_name : str
             'ACTIVE_length' : 1204.95 * units.mm,
             'BUFFER_length' :  254.6  * units.mm,
             'EL_gap'        :    7.0  * units.mm,
-            'ref_sensor'    : (2546, (0.0, 0.0))   # Reference sensor (id, (x,y))
+            'ref_sensor'    : (2546, (0.0, 0.0)),  # Reference sensor (id, (x,y))
+            'symmetry'      : None                 # Sensor plane symmetry (None, 'quadrant', 'octant')
         },
 
         'FLEX100_DENS': {
@@ -94,7 +104,8 @@ def get_detector_dimensions(det_name : str
             'ACTIVE_length' : 1204.95 * units.mm,
             'BUFFER_length' :  254.6  * units.mm,
             'EL_gap'        :   10.0  * units.mm,
-            'ref_sensor'    : (16060, (2.5, 2.5))   # Reference sensor (id, (x,y))
+            'ref_sensor'    : (16060, (2.5, 2.5)),  # Reference sensor (id, (x,y))
+            'symmetry'      : None                  # Sensor plane symmetry (None, 'quadrant', 'octant')
         },
 
         'FLEX_NEW': {
@@ -102,7 +113,8 @@ def get_detector_dimensions(det_name : str
             'ACTIVE_length' :  532.0  * units.mm,
             'BUFFER_length' :  129.9  * units.mm,
             'EL_gap'        :    6.0  * units.mm,
-            'ref_sensor'    : (1656, (0.0, 0.0))   # Reference sensor (id, (x,y))
+            'ref_sensor'    : (1656, (0.0, 0.0)),  # Reference sensor (id, (x,y))
+            'symmetry'      : None                 # Sensor plane symmetry (None, 'quadrant', 'octant')
         },
 
         'TEST': {                                   # == FLEX100
@@ -110,7 +122,8 @@ def get_detector_dimensions(det_name : str
             'ACTIVE_length' : 1204.95 * units.mm,
             'BUFFER_length' :  254.6  * units.mm,
             'EL_gap'        :   10.0  * units.mm,
-            'ref_sensor'    : (2546, (0.0, 0.0))   # Reference sensor (id, (x,y))
+            'ref_sensor'    : (2546, (0.0, 0.0)),  # Reference sensor (id, (x,y))
+            'symmetry'      : None                 # Sensor plane symmetry (None, 'quadrant', 'octant')
         }
     }
     
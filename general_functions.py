@@ -1,12 +1,21 @@
 import os
+import zlib
+
+
+# nexus executable PATH of every host
+NEXUS_PATHS = {'local'    : "/Users/Javi/Development/nexus/bin/",
+               'majorana' : "/home/jmunoz/Development/nexus/bin/",
+               'harvard'  : "/n/holystore01/LABS/guenette_lab/Users/jmunozv/Development/nexus/bin/"}
+
+# Runtime limit of the Slurm jobs, in minutes
+SLURM_TIME_LIMIT_MINUTES = 2200
 
-from datetime import datetime
 
 
 ###
-def get_seed() -> int :
-    dt = datetime.now()
-    return dt.microsecond
+def get_seed(seed_key : str) -> int :
+    # Reproducible seed, different for every key (i.e. every DST name)
+    return zlib.crc32(seed_key.encode()) & 0x7fffffff
 
 
 
@@ -3,9 +3,10 @@ This SCRIPT generates Light Tables for a given geometry.
 """
 
 # General Importings
-import os
 import sys
 import json
+import time
+import numpy  as np
 import pandas as pd
 
 from math import ceil
@@ -16,18 +17,75 @@ import invisible_cities.core.system_of_units  as units
 # Light Table stuff
 from sim_functions    import make_init_file
 from sim_functions    import make_config_file
-from sim_functions    import run_sims
-from sim_functions    import get_num_photons
+from sim_functions    import make_vertices_file
+from sim_functions    import get_previous_photons
+from sim_functions    import run_sims_array
 
-from pos_functions    import get_table_positions
+from cost_functions   import NEXUS_STARTUP_SECONDS
+from cost_functions   import fit_cost_model
+from cost_functions   import get_point_seconds
+from cost_functions   import get_job_seconds
+from cost_functions   import print_cost_report
+
+from general_functions import SLURM_TIME_LIMIT_MINUTES
+
+from backend_functions import get_sim_backend
+from backend_functions import run_sims
+from backend_functions import wait_sims
+from backend_functions import get_max_running_jobs
+from backend_functions import FAKE_NEXUS_PATH
+
+from pos_functions    import get_position_tuples
+
+from plan_functions   import get_working_paths
+from plan_functions   import get_campaign_plan
+from plan_functions   import get_plan_fnames
+from plan_functions   import get_job_fnames
+
+from plan_functions   import get_point_dst_sets
+from plan_functions   import get_point_jobs
+
+from budget_functions import get_photon_budgets
+from budget_functions import get_budget_sensor_ids
+
+from index_functions  import get_index_fname
+from index_functions  import load_completion_index
+
+from pack_functions   import get_pack_index_fname
+from pack_functions   import get_pack_base_fname
+from pack_functions   import load_pack_index
+
+from health_functions import get_health_fname
+from health_functions import check_plan_dsts
+
+from cache_functions  import load_reduction_cache
+from cache_functions  import save_reduction_cache
 
-from table_functions  import get_working_paths
 from table_functions  import build_table
-from table_functions  import get_fnames
 from table_functions  import get_table_fname
+from table_functions  import get_cache_fname
+from table_functions  import stream_energy_table
+from table_functions  import TABLE_STREAM_ROWS
+
+from refine_functions import get_refined_positions
+
+from symmetry_functions import check_plane_symmetry
+
+from dense_functions  import get_dense_table_fname
+from dense_functions  import write_dense_table
 
 from detectors        import get_detector_dimensions
 
+from metrics_functions import ProgressReporter
+from metrics_functions import count
+from metrics_functions import timer
+from metrics_functions import get_metrics
+from metrics_functions import set_progress_interval
+from metrics_functions import start_profiling
+from metrics_functions import stop_profiling
+from metrics_functions import get_metrics_fname
+from metrics_functions import write_metrics_report
+
 
 
 #################### GENERALITIES ####################
@@ -45,6 +103,7 @@ VALID_DETECTORS    = ["NEXT_NEW", "DEMOpp-Run5", "DEMOpp-Run7", "DEMOpp-Run8",
                       "FLEX_NEW", "TEST"]
 VALID_TABLE_TYPES  = ["energy", "tracking"]
 VALID_SIGNAL_TYPES = ["S1", "S2"]
+VALID_TABLE_FORMATS = ["pandas", "dense"]
 
 
 
@@ -58,6 +117,10 @@ except IndexError:
 with open(config_fname) as config_file:
     config_data = json.load(config_file)
 
+# Settings of this run, for the metrics report
+run_settings = dict(config_data)
+run_start    = time.perf_counter()
+
 # Step Selection
 RUN_SIMULATIONS = config_data["RUN_SIMULATIONS"]
 GENERATE_TABLE  = config_data["GENERATE_TABLE"]
@@ -80,11 +143,119 @@ if((table_type == "tracking") and (pitch[2] > 2.0 * units.mm)):
 
 tracking_maxDist  = config_data["tracking_maxDist"]
 
+# Tracking tables from the charge of all the sensors (binned by their distance to
+# the source) instead of only the reference one. The sources can then be simulated
+# up to a shorter tracking_source_maxDist from the reference sensor.
+tracking_aggregate      = config_data.get("tracking_aggregate", False)
+tracking_source_maxDist = config_data.get("tracking_source_maxDist", tracking_maxDist)
+if not tracking_aggregate:
+    tracking_source_maxDist = tracking_maxDist
+
 photons_per_point = config_data["photons_per_point"]
 
 # 
 points_per_job = config_data["points_per_job"]
 
+# Packing the points into jobs of job_target_minutes, as predicted by the cost
+# model fitted from the nexus logs of this host, instead of points_per_job per job
+job_target_minutes = config_data.get("job_target_minutes", None)
+
+# Reporting the predicted cost of the jobs to be run (and the makespan with
+# job_slots of them running at once), without running or building anything
+dry_run   = config_data.get("dry_run",   False)
+job_slots = config_data.get("job_slots", None)
+
+# The cost model is fitted (reading all the logs) only when the campaign plan
+# is re-made. refit_cost_model fits it again (re-making the plan).
+refit_cost_model = config_data.get("refit_cost_model", False)
+
+# Adaptive photon budgets: a pilot run of pilot_photons_per_point photons per point,
+# followed by runs adding photons to the points with any table entry (sensor) with a
+# relative error over target_rel_error (photons_per_point is then the max. per point).
+# Only the sensors detecting at least budget_charge_floor times the charge of the
+# brightest one of every point are taken into account.
+pilot_photons_per_point = config_data.get("pilot_photons_per_point", None)
+target_rel_error        = config_data.get("target_rel_error", 0.01)
+budget_charge_floor     = config_data.get("budget_charge_floor", 0.01)
+adaptive_photons        = pilot_photons_per_point is not None
+
+# Submitting all the jobs as Slurm job arrays, and max. number of them running at once
+slurm_array             = config_data.get("slurm_array", False)
+slurm_array_max_running = config_data.get("slurm_array_max_running", 400)
+
+# Splitting the events of every point into shards_per_point jobs, each one
+# writing its own DST (the table builders sum them)
+shards_per_point = config_data.get("shards_per_point", 1)
+
+# Simulating all the points of every job in a single nexus run (per shard),
+# every point with its own range of event ids, instead of one run per point
+multi_vertex_jobs = config_data.get("multi_vertex_jobs", False)
+
+# Packing the outputs of every job into a single HDF5 pack (a group per point)
+# and a single tar (macros & logs), instead of several files per point
+packed_outputs = config_data.get("packed_outputs", False)
+
+# Reducing every DST on the node right after its simulation, keeping just the
+# charge of the reduce_sensor_names sensors per event, and the raw DSTs
+# (in <dst_path>/raw/) if keep_raw_dsts
+reduce_dsts         = config_data.get("reduce_dsts", False)
+reduce_sensor_names = config_data.get("reduce_sensor_names", [sensor_name])
+keep_raw_dsts       = config_data.get("keep_raw_dsts", True)
+reduce_sensors      = reduce_sensor_names if reduce_dsts else None
+
+# Adaptive grid refinement of energy tables: a coarse grid (of pitch * 2^grid_refine_levels)
+# whose cells are split (down to pitch) while the response of any sensor changes
+# over their corners more than grid_refine_tolerance (relative to its max. response),
+# one level (at least) every run, from the points simulated by the previous runs
+grid_refine_levels    = config_data.get("grid_refine_levels", 0)
+grid_refine_tolerance = config_data.get("grid_refine_tolerance", 0.05)
+
+# Simulating only the fundamental domain of energy tables, folded with the
+# sensor plane symmetry of the detector (as declared in detectors.py)
+symmetry_folding = config_data.get("symmetry_folding", False)
+
+# Max. number of nexus jobs running at once when running locally
+local_max_jobs = config_data.get("local_max_jobs", 1)
+
+# Simulation backend (the one of this host by default) and its nexus PATH.
+# The fake_nexus backend writes synthetic DSTs, taking fake_latency seconds per
+# point and failing (crashing while writing the DST) with fake_failure_rate
+# (fake_corrupt_rate) probability.
+sim_backend_name = config_data.get("sim_backend", None)
+nexus_path       = config_data.get("nexus_path",  None)
+fake_config      = {'latency'      : config_data.get("fake_latency",      0.),
+                    'failure_rate' : config_data.get("fake_failure_rate", 0.),
+                    'corrupt_rate' : config_data.get("fake_corrupt_rate", 0.),
+                    'seed'         : config_data.get("fake_seed",         None)}
+
+# Number of processes reading the DSTs when building the table
+num_workers = config_data.get("num_workers", 1)
+
+# Light table file format: "pandas" (pandas table) or "dense" (chunked N-D array)
+table_format = config_data.get("table_format", "pandas")
+assert table_format in VALID_TABLE_FORMATS, "Wrong Table Format"
+
+# Writing energy tables in chunks of stream_chunk_rows rows while they are built,
+# so the memory needed does not grow with the table size
+stream_table      = config_data.get("stream_table", False)
+stream_chunk_rows = config_data.get("stream_chunk_rows", TABLE_STREAM_ROWS)
+
+# Checking the health of the DSTs of the plan before running & building, moving
+# the unhealthy ones (corrupted, short, ...) into quarantine to simulate them again
+dst_health_scan = config_data.get("dst_health_scan", False)
+
+# Re-using the reduced data of the DSTs not changed since the last build
+use_reduction_cache = config_data.get("reduction_cache", True)
+
+# Instrumentation: JSON report with the time spent & counters of every phase,
+# cProfile of the whole run, and min. seconds between progress reports
+metrics_report    = config_data.get("metrics_report", True)
+profile_run       = config_data.get("profile", False)
+progress_interval = config_data.get("progress_interval", 5.)
+set_progress_interval(progress_interval)
+
+profiler = start_profiling() if profile_run else None
+
 
 
 #################### PRELIMINARY JOB ####################
@@ -98,19 +269,122 @@ if photons_per_event > MAX_PHOTONS_PER_EVT:
     photons_per_event = MAX_PHOTONS_PER_EVT
     photons_per_point = events_per_point * photons_per_event
 
+### Getting (events / shard) & (photons / shard)
+# Shards split the events of every point (not its photons), so there are
+# events_per_point shards at most. Adaptive photon budgets run every top-up
+# as a single job.
+max_shards = 1 if adaptive_photons else events_per_point
+if shards_per_point > max_shards:
+    print(f"  WARNING: shards_per_point reduced from {shards_per_point} to {max_shards} " +
+          ("(adaptive photon budgets)" if adaptive_photons else
+           f"({events_per_point} events of {photons_per_event:.1e} photons per point)"))
+shards_per_point = max(1, min(shards_per_point, max_shards))
+
+events_per_shard  = ceil(events_per_point / shards_per_point)
+photons_per_shard = events_per_shard * photons_per_event
+photons_per_point = shards_per_point * photons_per_shard
+events_per_point  = shards_per_point * events_per_shard
+
+shard_tags = [None]
+if shards_per_point > 1:
+    shard_tags = [f"shard{shard}" for shard in range(shards_per_point)]
+
     
-### Getting Table positions
-table_positions = get_table_positions(det_name, table_type, signal_type, pitch, tracking_maxDist)
-num_points = len(table_positions)
+### Getting the sensor plane symmetry to fold the table with
+symmetry = None
+if symmetry_folding:
+    assert table_type == "energy", "Symmetry folding only valid for energy tables"
+    symmetry = get_detector_dimensions(det_name)["symmetry"]
+    assert symmetry is not None, f"No sensor plane symmetry for {det_name}"
+
+if stream_table:
+    assert table_type   == "energy", "Only energy tables can be streamed"
+    assert table_format == "pandas", "Only pandas tables can be streamed"
+    assert symmetry is None,         "Folded tables can not be streamed"
+
+if multi_vertex_jobs:
+    assert not adaptive_photons, "Multi-vertex jobs not valid with adaptive photon budgets"
+    assert not packed_outputs,   "Multi-vertex jobs not valid with packed outputs"
+
+if grid_refine_levels:
+    assert table_type == "energy", "Grid refinement only valid for energy tables"
+    assert symmetry is None,       "Refined grids can not be folded"
+    assert not multi_vertex_jobs,  "Multi-vertex jobs not valid with grid refinement"
+
+if slurm_array:
+    assert sim_backend_name in [None, "local", "harvard", "fake_nexus"], \
+        "Slurm job arrays only valid with the local, harvard and fake_nexus backends"
+
+
+### Cost model of the simulations, fitted from the logs of this host only
+### when the plan is re-made (or refit_cost_model), and stored with the plan
+config_path, log_path, _, _ = get_working_paths(det_name)
+fit_host_cost_model = lambda: fit_cost_model(config_path, log_path)
+
+cost_model = None
+if refit_cost_model:
+    with timer("cost_model"):
+        cost_model = fit_host_cost_model()
+
+
+### Getting the reduction cache file name
+cache_fname = None
+if use_reduction_cache:
+    _, _, _, table_path = get_working_paths(det_name)
+    cache_fname = table_path + get_cache_fname(det_name, table_type,
+                                               signal_type, sensor_name)
+
+
+### Refining the grid of the table, from the points already simulated
+refined_positions = None
+if grid_refine_levels:
+    with timer("grid_refinement"):
+        cache = load_reduction_cache(cache_fname) if cache_fname else None
+        refined_positions = get_refined_positions(det_name, signal_type, sensor_name, pitch,
+                                                  grid_refine_levels, grid_refine_tolerance,
+                                                  num_workers, cache)
+        if cache_fname: save_reduction_cache(cache_fname, cache)
+
+
+### Getting the Campaign Plan: Table positions, PATHS, file names & jobs
+with timer("campaign_plan"):
+    plan = get_campaign_plan(det_name, table_type, signal_type, pitch,
+                             tracking_source_maxDist, points_per_job, symmetry,
+                             events_per_shard if multi_vertex_jobs else None,
+                             job_target_minutes, photons_per_shard, cost_model,
+                             refined_positions, fit_host_cost_model)
+
+# Dry runs with no jobs packed by a cost model fit one just for the report
+cost_model = plan.get('cost_model') or cost_model
+if dry_run and (cost_model is None):
+    with timer("cost_model"):
+        cost_model = fit_host_cost_model()
+
+table_positions = plan['positions']
+num_points      = len(table_positions)
 
 
 ### Getting Num of jobs
-num_jobs = ceil(num_points / points_per_job)
-photons_per_job = points_per_job * photons_per_point
+num_jobs = len(plan['jobs'])
+photons_per_job = max(len(job) for job in plan['jobs']) * photons_per_shard
+
+
+### Predicted wall time of every point & job (every shard of them)
+job_seconds = None
+if cost_model is not None:
+    point_seconds = get_point_seconds(cost_model, table_positions, photons_per_shard)
+    job_seconds   = get_job_seconds(point_seconds, plan['jobs'], multi_vertex_jobs)
+
+if job_slots is None:
+    job_slots = slurm_array_max_running if slurm_array else \
+                get_max_running_jobs(sim_backend_name, local_max_jobs)
 
 
 ### Getting PATHS
-config_path, log_path, dst_path, table_path = get_working_paths(det_name)
+config_path = plan['config_path']
+log_path    = plan['log_path']
+dst_path    = plan['dst_path']
+table_path  = plan['table_path']
 
 
 ### Verbosity
@@ -119,12 +393,31 @@ if VERBOSITY:
     print(f"*** Type: {table_type}  -  Signal: {signal_type}  -  Sensor: {sensor_name}")
     print(f"*** Pitch: {pitch} mm")
     print(f"*** MaxDist of tracking tables: {tracking_maxDist} mm")    
+    if tracking_aggregate and (table_type == "tracking"):
+        print(f"***    Aggregating all the {sensor_name} sensors - " +
+              f"Sources up to {tracking_source_maxDist} mm")
     print(f"*** Photons/Point = {photons_per_point:.1e} splitted into ...")
     print(f"***    {events_per_point} Events/Point * {photons_per_event:.1e} Photons/Event")
+    if shards_per_point > 1:
+        print(f"***    {shards_per_point} Shards/Point * {events_per_shard} Events/Shard")
+    if adaptive_photons:
+        print(f"*** Adaptive photons: {pilot_photons_per_point:.1e} pilot Photons/Point " +
+              f"up to a relative error of {target_rel_error}")
     print(f"*** Total number of points: {num_points:6}")
+    if symmetry is not None:
+        print(f"***    Folded with {symmetry} symmetry from {len(plan['table_positions'])} table points")
+    if grid_refine_levels:
+        print(f"***    Refined grid: {grid_refine_levels} levels, tolerance {grid_refine_tolerance}")
     #print(table_positions)
     print(f"*** Max. number of jobs:    {num_jobs:6}")
-    print(f"*** Photons/Job: {photons_per_job}  ->  {photons_per_job/60.e4:.3} minutes/job (@ Harvard)")
+    if multi_vertex_jobs:
+        print(f"***    Multi-vertex jobs: every job simulates all its points in one nexus run")
+    print(f"*** Table building workers: {num_workers}")
+    if job_seconds is not None:
+        print(f"*** Photons/Job: {photons_per_job}  ->  {job_seconds.mean()/60.:.3} minutes/job " +
+              f"(max. {job_seconds.max()/60.:.3} minutes, predicted)")
+    else:
+        print(f"*** Photons/Job: {photons_per_job}  ->  {photons_per_job/60.e4:.3} minutes/job (@ Harvard)")
     print(f"*** Config PATH: {config_path}")
     print(f"*** Log    PATH: {log_path}")
     print(f"*** Dst    PATH: {dst_path}")
@@ -137,79 +430,302 @@ if (num_jobs > 10000):
     print("\n*** WARNING: Number of jobs too high.\n")
 
 #assert (photons_per_job/1.e4) < 24*60*60, "Jobs larger than 24 hours"
-if ((photons_per_job/1.e4) > 24*60*60):
+if job_seconds is not None:
+    if (job_seconds.max() / 60. > SLURM_TIME_LIMIT_MINUTES):
+        print(f"\n*** WARNING: Jobs predicted larger than {SLURM_TIME_LIMIT_MINUTES} minutes.\n")
+elif ((photons_per_job/1.e4) > 24*60*60):
     print("\n*** WARNING: Jobs larger than 24 hours.\n")
 
 
-#################### RUNNING SIMULATIONS ####################
+### Checking the sensor plane symmetry declared, before simulating the folded table
+if symmetry is not None:
+    if not check_plane_symmetry(dst_path, sensor_name, symmetry):
+        print(f"\n*** WARNING: No DSTs to check the {symmetry} symmetry of {det_name} yet, " +
+              "it will be checked when building the table.\n")
 
-if RUN_SIMULATIONS:
 
-    print(f"\n*** Running {num_points} Light Simulations ...\n")
+#################### CHECKING DSTS ####################
 
-    init_fnames    = []
-    dst_fnames     = []
-    log_fnames     = []
-    job_id         = 0
+# Only the DSTs not checked yet (or changed since) are read.
+# Dry runs just report the unhealthy ones.
+health_fname = dst_path + get_health_fname(det_name)
+if dst_health_scan:
+    print(f"\n*** Checking the DSTs of {num_points} points ...")
+    with timer("health_scan"):
+        check_plan_dsts(plan, events_per_shard, health_fname, num_workers, not dry_run)
 
-    # For every position ...
-    for pos in table_positions:
-        print(f"* Position {pos} - {photons_per_point} photons")
 
-        # file names
-        init_fname, config_fname, log_fname, dst_fname = get_fnames(det_name ,pos)
 
-        # Check if the sim is already run with the correct num_photons
-        if os.path.isfile(dst_fname + '.h5'):
-            prev_photons = get_num_photons(dst_fname + '.h5')
-            if prev_photons >= photons_per_point:
-                print("  Simulation run previously, so skipping ...")
+#################### RUNNING SIMULATIONS ####################
+
+if RUN_SIMULATIONS or dry_run:
+
+    if dry_run: print(f"\n*** Dry run of {num_points} Light Simulations ...\n")
+    else      : print(f"\n*** Running {num_points} Light Simulations ...\n")
+
+    pos_tuples = get_position_tuples(table_positions)
+
+    # Backend running the simulation jobs, and the jobs it follows
+    sim_backend = get_sim_backend(sim_backend_name, det_name, nexus_path,
+                                  local_max_jobs, fake_config)
+    sim_handles = []
+
+    # Jobs to be submitted as Slurm job arrays, by the photons recorded
+    # in the completion index for every one of their DSTs, and the nexus
+    # they run (the fake one writing synthetic DSTs for the fake_nexus backend)
+    array_jobs = {}
+    array_nexus_path = FAKE_NEXUS_PATH if sim_backend_name == "fake_nexus" else nexus_path
+
+    # Predicted seconds of the jobs to be run (dry runs)
+    pending_seconds = []
+
+    # Completion index of the points already simulated
+    index_fname      = dst_path + get_index_fname(det_name)
+    completion_index = load_completion_index(index_fname)
+
+    # Pack index of the points packed, and the tag of the packs of this run
+    pack_index_fname = dst_path + get_pack_index_fname(det_name)
+    pack_index       = load_pack_index(pack_index_fname)
+    pack_tag         = time.strftime("%Y%m%d_%H%M%S")
+
+    # Adaptive photon budgets, from the photons & charge already simulated.
+    # The extra photons are simulated in extra DSTs tagged with this run time.
+    if adaptive_photons:
+        dst_sets   = get_point_dst_sets(plan)
+        sensor_ids = get_budget_sensor_ids(det_name, table_type, sensor_name, dst_sets)
+        cache      = load_reduction_cache(cache_fname) if cache_fname else None
+        photon_budgets = get_photon_budgets(dst_sets, sensor_ids, pilot_photons_per_point,
+                                            target_rel_error, photons_per_point,
+                                            budget_charge_floor, num_workers, cache)
+        if cache_fname: save_reduction_cache(cache_fname, cache)
+        topup_tag = "topup_" + time.strftime("%Y%m%d_%H%M%S")
+
+    # The jobs record their points in the completion index with photons_per_point,
+    # which is not the case with adaptive photon budgets.
+    job_index_fname = None if adaptive_photons else index_fname
+
+    # Points are reported by the progress reporter, not one by one
+    progress = ProgressReporter("Points prepared", num_points)
+
+    if multi_vertex_jobs:
+
+        # Multi-vertex jobs: every shard of the job points in a single nexus run,
+        # recorded in the completion index with the photons of all its points
+        for job_id, job_points in enumerate(plan['jobs']):
+            progress.update(len(job_points), info = f"Job {job_id}")
+            job_positions = [pos_tuples[point_idx] for point_idx in job_points]
+            job_photons   = len(job_points) * photons_per_shard
+
+            for shard_tag in shard_tags:
+                init_fname, config_fname, vertices_fname, log_fname, dst_fname = \
+                    get_job_fnames(plan, job_id, shard_tag)
+
+                with timer("completion_check"):
+                    prev_photons = get_previous_photons(completion_index, index_fname,
+                                                        dst_fname + '.h5')
+                if (prev_photons is not None) and (prev_photons >= job_photons):
+                    count("points_skipped", len(job_points))
+                    continue
+
+                if dry_run:
+                    pending_seconds.append(job_seconds[job_id])
+                    continue
+
+                with timer("config_writing"):
+                    make_init_file(det_name, init_fname, config_fname, vertices_fname)
+                    make_config_file(det_name, config_fname, dst_fname,
+                                     *job_positions[0], photons_per_event)
+                    make_vertices_file(det_name, vertices_fname, job_positions, events_per_shard)
+
+                count("points_submitted", len(job_points))
+                if slurm_array:
+                    array_jobs.setdefault(job_photons, []).append(([init_fname], [dst_fname],
+                                                                   [log_fname]))
+                    continue
+
+                with timer("submission"):
+                    sim_handle = run_sims(sim_backend, [init_fname], [dst_fname], [log_fname],
+                                          events_per_shard, job_index_fname, job_photons,
+                                          None, reduce_sensors, keep_raw_dsts)
+                count("jobs_submitted")
+                if sim_handle is not None: sim_handles.append(sim_handle)
+
+    else:
+
+        # Single-vertex jobs: the points not run previously of every shard, gathered
+        # across the plan jobs (with their file names & predicted seconds) ...
+        pending_points = {shard_tag: [] for shard_tag in shard_tags}
+
+        # For every position ...
+        for point_idx in (point_idx for job in plan['jobs'] for point_idx in job):
+            pos = pos_tuples[point_idx]
+            progress.update()
+
+            # Adaptive photon budget of this point, in extra DSTs once the
+            # point has been simulated
+            if adaptive_photons:
+                point_photons = photon_budgets[point_idx]
+                if point_photons == 0:
+                    count("points_skipped")
+                    continue
+                count("photons_added", point_photons)
+
+                point_tag = topup_tag if dst_sets[point_idx] else None
+                init_fname, config_fname, log_fname, dst_fname = \
+                    get_plan_fnames(plan, point_idx, point_tag)
+
+                seconds = 0.
+                if cost_model is not None:
+                    seconds = point_seconds[point_idx] * point_photons / photons_per_shard
+                if not dry_run:
+                    with timer("config_writing"):
+                        make_init_file(det_name, init_fname, config_fname)
+                        make_config_file(det_name, config_fname, dst_fname,
+                                         pos[0], pos[1], pos[2],
+                                         ceil(point_photons / events_per_shard))
+
+                pending_points[None].append((init_fname, dst_fname, log_fname, seconds))
                 continue
-            elif prev_photons > 0:
-                print("  Simulation run previously with less events, so re-running ...")
-
-        # Preparing this position to be simulated
-        make_init_file(det_name, init_fname, config_fname)
-        
-        make_config_file(det_name, config_fname, dst_fname,
-                         pos[0], pos[1], pos[2],
-                         photons_per_event)
-        
-        # Adding file names to be run
-        init_fnames += [init_fname]
-        dst_fnames  += [dst_fname]
-        log_fnames  += [log_fname]
-
-        # Launching simulation job
-        if(len(init_fnames) == points_per_job):
-            print(f"* Submitting job {job_id} with {len(init_fnames)} points\n")
-            run_sims(init_fnames, dst_fnames, log_fnames, events_per_point)
-            job_id += 1
-            init_fnames = []
-            dst_fnames  = []
-            log_fnames  = []
-
-    # Running last set of sims if needed.
-    if len(init_fnames):
-        print(f"* Submitting job {job_id} with {len(init_fnames)} points\n")
-        run_sims(init_fnames, dst_fnames, log_fnames, events_per_point)
+
+            # For every shard of the position ...
+            for shard_tag in shard_tags:
+
+                # file names
+                init_fname, config_fname, log_fname, dst_fname = \
+                    get_plan_fnames(plan, point_idx, shard_tag)
+
+                # Check if the sim is already run with the correct num_photons.
+                with timer("completion_check"):
+                    prev_photons = get_previous_photons(completion_index, index_fname,
+                                                        dst_fname + '.h5', pack_index)
+                if prev_photons is not None:
+                    if prev_photons >= photons_per_shard:
+                        count("points_skipped")
+                        continue
+                    elif prev_photons > 0:
+                        print(f"  Simulation {pos} {shard_tag or ''} run previously with less events, " +
+                              "so re-running ...")
+                        count("points_rerun")
+
+                # Preparing this position to be simulated
+                seconds = point_seconds[point_idx] if cost_model is not None else 0.
+                if not dry_run:
+                    with timer("config_writing"):
+                        make_init_file(det_name, init_fname, config_fname)
+
+                        make_config_file(det_name, config_fname, dst_fname,
+                                         pos[0], pos[1], pos[2],
+                                         photons_per_event)
+
+                pending_points[shard_tag].append((init_fname, dst_fname, log_fname, seconds))
+
+        # ... re-chunked into jobs of points_per_job points (or packed to job_target_minutes),
+        # so the points left by the failed jobs of a previous run are not run one job each
+        for shard_tag, shard_points in pending_points.items():
+            if not shard_points: continue
+            shard_seconds  = np.array([seconds for *_, seconds in shard_points])
+            target_seconds = 60. * job_target_minutes if job_target_minutes else None
+            pending_jobs   = get_point_jobs(list(range(len(shard_points))), points_per_job,
+                                            shard_seconds, target_seconds)
+
+            # Launching simulation jobs with the points not run previously
+            # (packing their outputs into the pack & tar of the job)
+            for pending_job in pending_jobs:
+                init_fnames = [shard_points[idx][0] for idx in pending_job]
+                dst_fnames  = [shard_points[idx][1] for idx in pending_job]
+                log_fnames  = [shard_points[idx][2] for idx in pending_job]
+                shard_job   = (init_fnames, dst_fnames, log_fnames)
+
+                pack_files = None
+                if packed_outputs:
+                    pack_base_fname = get_pack_base_fname(det_name, dst_fnames, pack_tag)
+                    pack_files      = (dst_path + pack_base_fname + ".h5",
+                                       log_path + pack_base_fname + ".tar", pack_index_fname)
+                    shard_job      += pack_files[:2]
+
+                if dry_run:
+                    pending_seconds.append(shard_seconds[pending_job].sum() +
+                                           NEXUS_STARTUP_SECONDS * len(pending_job))
+                    continue
+
+                count("points_submitted", len(init_fnames))
+
+                if slurm_array:
+                    array_jobs.setdefault(photons_per_shard, []).append(shard_job)
+                    continue
+
+                with timer("submission"):
+                    sim_handle = run_sims(sim_backend, init_fnames, dst_fnames, log_fnames,
+                                          events_per_shard, job_index_fname, photons_per_shard,
+                                          pack_files, reduce_sensors, keep_raw_dsts)
+                count("jobs_submitted")
+                if sim_handle is not None: sim_handles.append(sim_handle)
+
+    run_counters = get_metrics()['counters']
+    print(f"\n* Points submitted: {run_counters.get('points_submitted', 0)}  -  " +
+          f"Points skipped (run previously): {run_counters.get('points_skipped', 0)}")
+
+    # Submitting the job arrays, with the job -> points manifest
+    # (one array per number of photons of its DSTs, as multi-vertex jobs
+    # simulate a different number of points)
+    for array_photons, photons_jobs in array_jobs.items():
+        manifest_fname = config_path + f"{det_name}.{table_type}.{signal_type}." + \
+                         time.strftime("%Y%m%d_%H%M%S") + \
+                         (f".photons_{array_photons}" if len(array_jobs) > 1 else "") + ".manifest"
+        print(f"\n* Submitting {len(photons_jobs)} jobs as Slurm job arrays - {manifest_fname}\n")
+        with timer("submission"):
+            run_sims_array(photons_jobs, events_per_shard, manifest_fname,
+                           job_index_fname, array_photons, slurm_array_max_running,
+                           pack_index_fname = pack_index_fname if packed_outputs else None,
+                           reduce_sensors   = reduce_sensors,
+                           keep_raw_dsts    = keep_raw_dsts,
+                           exe_path         = array_nexus_path)
+        count("jobs_submitted", len(photons_jobs))
+
+    # Waiting for the jobs followed by the backend
+    if sim_handles:
+        print(f"\n*** Waiting for {len(sim_handles)} jobs ...\n")
+        with timer("simulation_wait"):
+            failed_fnames = wait_sims(sim_backend, sim_handles)
+        count("points_failed", len(failed_fnames))
+    sim_backend.shutdown()
+
+    # Predicted cost of the whole campaign, and of the jobs to be run
+    if dry_run:
+        print_cost_report("campaign jobs", np.tile(job_seconds, len(shard_tags)),
+                          job_slots, cost_model)
+        print_cost_report("jobs to be run", np.array(pending_seconds), job_slots, cost_model)
 
 
 
 
 #################### GENERATING LIGHT TABLE ####################
 
-if GENERATE_TABLE:
+if GENERATE_TABLE and not dry_run:
+
+    # The DSTs just simulated are checked too
+    if dst_health_scan and RUN_SIMULATIONS:
+        with timer("health_scan"):
+            check_plan_dsts(plan, events_per_shard, health_fname, num_workers)
 
     dimensions = get_detector_dimensions(det_name)
-    light_table_fname = table_path + get_table_fname(det_name, table_type,
-                                                     signal_type, sensor_name)
+    if table_format == "dense":
+        light_table_fname = table_path + get_dense_table_fname(det_name, table_type,
+                                                               signal_type, sensor_name)
+    else:
+        light_table_fname = table_path + get_table_fname(det_name, table_type,
+                                                         signal_type, sensor_name)
     
-    # Light Table
-    light_table = build_table(det_name, table_type, signal_type, sensor_name, pitch, tracking_maxDist)
-    
-    light_table.to_hdf(light_table_fname, '/LightTable', mode   = 'w',
-                       format = 'table', data_columns = True)
+    # Light Table, streamed to its file while it is built or fully built in memory
+    with timer("table_build"):
+        if stream_table:
+            print(f"\n*** Streaming Light Table to {light_table_fname} ...\n")
+            stream_energy_table(light_table_fname, det_name, signal_type, sensor_name, pitch,
+                                num_workers, plan, stream_chunk_rows)
+        else:
+            light_table = build_table(det_name, table_type, signal_type, sensor_name, pitch,
+                                      tracking_maxDist, num_workers, cache_fname, plan,
+                                      tracking_aggregate)
 
     # Config Table
     config_columns =  ['parameter', 'value']
@@ -225,10 +741,17 @@ if GENERATE_TABLE:
                       ['pitch_x',              str(pitch[0])],
                       ['pitch_y',              str(pitch[1])],
                       ['pitch_z',              str(pitch[2])],
+                      ['tracking_maxDist',     str(tracking_maxDist)],
+                      ['tracking_aggregate',   str(tracking_aggregate)],
                       ['photons_per_point',    str(photons_per_point)],
                       ['photons_per_event',    str(photons_per_event)],
                       ['events_per_point',     str(events_per_point)],
-                      ['total_points',         str(num_points)],
+                      ['shards_per_point',     str(shards_per_point)],
+                      ['multi_vertex_jobs',    str(multi_vertex_jobs)],
+                      ['total_points',         str(len(plan['table_positions']))],
+                      ['symmetry',             str(symmetry)],
+                      ['grid_refine_levels',   str(grid_refine_levels)],
+                      ['grid_refine_tolerance', str(grid_refine_tolerance)],
                       ['table_path',           table_path],
                       ['dst_path',             dst_path],
                       ['config_path',          config_path],
@@ -236,9 +759,35 @@ if GENERATE_TABLE:
 
     config_table = pd.DataFrame(config_data, columns = config_columns)
     config_table.set_index("parameter", inplace = True)
-    
-    config_table.to_hdf(light_table_fname, '/Config', mode   = 'a',
-                        format = 'table', data_columns = True)
+
+    # Storing both tables
+    with timer("table_write"):
+        if table_format == "dense":
+            write_dense_table(light_table_fname, light_table, config_table)
+
+        else:
+            if not stream_table:
+                light_table.to_hdf(light_table_fname, '/LightTable', mode   = 'w',
+                                   format = 'table', data_columns = True)
+
+            config_table.to_hdf(light_table_fname, '/Config', mode   = 'a',
+                                format = 'table', data_columns = True)
 
     # Verbosing
     print(f"\n*** Storing Light Table in {light_table_fname} ...\n")
+
+
+
+#################### INSTRUMENTATION ####################
+
+metrics_fname = table_path + get_metrics_fname(det_name, table_type, signal_type, sensor_name)
+
+if metrics_report:
+    run_time = time.perf_counter() - run_start
+    write_metrics_report(metrics_fname, run_settings, run_time,
+                         {'num_points'   : num_points,
+                          'points_per_s' : num_points / run_time})
+    print(f"*** Metrics report stored in {metrics_fname}\n")
+
+if profiler is not None:
+    stop_profiling(profiler, metrics_fname.replace(".json", ".prof"))
@@ -0,0 +1,249 @@
+import os
+import pickle
+
+import numpy      as np
+import tables     as tb
+from   typing import Dict
+from   typing import List
+from   typing import Tuple
+from   typing import Optional
+
+# Specific LightTable stuff
+from cache_functions   import get_dst_stamp
+from plan_functions    import CampaignPlan
+from table_functions   import map_points
+from table_functions   import SNS_RESPONSE_NODE
+from metrics_functions import ProgressReporter
+from metrics_functions import count
+
+
+# Health status of the DSTs:
+#   complete   : readable, with the photons info and all its events
+#   short      : with less events than the ones expected
+#   no_photons : with no nphotons in its configuration
+#   corrupted  : not readable (i.e. truncated by a job killed while writing it)
+#   duplicated_sensors : with sensors with several positions
+DST_COMPLETE   = "complete"
+DST_SHORT      = "short"
+DST_NO_PHOTONS = "no_photons"
+DST_CORRUPTED  = "corrupted"
+DST_DUPLICATED = "duplicated_sensors"
+DST_STATUSES   = [DST_COMPLETE, DST_SHORT, DST_NO_PHOTONS, DST_CORRUPTED, DST_DUPLICATED]
+
+# DST nodes read by the scanner
+CONFIGURATION_NODE = "/MC/configuration"
+SNS_POSITIONS_NODE = "/MC/sns_positions"
+
+# Sub-directory of the dst path the unhealthy DSTs are moved into
+QUARANTINE_DIR = "quarantine/"
+
+# Max. number of unhealthy DSTs listed by the health reports
+MAX_LISTED_DSTS = 100
+
+# Health cache entries: dst_fname -> (dst_stamp, expected_events, status, info)
+HealthCache = Dict[str, Tuple[Tuple[int, int], Optional[int], str, str]]
+
+
+
+###
+def get_health_fname(det_name : str) -> str :
+    return f"{det_name}.DSTHealth.pkl"
+
+
+
+###
+def load_health_cache(health_fname : str
+                     )            -> HealthCache :
+
+    if not os.path.isfile(health_fname):
+        return {}
+
+    try:
+        with open(health_fname, 'rb') as health_file:
+            return pickle.load(health_file)
+    except Exception:
+        print(f"  WARNING: {health_fname} corrupted. Rebuilding it ...")
+        return {}
+
+
+
+###
+def save_health_cache(health_fname : str,
+                      health_cache : HealthCache
+                     )            -> None :
+    tmp_fname = health_fname + ".tmp"
+    with open(tmp_fname, 'wb') as health_file:
+        pickle.dump(health_cache, health_file, protocol = pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_fname, health_fname)
+
+
+
+###
+def check_dst(dst_item : Tuple[str, Optional[int]]
+             )        -> Tuple[str, str] :
+
+    # (status, info) of a DST expected to have expected_events events (None if
+    # not known). Only the configuration, the sensor ids of the positions and
+    # the last sensor response row are read, with no pandas overhead.
+    dst_fname, expected_events = dst_item
+    try:
+        with tb.open_file(dst_fname, 'r') as dst_file:
+            config       = dst_file.get_node(CONFIGURATION_NODE).read()
+            sensor_ids   = dst_file.get_node(SNS_POSITIONS_NODE).read(field = 'sensor_id')
+            sns_response = dst_file.get_node("/" + SNS_RESPONSE_NODE)
+            if sns_response.nrows:
+                sns_response.read(sns_response.nrows - 1, sns_response.nrows)
+    except Exception as error:
+        return DST_CORRUPTED, type(error).__name__
+
+    params = {key.decode(): value.decode()
+              for key, value in zip(config['param_key'], config['param_value'])}
+
+    if "/Generator/ScintGenerator/nphotons" not in params:
+        return DST_NO_PHOTONS, ""
+
+    if len(sensor_ids) != len(np.unique(sensor_ids)):
+        return DST_DUPLICATED, f"{len(sensor_ids) - len(np.unique(sensor_ids))} duplicated"
+
+    num_events = int(params.get("num_events", 0))
+    if (expected_events is not None) and (num_events < expected_events):
+        return DST_SHORT, f"{num_events}/{expected_events} events"
+
+    return DST_COMPLETE, ""
+
+
+
+###
+def scan_dsts(dst_fnames      : List[str],
+              expected_events : Optional[List[Optional[int]]] = None,
+              num_workers     : int                           = 1,
+              health_cache    : Optional[HealthCache]         = None
+             )               -> Dict[str, Tuple[str, str]] :
+
+    # (status, info) of every existing DST, checked by num_workers processes.
+    # Only the DSTs not in the health cache (or changed since checked) are read,
+    # and the cache is updated with them.
+    if expected_events is None: expected_events = [None] * len(dst_fnames)
+    if health_cache    is None: health_cache    = {}
+
+    dst_health = {}
+    to_check   = []
+    for dst_fname, dst_events in zip(dst_fnames, expected_events):
+        dst_stamp = get_dst_stamp(dst_fname)
+        if dst_stamp is None:
+            continue
+        cached = health_cache.get(dst_fname)
+        if (cached is not None) and (cached[:2] == (dst_stamp, dst_events)):
+            dst_health[dst_fname] = cached[2:]
+        else:
+            to_check.append((dst_fname, dst_events, dst_stamp))
+
+    print(f"\n* Scanning {len(to_check)} DSTs not checked yet " +
+          f"({len(dst_health)} checked previously) ...")
+    progress = ProgressReporter("DSTs scanned", len(to_check))
+    checked  = map_points(check_dst, [(dst_fname, dst_events) for dst_fname, dst_events, _ in to_check],
+                          num_workers)
+    for (dst_fname, dst_events, dst_stamp), dst_status in zip(to_check, checked):
+        progress.update()
+        dst_health  [dst_fname] = dst_status
+        health_cache[dst_fname] = (dst_stamp, dst_events) + dst_status
+
+    count("dsts_scanned", len(to_check))
+    for status, _ in dst_health.values():
+        count(f"dsts_{status}")
+
+    return dst_health
+
+
+
+###
+def get_plan_dsts(plan             : CampaignPlan,
+                  events_per_shard : int
+                 )                -> Tuple[List[str], List[Optional[int]]] :
+
+    # DSTs of the plan points & jobs in the dst path, and the events expected
+    # in every one of them: the ones of a shard for the point DSTs
+    # (<stem>.next[.shard<k>].h5), the ones of all the job points for the
+    # multi-vertex job DSTs, and unknown (None) for the extra ones (top-ups).
+    # The DSTs of other campaigns in the same path are left out.
+    stem_points = {base_fname: 1 for base_fname in plan['base_fnames']}
+    if plan.get('job_base_fnames'):
+        stem_points.update({job_base_fname: len(job) for job, job_base_fname
+                            in zip(plan['jobs'], plan['job_base_fnames'])})
+
+    dst_fnames, expected_events = [], []
+    for dst_name in sorted(os.listdir(plan['dst_path'])):
+        if not (dst_name.endswith(".h5") and (".next" in dst_name)):
+            continue
+        base_fname, dst_tag = dst_name[:-len(".h5")].split(".next", 1)
+        if base_fname not in stem_points:
+            continue
+
+        dst_fnames.append(plan['dst_path'] + dst_name)
+        if dst_tag and not dst_tag.startswith(".shard"):
+            expected_events.append(None)
+        else:
+            expected_events.append(stem_points[base_fname] * events_per_shard)
+
+    return dst_fnames, expected_events
+
+
+
+###
+def print_health_report(dst_health : Dict[str, Tuple[str, str]]
+                       )          -> List[str] :
+
+    # Number of DSTs of every status, and the unhealthy DSTs (up to
+    # MAX_LISTED_DSTS of them). Returns the unhealthy ones.
+    statuses = [status for status, _ in dst_health.values()]
+    print("\n* DST health: " + "  -  ".join(f"{status}: {statuses.count(status)}"
+                                            for status in DST_STATUSES))
+
+    unhealthy = sorted(dst_fname for dst_fname, (status, _) in dst_health.items()
+                       if status != DST_COMPLETE)
+    for dst_fname in unhealthy[:MAX_LISTED_DSTS]:
+        status, info = dst_health[dst_fname]
+        print(f"  WARNING: {dst_fname} {status} {info}")
+    if len(unhealthy) > MAX_LISTED_DSTS:
+        print(f"  ... and {len(unhealthy) - MAX_LISTED_DSTS} unhealthy DSTs more")
+
+    return unhealthy
+
+
+
+###
+def quarantine_dsts(dst_fnames : List[str]
+                   )          -> None :
+
+    # Moving the DSTs into the quarantine dir of their path, so they are not
+    # read by the table builders and their points are simulated again
+    for dst_fname in dst_fnames:
+        quarantine_path = os.path.join(os.path.dirname(dst_fname), QUARANTINE_DIR)
+        if not os.path.isdir(quarantine_path): os.makedirs(quarantine_path)
+        os.replace(dst_fname, quarantine_path + os.path.basename(dst_fname))
+    count("dsts_quarantined", len(dst_fnames))
+
+
+
+###
+def check_plan_dsts(plan             : CampaignPlan,
+                    events_per_shard : int,
+                    health_fname     : str,
+                    num_workers      : int  = 1,
+                    repair           : bool = True
+                   )                -> List[str] :
+
+    # Scanning the DSTs of the plan (with the health cache of health_fname),
+    # and moving the unhealthy ones into quarantine if repair.
+    # Returns the unhealthy ones.
+    health_cache = load_health_cache(health_fname)
+    dst_fnames, expected_events = get_plan_dsts(plan, events_per_shard)
+    dst_health = scan_dsts(dst_fnames, expected_events, num_workers, health_cache)
+    save_health_cache(health_fname, health_cache)
+
+    unhealthy_fnames = print_health_report(dst_health)
+    if unhealthy_fnames and repair:
+        print(f"\n* Moving {len(unhealthy_fnames)} unhealthy DSTs into quarantine ...")
+        quarantine_dsts(unhealthy_fnames)
+
+    return unhealthy_fnames
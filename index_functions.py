@@ -0,0 +1,82 @@
+import os
+
+from   typing import Dict
+from   typing import Tuple
+from   typing import Optional
+
+
+# Completion index: dst basename -> (num_photons, dst_size)
+# Stored in the dst path as an append-only text file, one line per DST
+# finished: "<dst_basename> <num_photons> <dst_size>". Later lines override
+# the previous ones of the same DST.
+CompletionIndex = Dict[str, Tuple[int, int]]
+
+
+
+###
+def get_index_fname(det_name : str) -> str :
+    return f"{det_name}.CompletionIndex.txt"
+
+
+
+###
+def load_completion_index(index_fname : str
+                         )           -> CompletionIndex :
+
+    completion_index = {}
+    if not os.path.isfile(index_fname):
+        return completion_index
+
+    with open(index_fname) as index_file:
+        for line in index_file:
+            # Skipping lines not fully written (i.e. by jobs killed while writing)
+            try:
+                dst_name, num_photons, dst_size = line.split()
+                completion_index[dst_name] = (int(num_photons), int(dst_size))
+            except ValueError:
+                continue
+
+    return completion_index
+
+
+
+###
+def add_to_completion_index(index_fname : str,
+                            dst_fname   : str,
+                            num_photons : int,
+                            dst_size    : int
+                           )           -> None :
+    # Just one write per line, so concurrent appends do not get mixed
+    with open(index_fname, 'a') as index_file:
+        index_file.write(f"{os.path.basename(dst_fname)} {num_photons} {dst_size}\n")
+
+
+
+###
+def get_completed_photons(completion_index : CompletionIndex,
+                          dst_fname        : str,
+                          dst_size         : int
+                         )                -> Optional[int] :
+
+    # Number of photons of the DST as recorded in the index, or None if the DST
+    # is not in the index or its entry is suspect (the DST changed afterwards).
+    index_entry = completion_index.get(os.path.basename(dst_fname))
+    if index_entry is None:
+        return None
+
+    num_photons, index_size = index_entry
+    if index_size != dst_size:
+        return None
+
+    return num_photons
+
+
+
+###
+def get_index_shell_line(index_fname : str,
+                         dst_fname   : str,
+                         num_photons : int
+                        )           -> str :
+    # Shell command recording a DST in the index once it is in place
+    dst_name = os.path.basename(dst_fname)
+    return f'echo "{dst_name} {num_photons} $(stat -c %s {dst_fname})" >> {index_fname}'
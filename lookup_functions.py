@@ -0,0 +1,276 @@
+import itertools
+
+import numpy      as np
+import pandas     as pd
+import tables     as tb
+from   typing import List
+from   typing import Tuple
+from   typing import Union
+from   typing import Optional
+
+# Specific LightTable stuff
+from dense_functions   import DENSE_TABLE_GROUP
+from dense_functions   import is_dense_table
+from dense_functions   import read_dense_axes
+
+
+# Number of points looked up at once, bounding the memory of batch queries
+LOOKUP_BATCH = 65536
+
+
+
+###
+def get_tracking_z(column : str) -> float :
+    # Tracking table columns are 'z_m<-z>'
+    return -float(column[3:])
+
+
+
+###
+def get_table_grid(light_table : pd.DataFrame
+                  )           -> Tuple[List[np.ndarray], np.ndarray] :
+
+    # Axes (from the index levels) and data of a pandas light table
+    # as a regular grid, NaN for the grid points with no data.
+    index    = light_table.index
+    axes     = [np.unique(index.get_level_values(name)) for name in index.names]
+    axis_idx = tuple(np.searchsorted(axis, index.get_level_values(name))
+                     for name, axis in zip(index.names, axes))
+
+    data = np.full(tuple(len(axis) for axis in axes) + (light_table.shape[1],), np.nan)
+    data[axis_idx] = light_table.values
+
+    return axes, data
+
+
+
+###
+def get_lattice_grid(axes    : List[np.ndarray],
+                     data    : np.ndarray,
+                     origins : List[float],
+                     pitches : List[float]
+                    )       -> Tuple[List[np.ndarray], np.ndarray] :
+
+    # Axes and data of a refined grid scattered onto the uniform grid of
+    # pitches (from origins), NaN for the grid points not simulated
+    lattice_axes = [np.arange(origin, axis[-1] + pitch / 2., pitch)
+                    for axis, origin, pitch in zip(axes, origins, pitches)]
+    axis_idx     = [np.rint((axis - origin) / pitch).astype(int)
+                    for axis, origin, pitch in zip(axes, origins, pitches)]
+
+    lattice_data = np.full(tuple(len(axis) for axis in lattice_axes) + data.shape[-1:], np.nan)
+    lattice_data[np.ix_(*axis_idx)] = data
+
+    return lattice_axes, lattice_data
+
+
+
+###
+class LightTable :
+
+    # Light table loaded into a regular grid (an array with one axis per table
+    # coordinate and the columns as last axis), for vectorized batch queries of
+    # arrays of points:
+    #   energy   tables : points (x, y) for S2, (x, y, z) for S1, one column per sensor
+    #   tracking tables : points (dist_xy, z), one column (the reference sensor)
+    # Points out of ACTIVE_radius (energy) or tracking_maxDist (tracking) get NaN.
+    # Refined energy tables (grid_refine_levels) are loaded into their uniform
+    # grid of pitch, every point looked up from the finest cell of the refined
+    # grid holding it (the one with data in all its corners within ACTIVE).
+
+    def __init__(self, table_fname : str) :
+
+        if is_dense_table(table_fname):
+            axes, columns = read_dense_axes(table_fname)
+            with tb.open_file(table_fname, 'r') as h5file:
+                group = h5file.get_node('/', DENSE_TABLE_GROUP)
+                data   = group.data.read()
+                config = {parameter: str(group._v_attrs[parameter])
+                          for parameter in group._v_attrs._f_list('user')}
+            axis_names = list(axes)
+            axes       = list(axes.values())
+
+        else:
+            light_table = pd.read_hdf(table_fname, '/LightTable')
+            config      = pd.read_hdf(table_fname, '/Config')['value'].to_dict()
+            axis_names  = list(light_table.index.names)
+            columns     = list(light_table.columns)
+            axes, data  = get_table_grid(light_table)
+
+        self.config     = config
+        self.table_type = config['table_type']
+
+        # Tracking tables: the z columns become the second grid axis
+        if self.table_type == "tracking":
+            zs         = np.array([get_tracking_z(column) for column in columns])
+            z_order    = np.argsort(zs)
+            axis_names = axis_names + ['z']
+            axes       = axes + [zs[z_order]]
+            data       = data[:, z_order, np.newaxis]
+            columns    = [f"{config['sensor']}_{config['reference_sensor_id']}"]
+
+        self.axis_names = axis_names
+        self.axes       = [np.asarray(axis, dtype = float) for axis in axes]
+        self.columns    = columns
+        self.data       = data
+
+        # Table limits
+        if self.table_type == "energy":
+            self.max_radius = float(config['ACTIVE_rad'])
+        else:
+            self.max_dist   = float(config.get('tracking_maxDist', self.axes[0][-1]))
+
+        # Refined grids: cells of 2^level nodes per side, from the first node
+        # of the uniform grid (as the ones of refine_functions)
+        self.refine_levels = int(config.get('grid_refine_levels', 0))
+        if self.refine_levels:
+            det_rad        = int(self.max_radius)
+            self.origins   = [-det_rad, -det_rad, 0][:len(self.axes)]
+            self.pitches   = [float(config[f"pitch_{name}"]) for name in self.axis_names]
+            self.axes, self.data = get_lattice_grid(self.axes, self.data,
+                                                    self.origins, self.pitches)
+
+
+    def get_column_idx(self,
+                       columns : Optional[List[Union[str, int]]] = None
+                      )       -> Union[slice, List[int]] :
+        # Columns given by name or position (all of them by default)
+        if columns is None:
+            return slice(None)
+        return [self.columns.index(column) if isinstance(column, str) else column
+                for column in columns]
+
+
+    def in_table(self,
+                 points : np.ndarray
+                ) -> np.ndarray :
+        # Points within ACTIVE_radius (energy) or tracking_maxDist (tracking)
+        points = np.asarray(points, dtype = float)
+        if self.table_type == "energy":
+            return (points[:, 0]**2 + points[:, 1]**2) < self.max_radius**2
+        return (points[:, 0] >= 0) & (points[:, 0] <= self.max_dist)
+
+
+    def get_cells(self,
+                  points : np.ndarray
+                 )      -> Tuple[List[np.ndarray], List[np.ndarray], np.ndarray] :
+
+        # Lower grid node of the cell of every point along every axis, the
+        # fractional position within the cell (clipped to the grid limits),
+        # and the grid nodes per side of the cell (1 but for refined grids).
+        if self.refine_levels:
+            return self.get_refined_cells(points)
+
+        low_idx, fractions = [], []
+        for axis_num, axis in enumerate(self.axes):
+            coords = points[:, axis_num]
+            if len(axis) == 1:
+                low_idx  .append(np.zeros(len(coords), dtype = int))
+                fractions.append(np.zeros(len(coords)))
+                continue
+            idx      = np.clip(np.searchsorted(axis, coords, side = 'right') - 1, 0, len(axis) - 2)
+            fraction = (coords - axis[idx]) / (axis[idx + 1] - axis[idx])
+            low_idx  .append(idx)
+            fractions.append(np.clip(fraction, 0., 1.))
+        return low_idx, fractions, np.ones(len(points), dtype = int)
+
+
+    def get_refined_cells(self,
+                          points : np.ndarray
+                         )      -> Tuple[List[np.ndarray], List[np.ndarray], np.ndarray] :
+
+        # Same as get_cells for refined grids: the cells of every level, from
+        # the coarsest to the finest one, replacing the previous one of every
+        # point if all its corners weighting the point have data or are out of
+        # ACTIVE (and any of them has data), so the points on the faces of a
+        # cell get the data of its nodes. Points with no such cell get the
+        # coarsest one.
+        nodes = [(points[:, axis_num] - origin) / pitch
+                 for axis_num, (origin, pitch) in enumerate(zip(self.origins, self.pitches))]
+        cell_low  = [np.zeros(len(points), dtype = int) for _ in self.axes]
+        cell_step = np.zeros(len(points), dtype = int)
+
+        for step in (2**level for level in range(self.refine_levels, -1, -1)):
+            low_idx   = [np.clip(np.floor(node / step).astype(int) * step, 0, None)
+                         for node in nodes]
+            on_low    = [node <= idx for node, idx in zip(nodes, low_idx)]
+            all_valid = np.ones (len(points), dtype = bool)
+            any_data  = np.zeros(len(points), dtype = bool)
+            for corner in itertools.product((0, step), repeat = len(self.axes)):
+                weighting  = ~np.any([low & (offset > 0) for low, offset in zip(on_low, corner)],
+                                     axis = 0)
+                corner_idx = [idx + offset for idx, offset in zip(low_idx, corner)]
+                in_grid    = np.all([idx < len(axis) for idx, axis in zip(corner_idx, self.axes)],
+                                    axis = 0)
+                node_idx   = tuple(np.minimum(idx, len(axis) - 1)
+                                   for idx, axis in zip(corner_idx, self.axes))
+                node_xs, node_ys = [self.axes[axis_num][node_idx[axis_num]] for axis_num in (0, 1)]
+                in_active  = in_grid & ((node_xs**2 + node_ys**2) < int(self.max_radius)**2)
+                with_data  = in_active & ~np.isnan(self.data[node_idx + (0,)])
+                all_valid &= with_data | ~in_active | ~weighting
+                any_data  |= with_data & weighting
+
+            use_cell  = (all_valid & any_data) | (cell_step == 0)
+            cell_step = np.where(use_cell, step, cell_step)
+            cell_low  = [np.where(use_cell, idx, low) for idx, low in zip(low_idx, cell_low)]
+
+        fractions = [np.clip((node - low) / cell_step, 0., 1.) for node, low in zip(nodes, cell_low)]
+        return cell_low, fractions, cell_step
+
+
+    def nearest(self,
+                points  : np.ndarray,
+                columns : Optional[List[Union[str, int]]] = None
+               )       -> np.ndarray :
+
+        # Value of the grid node closest to every point
+        points     = np.asarray(points, dtype = float)
+        column_idx = self.get_column_idx(columns)
+        data       = self.data[..., column_idx]
+        values     = np.full((len(points), data.shape[-1]), np.nan)
+
+        for first in range(0, len(points), LOOKUP_BATCH):
+            batch = points[first : first + LOOKUP_BATCH]
+            low_idx, fractions, steps = self.get_cells(batch)
+            node_idx = tuple(np.minimum(idx + steps * (fraction >= 0.5), len(axis) - 1)
+                             for idx, fraction, axis in zip(low_idx, fractions, self.axes))
+            values[first : first + LOOKUP_BATCH] = data[node_idx]
+
+        values[~self.in_table(points)] = np.nan
+        return values
+
+
+    def interpolate(self,
+                    points  : np.ndarray,
+                    columns : Optional[List[Union[str, int]]] = None
+                   )       -> np.ndarray :
+
+        # Bi/trilinear interpolation of every point from the nodes of its cell.
+        # Nodes with no data (out of ACTIVE) are left out, re-weighting the rest.
+        points     = np.asarray(points, dtype = float)
+        column_idx = self.get_column_idx(columns)
+        data       = self.data[..., column_idx]
+        values     = np.full((len(points), data.shape[-1]), np.nan)
+
+        for first in range(0, len(points), LOOKUP_BATCH):
+            batch = points[first : first + LOOKUP_BATCH]
+            low_idx, fractions, steps = self.get_cells(batch)
+
+            sum_values  = np.zeros((len(batch), data.shape[-1]))
+            sum_weights = np.zeros(len(batch))
+            for corner in itertools.product((0, 1), repeat = len(self.axes)):
+                node_idx = tuple(np.minimum(idx + steps * step, len(axis) - 1)
+                                 for idx, step, axis in zip(low_idx, corner, self.axes))
+                weights  = np.prod([fraction if step else 1. - fraction
+                                    for fraction, step in zip(fractions, corner)], axis = 0)
+                node_values = data[node_idx]
+                with_data   = ~np.isnan(node_values[:, 0])
+                weights     = np.where(with_data, weights, 0.)
+                sum_values  += weights[:, np.newaxis] * np.nan_to_num(node_values)
+                sum_weights += weights
+
+            with np.errstate(invalid = 'ignore', divide = 'ignore'):
+                values[first : first + LOOKUP_BATCH] = sum_values / sum_weights[:, np.newaxis]
+
+        values[~self.in_table(points)] = np.nan
+        return values
@@ -0,0 +1,188 @@
+import io
+import json
+import time
+import pstats
+import cProfile
+
+from   typing     import Any
+from   typing     import Dict
+from   typing     import Callable
+from   typing     import Optional
+from   contextlib import contextmanager
+
+
+# Metrics of this process:
+#   'timers'   : phase -> {'time': seconds, 'calls': number of calls}
+#   'counters' : name  -> count
+Metrics = Dict
+
+METRICS = {'timers': {}, 'counters': {}}
+
+# Min. seconds between two reports of the progress reporters
+PROGRESS_SECONDS = {'interval': 5.}
+
+# Number of functions listed when profiling
+PROFILE_LINES = 30
+
+
+
+###
+def reset_metrics() -> None :
+    METRICS['timers']   = {}
+    METRICS['counters'] = {}
+
+
+
+###
+def get_metrics() -> Metrics :
+    return {'timers'   : {phase: dict(phase_timer) for phase, phase_timer in METRICS['timers'].items()},
+            'counters' : dict(METRICS['counters'])}
+
+
+
+###
+def add_time(phase   : str,
+             seconds : float,
+             calls   : int = 1
+            )       -> None :
+    phase_timer = METRICS['timers'].setdefault(phase, {'time': 0., 'calls': 0})
+    phase_timer['time']  += seconds
+    phase_timer['calls'] += calls
+
+
+
+###
+def count(name : str,
+          num  : int = 1
+         )    -> None :
+    METRICS['counters'][name] = METRICS['counters'].get(name, 0) + num
+
+
+
+###
+@contextmanager
+def timer(phase : str) :
+    # Adding the time spent within the block to the phase timer
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        add_time(phase, time.perf_counter() - start)
+
+
+
+###
+def merge_metrics(metrics : Metrics) -> None :
+    # Adding the metrics of other process (i.e. a pool worker) to these ones
+    for phase, worker_timer in metrics['timers'].items():
+        add_time(phase, worker_timer['time'], worker_timer['calls'])
+    for name, num in metrics['counters'].items():
+        count(name, num)
+
+
+
+###
+def call_with_metrics(func : Callable,
+                      arg  : Any
+                     )    -> Any :
+    # Running func(arg) in a pool worker, returning its result and the metrics
+    # of the call, to be merged in the main process
+    reset_metrics()
+    return func(arg), get_metrics()
+
+
+
+###
+def set_progress_interval(seconds : float) -> None :
+    PROGRESS_SECONDS['interval'] = seconds
+
+
+
+###
+class ProgressReporter :
+
+    # Progress of a loop over total items, reported at most once every
+    # PROGRESS_SECONDS (and when finished) instead of once per item
+
+    def __init__(self,
+                 label : str,
+                 total : int
+                ) :
+        self.label       = label
+        self.total       = total
+        self.num_done    = 0
+        self.start       = time.perf_counter()
+        self.last_report = self.start
+
+
+    def update(self,
+               num  : int = 1,
+               info : str = ""
+              )    -> None :
+        self.num_done += num
+        now = time.perf_counter()
+        if (now - self.last_report >= PROGRESS_SECONDS['interval']) or (self.num_done == self.total):
+            self.last_report = now
+            rate = self.num_done / max(now - self.start, 1.e-9)
+            print(f"* {self.label}: {self.num_done:8}/{self.total}  -  {rate:10.1f} /s" +
+                  (f"  -  {info}" if info else ""))
+
+
+
+###
+def start_profiling() -> cProfile.Profile :
+    profiler = cProfile.Profile()
+    profiler.enable()
+    return profiler
+
+
+
+###
+def stop_profiling(profiler      : cProfile.Profile,
+                   profile_fname : str
+                  )             -> None :
+    # Storing the profile (to be loaded with pstats / snakeviz), and printing
+    # the functions with the largest cumulative time. Pool workers are not profiled.
+    profiler.disable()
+    profiler.dump_stats(profile_fname)
+
+    stats_stream = io.StringIO()
+    pstats.Stats(profiler, stream = stats_stream).sort_stats('cumulative').print_stats(PROFILE_LINES)
+    print(f"\n*** Profile stored in {profile_fname}\n")
+    print(stats_stream.getvalue())
+
+
+
+###
+def get_metrics_fname(det_name    : str,
+                      table_type  : str,
+                      signal_type : str,
+                      sensor_name : str
+                     )           -> str :
+    return f"{det_name}.{table_type}.{signal_type}.{sensor_name}.Metrics." + \
+           time.strftime("%Y%m%d_%H%M%S") + ".json"
+
+
+
+###
+def write_metrics_report(report_fname : str,
+                         settings     : Dict,
+                         wall_time    : float,
+                         extra        : Optional[Dict] = None
+                        )            -> None :
+
+    # JSON report with the run settings, the wall time, the timers (with the
+    # share of the wall time of every phase) and the counters of this run
+    metrics = get_metrics()
+    for phase_timer in metrics['timers'].values():
+        phase_timer['fraction'] = phase_timer['time'] / wall_time if wall_time > 0 else 0.
+
+    report = {'date'      : time.strftime("%Y-%m-%d %H:%M:%S"),
+              'settings'  : settings,
+              'wall_time' : wall_time,
+              'timers'    : metrics['timers'],
+              'counters'  : metrics['counters']}
+    report.update(extra or {})
+
+    with open(report_fname, 'w') as report_file:
+        json.dump(report, report_file, indent = 2, default = str)
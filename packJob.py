@@ -0,0 +1,34 @@
+"""
+This SCRIPT packs the outputs of the points of a job (run at the end of the
+job scripts of the packed output mode).
+"""
+
+# General Importings
+import sys
+
+# Light Table stuff
+from pack_functions import pack_job
+
+
+
+#################### SETTINGS ####################
+try:
+    pack_fname, tar_fname, pack_index_fname, index_fname, num_photons = sys.argv[1:6]
+    point_args = sys.argv[6:]
+    assert point_args and (len(point_args) % 3 == 0)
+except (ValueError, AssertionError):
+    print("\nUsage: python packJob.py pack.h5 pack.tar pack_index index|none num_photons " +
+          "init_fname dst_h5_fname log_fname [init_fname dst_h5_fname log_fname ...]\n")
+    sys.exit(1)
+
+point_fnames = [tuple(point_args[idx : idx + 3]) for idx in range(0, len(point_args), 3)]
+
+
+
+#################### PACKING JOB ####################
+
+packed = pack_job(pack_fname, tar_fname, pack_index_fname,
+                  None if index_fname == "none" else index_fname,
+                  int(num_photons), point_fnames)
+
+print(f"*** Packed {len(packed)} of {len(point_fnames)} points into {pack_fname}")
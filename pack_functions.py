@@ -0,0 +1,208 @@
+import os
+import re
+import zlib
+import tarfile
+
+import tables     as tb
+from   typing import Dict
+from   typing import List
+from   typing import Tuple
+from   typing import Optional
+
+# Specific LightTable stuff
+from index_functions  import add_to_completion_index
+from vertex_functions import split_dst_spec
+
+
+# Separator of a pack file name and the group of one of its points:
+# "<pack_fname>#<group>" (with the DST nodes under /<group>/MC/)
+PACK_GROUP_SEP = "#"
+
+# DST nodes copied into the packs, and the ones also copied to the pack
+# root, so the sensor info of a pack is read as the one of a DST
+PACK_NODE       = "/MC"
+PACK_ROOT_NODES = ["configuration", "sns_positions"]
+
+# Python packer run at the end of the job scripts
+PACK_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "packJob.py")
+
+# Pack index: dst basename -> (pack basename, group)
+# Stored in the dst path as an append-only text file, one line per DST
+# packed: "<dst_basename> <pack_basename> <group>". Later lines override
+# the previous ones of the same DST.
+PackIndex = Dict[str, Tuple[str, str]]
+
+
+
+###
+def get_pack_index_fname(det_name : str) -> str :
+    return f"{det_name}.PackIndex.txt"
+
+
+
+###
+def get_pack_base_fname(det_name   : str,
+                        dst_fnames : List[str],
+                        pack_tag   : str
+                       )          -> str :
+    # File stem of the pack of a job, from the DSTs it packs and the tag of
+    # the run (so the packs of previous runs are never overwritten)
+    pack_key = "\n".join(os.path.basename(dst_fname) for dst_fname in dst_fnames)
+    return f"{det_name}.pack_{pack_tag}_{zlib.crc32(pack_key.encode()):08x}"
+
+
+
+###
+def is_pack_fname(fname : str) -> bool :
+    return ".pack_" in os.path.basename(fname)
+
+
+
+###
+def get_pack_spec(pack_fname : str,
+                  group      : str
+                 )          -> str :
+    return f"{pack_fname}{PACK_GROUP_SEP}{group}"
+
+
+
+###
+def split_pack_spec(dst_spec : str
+                   )        -> Tuple[str, str] :
+    # File name and root node ("/" for a DST, "/<group>/" for a packed point)
+    if PACK_GROUP_SEP not in dst_spec:
+        return dst_spec, "/"
+    pack_fname, group = dst_spec.rsplit(PACK_GROUP_SEP, 1)
+    return pack_fname, f"/{group}/"
+
+
+
+###
+def get_dst_file(dst_spec : str) -> str :
+    # File holding a DST spec (event range of a job DST and / or packed point)
+    return split_pack_spec(split_dst_spec(dst_spec)[0])[0]
+
+
+
+###
+def load_pack_index(pack_index_fname : str
+                   )                -> PackIndex :
+
+    pack_index = {}
+    if not os.path.isfile(pack_index_fname):
+        return pack_index
+
+    with open(pack_index_fname) as pack_index_file:
+        for line in pack_index_file:
+            # Skipping lines not fully written (i.e. by jobs killed while writing)
+            try:
+                dst_name, pack_name, group = line.split()
+                pack_index[dst_name] = (pack_name, group)
+            except ValueError:
+                continue
+
+    return pack_index
+
+
+
+###
+def get_packed_spec(pack_index : PackIndex,
+                    dst_fname  : str
+                   )          -> Optional[str] :
+    # Pack spec of a DST packed (in the same path), None if not packed
+    pack_entry = pack_index.get(os.path.basename(dst_fname))
+    if pack_entry is None:
+        return None
+    pack_name, group = pack_entry
+    return get_pack_spec(os.path.join(os.path.dirname(dst_fname), pack_name), group)
+
+
+
+###
+def get_pack_shell_line(pack_fname       : str,
+                        tar_fname        : str,
+                        pack_index_fname : str,
+                        index_fname      : Optional[str],
+                        num_photons      : int
+                       )                -> str :
+    # Shell command packing the points of the pack_args array of a job script
+    # (init, dst & log files of every point simulated)
+    return '[ ${#pack_args[@]} -gt 0 ] && ' + \
+           f'python {PACK_SCRIPT} {pack_fname} {tar_fname} {pack_index_fname} ' + \
+           f'{index_fname or "none"} {num_photons} "${{pack_args[@]}}"'
+
+
+
+###
+def get_run_fnames(init_fname : str) -> List[str] :
+    # Init macro of a run and the macros it registers (config & vertices)
+    init_content = open(init_fname).read()
+    return [init_fname] + re.findall(r"/nexus/Register(?:Delayed)?Macro\s+(\S+)", init_content)
+
+
+
+###
+def pack_job(pack_fname       : str,
+             tar_fname        : str,
+             pack_index_fname : str,
+             index_fname      : Optional[str],
+             num_photons      : int,
+             point_fnames     : List[Tuple[str, str, str]]
+            )                -> List[str] :
+
+    # Packing the outputs of the points of a job: (init_fname, dst_h5_fname,
+    # log_fname) each. The DSTs go into the groups of a single pack, and the
+    # macros & logs into a single tar, recording every point in the pack index
+    # (and in the completion index with the size of the pack). Only the points
+    # with a readable DST are packed (and their files removed), so the failed
+    # ones keep their files and are simulated again.
+    # Returns the DSTs packed.
+    packed = []
+    tmp_fname = pack_fname + ".tmp"
+    with tb.open_file(tmp_fname, 'w') as pack_file:
+        for init_fname, dst_h5_fname, log_fname in point_fnames:
+            group = f"point_{len(packed)}"
+            try:
+                with tb.open_file(dst_h5_fname, 'r') as dst_file:
+                    sns_response = dst_file.get_node(PACK_NODE + "/sns_response")
+                    if sns_response.nrows:
+                        sns_response.read(sns_response.nrows - 1, sns_response.nrows)
+                    pack_group = pack_file.create_group("/", group)
+                    dst_file.copy_node(PACK_NODE, newparent = pack_group, recursive = True)
+                    if PACK_NODE[1:] not in pack_file.root:
+                        root_group = pack_file.create_group("/", PACK_NODE[1:])
+                        for node in PACK_ROOT_NODES:
+                            dst_file.copy_node(f"{PACK_NODE}/{node}", newparent = root_group)
+            except Exception:
+                if group in pack_file.root: pack_file.remove_node("/", group, recursive = True)
+                print(f"  WARNING: {dst_h5_fname} NOT packed")
+                continue
+            packed.append((init_fname, dst_h5_fname, log_fname, group))
+
+    if not packed:
+        os.remove(tmp_fname)
+        return []
+    os.replace(tmp_fname, pack_fname)
+
+    # Recording the points packed by their DST basename (the pack
+    # being in their dst path)
+    pack_size = os.path.getsize(pack_fname)
+    with open(pack_index_fname, 'a') as pack_index_file:
+        for _, dst_h5_fname, _, group in packed:
+            pack_index_file.write(f"{os.path.basename(dst_h5_fname)} " +
+                                  f"{os.path.basename(pack_fname)} {group}\n")
+    if index_fname:
+        for _, dst_h5_fname, _, _ in packed:
+            add_to_completion_index(index_fname, dst_h5_fname, num_photons, pack_size)
+
+    # Macros & logs of the points packed into the tar
+    with tarfile.open(tar_fname, 'w') as tar_file:
+        for init_fname, _, log_fname, _ in packed:
+            for fname in get_run_fnames(init_fname) + [log_fname]:
+                tar_file.add(fname, arcname = os.path.basename(fname))
+
+    for init_fname, dst_h5_fname, log_fname, _ in packed:
+        for fname in get_run_fnames(init_fname) + [log_fname, dst_h5_fname]:
+            os.remove(fname)
+
+    return [dst_h5_fname for _, dst_h5_fname, _, _ in packed]
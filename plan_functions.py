@@ -0,0 +1,393 @@
+import os
+import pickle
+
+import numpy      as np
+from   typing import Dict
+from   typing import List
+from   typing import Tuple
+from   typing import Callable
+from   typing import Optional
+
+# Specific LightTable stuff
+from general_functions import get_host_name
+from pos_functions     import get_table_positions
+from pos_functions     import get_position_tuples
+from symmetry_functions import get_folded_positions
+from metrics_functions import timer
+from vertex_functions  import get_dst_spec
+from vertex_functions  import get_job_base_fname
+from vertex_functions  import get_vertex_event_ranges
+from pack_functions    import load_pack_index
+from pack_functions    import get_pack_index_fname
+from pack_functions    import get_packed_spec
+from cost_functions    import CostModel
+from cost_functions    import get_point_seconds
+from cost_functions    import pack_jobs
+
+
+# A campaign plan is a Dict with:
+#   'settings'    : the table settings (and host) the plan was made for
+#   'positions'   : structured array with the positions to be simulated
+#   'symmetry'    : sensor plane symmetry the table is folded with (or None)
+#   'table_positions' : structured array with the table positions, the same
+#                   as 'positions' unless the table is folded
+#   'config_path', 'log_path', 'dst_path', 'table_path' : the working paths
+#   'base_fnames' : file stem of every point
+#   'jobs'        : list of jobs, each one the list of its point indices
+#                   (points_per_job points, or packed to a target wall time)
+#   'events_per_vertex' : events of every point of the multi-vertex jobs,
+#                   which simulate all their points in a single nexus run
+#                   (None if every point is run on its own)
+#   'job_base_fnames' : file stem of every multi-vertex job (or None)
+#   'refined_grid' : True if made for the table positions given (the ones of
+#                   a refined grid) instead of the generated ones
+#   'cost_model'  : cost model the jobs were packed with (or None)
+CampaignPlan = Dict
+
+
+
+###
+def get_working_paths(det_name : str
+                     )        -> Tuple[str, str, str, str] :
+
+    # Getting local host
+    host = get_host_name()
+
+    # Setting base PATH
+    if host == "local":
+        base_path = f"/Users/Javi/Development/NextLightTable/data/{det_name}/"
+
+    elif host == "majorana":
+        base_path = f"/home/jmunoz/Development/NextLightTable/data/{det_name}/"
+
+    elif host == "neutrinos":
+        base_path = f"./NextLightTable/data/{det_name}/"
+
+    elif host == "harvard":
+        base_path = f"/n/holystore01/LABS/guenette_lab/Users/jmunozv/Development/NextLightTable/data/{det_name}/"
+
+    else:
+        print("get_working_paths::Not valid host name.")
+        exit(0)
+
+    if not os.path.isdir(base_path): os.makedirs(base_path)
+
+    # Making working PATHs
+    config_path = base_path + 'config/'
+    if not os.path.isdir(config_path): os.makedirs(config_path)
+
+    log_path = base_path    + 'log/'
+    if not os.path.isdir(log_path): os.makedirs(log_path)
+
+    dst_path = base_path    + 'dst/'
+    if not os.path.isdir(dst_path): os.makedirs(dst_path)
+
+    table_path = base_path  + 'table/'
+    if not os.path.isdir(table_path): os.makedirs(table_path)
+
+    return config_path, log_path, dst_path, table_path
+
+
+
+###
+def get_base_fname(det_name : str,
+                   pos      : Tuple[float, float, float]
+                  )        -> str :
+    return f"{det_name}.x_{pos[0]}.y_{pos[1]}.z_{pos[2]}"
+
+
+
+###
+def get_fnames(det_name : str,
+               pos      : Tuple[float, float, float]
+              )        -> Tuple[str, str, str, str] :
+    
+    config_path, log_path, dst_path, table_path = get_working_paths(det_name)
+    
+    base_fname = get_base_fname(det_name, pos)
+    
+    init_fname   = config_path + base_fname + ".init"
+    config_fname = config_path + base_fname + ".config"
+    log_fname    = log_path    + base_fname + ".log"
+    dst_fname    = dst_path    + base_fname + ".next"
+  
+    return init_fname, config_fname, log_fname, dst_fname
+
+
+
+###
+def get_plan_fname(det_name    : str,
+                   table_type  : str,
+                   signal_type : str
+                  )           -> str :
+    return f"{det_name}.{table_type}.{signal_type}.CampaignPlan.pkl"
+
+
+
+###
+def get_plan_settings(det_name         : str,
+                      table_type       : str,
+                      signal_type      : str,
+                      pitch            : Tuple[float, float, float],
+                      tracking_maxDist : float,
+                      points_per_job   : int,
+                      symmetry         : Optional[str],
+                      events_per_vertex: Optional[int]   = None,
+                      job_target_minutes: Optional[float] = None,
+                      job_point_photons: Optional[int]   = None
+                     )                -> Dict :
+    return {'host'             : get_host_name(),
+            'det_name'         : det_name,
+            'table_type'       : table_type,
+            'signal_type'      : signal_type,
+            'pitch'            : tuple(pitch),
+            'tracking_maxDist' : tracking_maxDist,
+            'points_per_job'   : points_per_job,
+            'symmetry'         : symmetry,
+            'events_per_vertex': events_per_vertex,
+            'job_target_minutes': job_target_minutes,
+            'job_point_photons': job_point_photons if job_target_minutes else None}
+
+
+
+###
+def get_point_jobs(points         : List[int],
+                   points_per_job : int,
+                   point_seconds  : Optional[np.ndarray] = None,
+                   target_seconds : Optional[float]      = None,
+                   multi_vertex   : bool                 = False
+                  )              -> List[List[int]] :
+    # Jobs of the points given, in their order: points_per_job points each, or
+    # packed to target_seconds of predicted wall time (point_seconds of every point)
+    if target_seconds:
+        return [[points[idx] for idx in job]
+                for job in pack_jobs(np.asarray(point_seconds), target_seconds, multi_vertex)]
+    return [points[first_idx : first_idx + points_per_job]
+            for first_idx in range(0, len(points), points_per_job)]
+
+
+
+###
+def make_campaign_plan(det_name         : str,
+                       table_type       : str,
+                       signal_type      : str,
+                       pitch            : Tuple[float, float, float],
+                       tracking_maxDist : float,
+                       points_per_job   : int           = 1,
+                       symmetry         : Optional[str] = None,
+                       events_per_vertex: Optional[int] = None,
+                       job_target_minutes: Optional[float]     = None,
+                       job_point_photons: Optional[int]       = None,
+                       cost_model       : Optional[CostModel] = None,
+                       positions        : Optional[np.ndarray] = None
+                      )                -> CampaignPlan :
+
+    # With job_target_minutes, the points are packed into jobs of that predicted
+    # wall time (simulating job_point_photons per point) instead of points_per_job.
+    # The table positions given (i.e. the ones of a refined grid) override the
+    # generated ones.
+    settings = get_plan_settings(det_name, table_type, signal_type, pitch,
+                                 tracking_maxDist, points_per_job, symmetry,
+                                 events_per_vertex, job_target_minutes, job_point_photons)
+
+    # Only the fundamental domain (and a few check points) of folded tables is simulated
+    refined_grid = positions is not None
+    with timer("position_generation"):
+        table_positions = positions
+        if table_positions is None:
+            table_positions = get_table_positions(det_name, table_type, signal_type, pitch,
+                                                  tracking_maxDist, symmetry)
+        positions = table_positions
+        if symmetry is not None:
+            positions = get_folded_positions(table_positions, symmetry)
+
+    config_path, log_path, dst_path, table_path = get_working_paths(det_name)
+
+    base_fnames = [get_base_fname(det_name, pos) for pos in get_position_tuples(positions)]
+    jobs        = get_point_jobs(list(range(len(positions))), points_per_job)
+    if job_target_minutes:
+        assert cost_model is not None, "Packing jobs needs a cost model"
+        with timer("job_packing"):
+            point_seconds = get_point_seconds(cost_model, positions, job_point_photons)
+            jobs          = get_point_jobs(list(range(len(positions))), points_per_job,
+                                           point_seconds, 60. * job_target_minutes,
+                                           events_per_vertex is not None)
+
+    job_base_fnames = None
+    if events_per_vertex:
+        job_base_fnames = [get_job_base_fname(det_name, [base_fnames[point_idx] for point_idx in job],
+                                              events_per_vertex)
+                           for job in jobs]
+
+    return {'settings'    : settings,
+            'positions'   : positions,
+            'symmetry'    : symmetry,
+            'table_positions' : table_positions,
+            'config_path' : config_path,
+            'log_path'    : log_path,
+            'dst_path'    : dst_path,
+            'table_path'  : table_path,
+            'base_fnames' : base_fnames,
+            'jobs'        : jobs,
+            'events_per_vertex' : events_per_vertex,
+            'job_base_fnames'   : job_base_fnames,
+            'refined_grid'      : refined_grid,
+            'cost_model'        : cost_model if job_target_minutes else None}
+
+
+
+###
+def save_campaign_plan(plan_fname : str,
+                       plan       : CampaignPlan
+                      )          -> None :
+    tmp_fname = plan_fname + ".tmp"
+    with open(tmp_fname, 'wb') as plan_file:
+        pickle.dump(plan, plan_file, protocol = pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_fname, plan_fname)
+
+
+
+###
+def get_campaign_plan(det_name         : str,
+                      table_type       : str,
+                      signal_type      : str,
+                      pitch            : Tuple[float, float, float],
+                      tracking_maxDist : float,
+                      points_per_job   : int           = 1,
+                      symmetry         : Optional[str] = None,
+                      events_per_vertex: Optional[int] = None,
+                      job_target_minutes: Optional[float]     = None,
+                      job_point_photons: Optional[int]       = None,
+                      cost_model       : Optional[CostModel] = None,
+                      positions        : Optional[np.ndarray] = None,
+                      fit_model        : Optional[Callable[[], CostModel]] = None
+                     )                -> CampaignPlan :
+
+    # Loading the stored plan if it was made with the same settings (and
+    # table positions, if given), otherwise making (and storing) a new one.
+    # A cost model given (i.e. refitted) always re-makes the plan, and with
+    # none it is fitted with fit_model only if the plan is re-made with
+    # job_target_minutes, as fitting it reads all the logs.
+    config_path, _, _, _ = get_working_paths(det_name)
+    plan_fname = config_path + get_plan_fname(det_name, table_type, signal_type)
+
+    settings = get_plan_settings(det_name, table_type, signal_type, pitch,
+                                 tracking_maxDist, points_per_job, symmetry,
+                                 events_per_vertex, job_target_minutes, job_point_photons)
+
+    try:
+        with open(plan_fname, 'rb') as plan_file:
+            plan = pickle.load(plan_file)
+        if positions is None: same_positions = not plan.get('refined_grid')
+        else                : same_positions = np.array_equal(plan['table_positions'], positions)
+        if (plan['settings'] == settings) and same_positions:
+            if cost_model is None:
+                return plan
+            print(f"  Re-making campaign plan {plan_fname} with the cost model refitted ...")
+        else:
+            print(f"  Campaign plan {plan_fname} made with other settings. Re-making it ...")
+    except FileNotFoundError:
+        pass
+    except Exception:
+        print(f"  WARNING: {plan_fname} corrupted. Re-making it ...")
+
+    if job_target_minutes and (cost_model is None) and (fit_model is not None):
+        with timer("cost_model"):
+            cost_model = fit_model()
+
+    plan = make_campaign_plan(det_name, table_type, signal_type, pitch,
+                              tracking_maxDist, points_per_job, symmetry,
+                              events_per_vertex, job_target_minutes, job_point_photons,
+                              cost_model, positions)
+    save_campaign_plan(plan_fname, plan)
+
+    return plan
+
+
+
+###
+def get_plan_fnames(plan      : CampaignPlan,
+                    point_idx : int,
+                    tag       : Optional[str] = None
+                   )         -> Tuple[str, str, str, str] :
+
+    # Same as get_fnames, but with no file system access.
+    # Tagged file names are the ones of the extra DSTs of the point
+    # (<stem>.next.<tag>.h5), combined with the main one at build time.
+    base_fname = plan['base_fnames'][point_idx]
+    tag_str    = f".{tag}" if tag else ""
+
+    init_fname   = plan['config_path'] + base_fname + tag_str + ".init"
+    config_fname = plan['config_path'] + base_fname + tag_str + ".config"
+    log_fname    = plan['log_path']    + base_fname + tag_str + ".log"
+    dst_fname    = plan['dst_path']    + base_fname + ".next" + tag_str
+
+    return init_fname, config_fname, log_fname, dst_fname
+
+
+
+###
+def get_job_fnames(plan   : CampaignPlan,
+                   job_id : int,
+                   tag    : Optional[str] = None
+                  )      -> Tuple[str, str, str, str, str] :
+
+    # Same as get_plan_fnames for a multi-vertex job, plus its vertices macro.
+    # Tagged file names are the ones of the shards of the job.
+    base_fname = plan['job_base_fnames'][job_id]
+    tag_str    = f".{tag}" if tag else ""
+
+    init_fname     = plan['config_path'] + base_fname + tag_str + ".init"
+    config_fname   = plan['config_path'] + base_fname + tag_str + ".config"
+    vertices_fname = plan['config_path'] + base_fname + tag_str + ".vertices"
+    log_fname      = plan['log_path']    + base_fname + tag_str + ".log"
+    dst_fname      = plan['dst_path']    + base_fname + ".next" + tag_str
+
+    return init_fname, config_fname, vertices_fname, log_fname, dst_fname
+
+
+
+###
+def get_plan_dst_fnames(plan : CampaignPlan
+                       )    -> List[str] :
+    return [plan['dst_path'] + base_fname + ".next.h5" for base_fname in plan['base_fnames']]
+
+
+
+###
+def get_point_dst_sets(plan : CampaignPlan
+                      )    -> List[List[str]] :
+
+    # DSTs of every point: the main one (<stem>.next.h5) followed by the extra
+    # ones (<stem>.next.<tag>.h5), got from a single listing of the dst path.
+    # The points of multi-vertex jobs get the event range of every job DST
+    # with their events (<job_stem>.next[.<tag>].h5@<first_event>:<stop_event>).
+    # The DSTs packed (and not simulated again since) are read from their
+    # pack (<pack_fname>#<group>).
+    dst_names = {}
+    for dst_name in os.listdir(plan['dst_path']):
+        if dst_name.endswith(".h5") and (".next" in dst_name):
+            dst_names[dst_name] = plan['dst_path'] + dst_name
+
+    pack_index = load_pack_index(plan['dst_path'] +
+                                 get_pack_index_fname(plan['settings']['det_name']))
+    for dst_name in pack_index:
+        if dst_name not in dst_names:
+            dst_names[dst_name] = get_packed_spec(pack_index, plan['dst_path'] + dst_name)
+
+    dst_sets = {}
+    for dst_name in sorted(dst_names):
+        base_fname = dst_name.split(".next")[0]
+        dst_sets.setdefault(base_fname, []).append(dst_names[dst_name])
+
+    if not plan.get('events_per_vertex'):
+        return [dst_sets.get(base_fname, []) for base_fname in plan['base_fnames']]
+
+    point_dst_sets = [[] for _ in plan['base_fnames']]
+    for job, job_base_fname in zip(plan['jobs'], plan['job_base_fnames']):
+        event_ranges = get_vertex_event_ranges(len(job), plan['events_per_vertex'])
+        for dst_fname in dst_sets.get(job_base_fname, []):
+            for point_idx, (first_event, stop_event) in zip(job, event_ranges):
+                point_dst_sets[point_idx].append(get_dst_spec(dst_fname, first_event, stop_event))
+
+    return point_dst_sets
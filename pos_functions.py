@@ -2,22 +2,47 @@ import numpy    as np
 
 from typing import List
 from typing import Tuple
-from math   import sqrt
+from typing import Optional
 
 from detectors import get_detector_dimensions
 
 
 
+###
+def make_positions(xs : np.ndarray,
+                   ys : np.ndarray,
+                   zs : np.ndarray
+                  )  -> np.ndarray :
+
+    # Structured array of positions with fields (x, y, z), keeping the dtype
+    # of every coordinate so integer positions stay integers.
+    positions = np.empty(len(xs), dtype = [('x', xs.dtype), ('y', ys.dtype), ('z', zs.dtype)])
+    positions['x'] = xs
+    positions['y'] = ys
+    positions['z'] = zs
+    return positions
+
+
+
+###
+def get_position_tuples(positions : np.ndarray
+                       )         -> List[Tuple[float, float, float]] :
+    # Compatibility view of the positions as a list of (x, y, z) tuples
+    return positions.tolist()
+
+
+
 ###
 def get_table_positions(det_name        : str,
                         table_type      : str,
                         signal_type     : str,
                         pitch           : Tuple[float, float, float],
-                        tracking_maxDist: float
-                       )               -> List[Tuple[float, float, float]] :
+                        tracking_maxDist: float,
+                        symmetry        : Optional[str] = None
+                       )               -> np.ndarray :
     
     if table_type == "energy":
-        return get_energy_table_positions(det_name, signal_type, pitch)
+        return get_energy_table_positions(det_name, signal_type, pitch, symmetry)
     
     elif table_type == "tracking":
         return get_tracking_table_positions(det_name, pitch, tracking_maxDist)
@@ -27,8 +52,9 @@ def get_table_positions(det_name        : str,
 ###
 def get_energy_table_positions(det_name    : str,
                                signal_type : str,
-                               pitch       : Tuple[float, float, float]
-                              )           -> List[Tuple[float, float, float]] :
+                               pitch       : Tuple[float, float, float],
+                               symmetry    : Optional[str] = None
+                              )           -> np.ndarray :
     
     # Getting detector dimensions
     det_dim = get_detector_dimensions(det_name)
@@ -36,28 +62,40 @@ def get_energy_table_positions(det_name    : str,
     det_len = int(det_dim["ACTIVE_length"] + det_dim["BUFFER_length"])
     det_el  = int(det_dim["EL_gap"])
 
-    # Getting table pitch
+    # Getting table pitch
     pitch_x = int(pitch[0])
     pitch_y = int(pitch[1])
     pitch_z = int(pitch[2])
     
-    # Generating positions
-    positions = []
-    for x in range(-det_rad, det_rad, pitch_x):
-        for y in range(-det_rad, det_rad, pitch_y):
-            # Checking if current point fits into ACTIVE
-            pos_rad = sqrt(x**2 + y**2)
-            if (pos_rad < det_rad):
-                # Generating S2 table (from the center of the EL gap)
-                if signal_type == "S2":
-                    positions.append((x, y, -det_el/2.))
-                
-                # Generating S1 table
-                else:
-                    for z in range(0, det_len, pitch_z):
-                        positions.append((x, y, z))
+    # Generating the XY grid, keeping the points that fit into ACTIVE.
+    # Grids to be folded are centered at the origin, so every symmetry op
+    # maps grid points into grid points.
+    min_x, min_y = -det_rad, -det_rad
+    if symmetry is not None:
+        assert (symmetry != 'octant') or (pitch_x == pitch_y), \
+            "pitch_x must be equal to pitch_y for octant symmetry"
+        min_x = -(det_rad // pitch_x) * pitch_x
+        min_y = -(det_rad // pitch_y) * pitch_y
+
+    grid_x, grid_y = np.meshgrid(np.arange(min_x, det_rad, pitch_x),
+                                 np.arange(min_y, det_rad, pitch_y),
+                                 indexing = 'ij')
+    in_active = (grid_x**2 + grid_y**2) < det_rad**2
+    xs = grid_x[in_active]
+    ys = grid_y[in_active]
+
+    # Generating S2 table (from the center of the EL gap)
+    if signal_type == "S2":
+        zs = np.full(len(xs), -det_el/2.)
+
+    # Generating S1 table
+    else:
+        z_range = np.arange(0, det_len, pitch_z)
+        xs = np.repeat(xs, len(z_range))
+        ys = np.repeat(ys, len(z_range))
+        zs = np.tile(z_range, in_active.sum())
             
-    return positions
+    return make_positions(xs, ys, zs)
 
 
 
@@ -65,7 +103,7 @@ def get_energy_table_positions(det_name    : str,
 def get_tracking_table_positions(det_name        : str,
                                  pitch           : Tuple[float, float, float],
                                  tracking_maxDist: float
-                                )               -> List[Tuple[float, float, float]] :
+                                )               -> np.ndarray :
         
     # Getting detector dimensions
     det_dim = get_detector_dimensions(det_name)
@@ -76,7 +114,7 @@ def get_tracking_table_positions(det_name        : str,
     sns_pos_x       = sns_pos[0]
     sns_pos_y       = sns_pos[1]
     
-    # Getting table pitch
+    # Getting table pitch
     pitch_x = int(pitch[0])
     pitch_y = int(pitch[1])
     pitch_z = int(pitch[2])
@@ -84,9 +122,11 @@ def get_tracking_table_positions(det_name        : str,
     assert (pitch_z <= det_el),  "pitch_z must be equal or lower to detector EL GAP"
     
     # Generating positions
-    positions = []
-    for dist_xy in range(0, tracking_maxDist, pitch_x):
-        for z in np.arange(pitch_z/2., det_el, pitch_z):
-            positions.append((sns_pos_x + dist_xy, sns_pos_y, -z))
+    dist_xys = np.arange(0, tracking_maxDist, pitch_x)
+    z_range  = np.arange(pitch_z/2., det_el, pitch_z)
 
-    return positions
+    xs = np.repeat(sns_pos_x + dist_xys, len(z_range)).astype(float)
+    ys = np.full(len(xs), float(sns_pos_y))
+    zs = np.tile(-z_range, len(dist_xys))
+
+    return make_positions(xs, ys, zs)
@@ -0,0 +1,29 @@
+"""
+This SCRIPT reduces a DST right after its simulation (run by the job scripts
+with on-node reduction), keeping the raw DST in raw_path if given.
+"""
+
+# General Importings
+import sys
+
+# Light Table stuff
+from reduction_functions import reduce_dst_file
+
+
+
+#################### SETTINGS ####################
+try:
+    dst_fname, raw_path = sys.argv[1:3]
+    sensor_names        = sys.argv[3:]
+    assert sensor_names
+except (ValueError, AssertionError):
+    print("\nUsage: python reduceDST.py dst.h5 raw_path|none sensor_name [sensor_name ...]\n")
+    sys.exit(1)
+
+
+
+#################### REDUCING DST ####################
+
+num_rows = reduce_dst_file(dst_fname, sensor_names, None if raw_path == "none" else raw_path)
+
+print(f"*** Reduced {num_rows} sensor response rows of {dst_fname}")
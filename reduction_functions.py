@@ -0,0 +1,124 @@
+import os
+import shutil
+
+import numpy      as np
+import tables     as tb
+from   typing import List
+from   typing import Optional
+
+# Specific LightTable stuff
+from pack_functions   import split_pack_spec
+from vertex_functions import split_dst_spec
+
+
+# DST nodes of a reduced DST: the configuration and sensor positions are
+# copied, and the sensor response is reduced to one row per event & sensor
+# (the sensors of the names reduced, listed in its reduced_sensors attribute)
+CONFIGURATION_NODE = "/MC/configuration"
+SNS_POSITIONS_NODE = "/MC/sns_positions"
+SNS_RESPONSE_NODE  = "/MC/sns_response"
+
+# Number of sensor response rows reduced at once
+REDUCE_CHUNK_ROWS = 1000000
+
+# Sub-directory of the dst path the raw DSTs reduced are kept in
+RAW_DST_DIR = "raw/"
+
+# Python reducer run by the job scripts after every nexus run
+REDUCE_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "reduceDST.py")
+
+
+
+###
+def get_raw_dst_path(dst_fname : str) -> str :
+    return os.path.join(os.path.dirname(dst_fname), RAW_DST_DIR)
+
+
+
+###
+def reduce_dst_file(dst_fname    : str,
+                    sensor_names : List[str],
+                    raw_path     : Optional[str] = None
+                   )            -> int :
+
+    # Replacing a DST by its reduction: the charge of the sensor_names sensors
+    # summed over the time bins of every event, so the table builders (and
+    # every other DST reader) read a few KBs per point with no change.
+    # The raw DST is moved into raw_path (removed if None).
+    # Returns the number of sensor response rows reduced.
+    with tb.open_file(dst_fname, 'r') as dst_file:
+        sns_positions = dst_file.get_node(SNS_POSITIONS_NODE).read()
+        sensor_ids    = np.sort(sns_positions['sensor_id'][
+            np.isin(sns_positions['sensor_name'], [name.encode() for name in sensor_names])])
+        assert len(sensor_ids), f"No {sensor_names} sensors in {dst_fname}"
+
+        # (event, sensor) & charge of every row of the sensors reduced,
+        # summed once all the chunks are read
+        sns_response = dst_file.get_node(SNS_RESPONSE_NODE)
+        keys, charges = [np.zeros(0, dtype = np.int64)], [np.zeros(0)]
+        for start in range(0, sns_response.nrows, REDUCE_CHUNK_ROWS):
+            chunk = sns_response.read(start, start + REDUCE_CHUNK_ROWS)
+            cols  = np.searchsorted(sensor_ids, chunk['sensor_id']).clip(max = len(sensor_ids) - 1)
+            found = sensor_ids[cols] == chunk['sensor_id']
+            keys   .append(chunk['event_id'][found] * len(sensor_ids) + cols[found])
+            charges.append(chunk['charge']  [found])
+
+        keys, key_idxs = np.unique(np.concatenate(keys), return_inverse = True)
+        reduced = np.zeros(len(keys), dtype = sns_response.dtype)
+        reduced['event_id']  = keys // len(sensor_ids)
+        reduced['sensor_id'] = sensor_ids[keys % len(sensor_ids)]
+        reduced['charge']    = np.bincount(key_idxs, weights   = np.concatenate(charges),
+                                                     minlength = len(keys))
+        num_rows = sns_response.nrows
+
+        # Written to a temporary file first, so a job killed while reducing
+        # never leaves a truncated DST behind
+        tmp_fname = dst_fname + ".tmp"
+        with tb.open_file(tmp_fname, 'w') as reduced_file:
+            mc_group = reduced_file.create_group("/", "MC")
+            dst_file.copy_node(CONFIGURATION_NODE, newparent = mc_group)
+            dst_file.copy_node(SNS_POSITIONS_NODE, newparent = mc_group)
+            reduced_table = reduced_file.create_table(mc_group, "sns_response", reduced)
+            reduced_table.attrs.reduced_sensors = " ".join(sensor_names)
+
+    # The raw path may be in another file system than the DST (i.e. a DST
+    # reduced in the node scratch), copying the raw DST there if needed
+    if raw_path:
+        if not os.path.isdir(raw_path): os.makedirs(raw_path, exist_ok = True)
+        shutil.move(dst_fname, os.path.join(raw_path, os.path.basename(dst_fname)))
+    os.replace(tmp_fname, dst_fname)
+
+    return num_rows
+
+
+
+###
+def get_reduced_sensors(dst_fname : str) -> Optional[List[str]] :
+    # Sensor names kept by the reduction of a DST (spec), None if not reduced
+    dst_file_fname, dst_root = split_pack_spec(split_dst_spec(dst_fname)[0])
+    with tb.open_file(dst_file_fname, 'r') as dst_file:
+        sns_response = dst_file.get_node(dst_root + SNS_RESPONSE_NODE[1:])
+        if "reduced_sensors" not in sns_response.attrs:
+            return None
+        return sns_response.attrs.reduced_sensors.split()
+
+
+
+###
+def check_reduced_sensors(dst_fname   : str,
+                          sensor_name : str
+                         )           -> None :
+    # A table can not be built from DSTs reduced without its sensors
+    reduced_sensors = get_reduced_sensors(dst_fname)
+    assert (reduced_sensors is None) or (sensor_name in reduced_sensors), \
+        f"{dst_fname} reduced with no {sensor_name} sensors (only {reduced_sensors})"
+
+
+
+###
+def get_reduce_shell_line(dst_h5_fname : str,
+                          sensor_names : List[str],
+                          raw_path     : Optional[str] = None
+                         )            -> str :
+    # Shell command reducing a DST in a job script
+    return f"python {REDUCE_SCRIPT} {dst_h5_fname} {raw_path or 'none'} {' '.join(sensor_names)}"
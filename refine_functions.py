@@ -0,0 +1,155 @@
+import itertools
+
+import numpy      as np
+from   typing import Dict
+from   typing import List
+from   typing import Tuple
+from   typing import Optional
+
+# Specific LightTable stuff
+from plan_functions    import make_campaign_plan
+from plan_functions    import get_point_dst_sets
+from table_functions   import reduce_point_sets
+from table_functions   import get_sensor_ids
+from cache_functions   import ReductionCache
+from metrics_functions import count
+from detectors         import get_detector_dimensions
+
+
+# Position coordinates refined by the energy tables of every signal type
+REFINE_AXES = {'S1': ['x', 'y', 'z'],
+               'S2': ['x', 'y']}
+
+# Fine grid node (indices along the refined axes) -> position index
+LatticeNodes = Dict[Tuple[int, ...], int]
+
+
+
+###
+def get_lattice_origin(det_name    : str,
+                       signal_type : str
+                      )           -> List[int] :
+    # Coordinates of the first node of the uniform table grid along the
+    # refined axes (as generated by get_energy_table_positions)
+    det_rad = int(get_detector_dimensions(det_name)["ACTIVE_radius"])
+    return [-det_rad, -det_rad, 0][:len(REFINE_AXES[signal_type])]
+
+
+
+###
+def get_lattice_nodes(positions   : np.ndarray,
+                      signal_type : str,
+                      pitch       : Tuple[float, float, float],
+                      origin      : List[int]
+                     )           -> LatticeNodes :
+    # Node of the uniform table grid of every position
+    nodes = np.column_stack([(positions[axis] - axis_origin) // int(axis_pitch)
+                             for axis, axis_origin, axis_pitch
+                             in zip(REFINE_AXES[signal_type], origin, pitch)]).astype(int)
+    return {tuple(node): pos_idx for pos_idx, node in enumerate(nodes.tolist())}
+
+
+
+###
+def get_cell_nodes(low_node  : Tuple[int, ...],
+                   cell_step : int,
+                   divisions : int = 1
+                  )         -> List[Tuple[int, ...]] :
+    # Nodes of a cell of cell_step nodes per side: its corners (divisions = 1),
+    # or the ones of its sub-cells (divisions = 2)
+    offsets = range(0, cell_step + 1, cell_step // divisions)
+    return [tuple(low + offset for low, offset in zip(low_node, node_offsets))
+            for node_offsets in itertools.product(offsets, repeat = len(low_node))]
+
+
+
+###
+def get_cell_error(corner_values : List[np.ndarray],
+                   max_values    : np.ndarray
+                  )             -> float :
+    # Max. spread of the response of every sensor over the corners of a cell,
+    # relative to the max. response of the sensor, bounding the error of any
+    # interpolation within the cell
+    corner_values = np.array(corner_values)
+    with np.errstate(invalid = 'ignore', divide = 'ignore'):
+        rel_spreads = np.ptp(corner_values, axis = 0) / max_values
+    return float(np.nanmax(rel_spreads, initial = 0.))
+
+
+
+###
+def get_refined_positions(det_name      : str,
+                          signal_type   : str,
+                          sensor_name   : str,
+                          pitch         : Tuple[float, float, float],
+                          refine_levels : int,
+                          tolerance     : float,
+                          num_workers   : int                      = 1,
+                          cache         : Optional[ReductionCache] = None
+                         )             -> np.ndarray :
+
+    # Positions of an energy table grid refined where its response changes the
+    # most, quadtree (S2) / octree (S1) style: a coarse grid (of pitch * 2^refine_levels)
+    # whose cells are split in 2 along every axis, down to pitch, when the
+    # response of any sensor_name sensor changes over their corners more than
+    # tolerance (relative to the max. response of the sensor), or when they
+    # cross the ACTIVE boundary. All the positions are nodes of the uniform grid.
+    # Cells are only split once all their corners have been simulated, so the
+    # grid is refined by one level (at least) every run of the simulations,
+    # every level with the response of the points simulated by the previous runs.
+    fine_plan      = make_campaign_plan(det_name, "energy", signal_type, pitch, 0)
+    fine_positions = fine_plan['positions']
+    fine_dst_sets  = get_point_dst_sets(fine_plan)
+    origin         = get_lattice_origin(det_name, signal_type)
+    fine_nodes     = get_lattice_nodes(fine_positions, signal_type, pitch, origin)
+
+    # Coarse grid nodes, and the cells with any of them as corner
+    coarse_step = 2**refine_levels
+    selected    = {node for node in fine_nodes if all(idx % coarse_step == 0 for idx in node)}
+    cells       = {tuple(idx - offset for idx, offset in zip(node, corner_offsets))
+                   for node in selected
+                   for corner_offsets in itertools.product((0, coarse_step), repeat = len(origin))}
+
+    # Response (charge / photon of every sensor) of the selected nodes simulated
+    node_values = {}
+    sensor_ids  = None
+    for cell_step in (2**level for level in range(refine_levels, 0, -1)):
+
+        new_nodes = sorted(node for node in selected if node not in node_values)
+        dst_sets  = [fine_dst_sets[fine_nodes[node]] for node in new_nodes]
+        if sensor_ids is None:
+            first_dst_set = next((dst_set for dst_set in dst_sets if dst_set), None)
+            if first_dst_set is None:
+                break
+            sensor_ids = get_sensor_ids(first_dst_set[0], sensor_name)
+
+        for node, point_data in zip(new_nodes, reduce_point_sets(dst_sets, sensor_ids,
+                                                                  num_workers, cache)):
+            if point_data is not None:
+                node_values[node] = point_data[1] / point_data[0]
+        if not node_values:
+            break
+        max_values = np.max(list(node_values.values()), axis = 0)
+
+        # Splitting the cells with all their corners in ACTIVE simulated
+        split_cells = set()
+        for low_node in cells:
+            corners = [node for node in get_cell_nodes(low_node, cell_step) if node in fine_nodes]
+            if any(node not in node_values for node in corners):
+                count("cells_pending")
+                continue
+            crosses_boundary = len(corners) < 2**len(low_node)
+            if crosses_boundary or \
+               (get_cell_error([node_values[node] for node in corners], max_values) > tolerance):
+                split_cells.add(low_node)
+
+        count("cells_split", len(split_cells))
+        selected |= {node for low_node in split_cells
+                     for node in get_cell_nodes(low_node, cell_step, 2) if node in fine_nodes}
+        cells     = {sub_node for low_node in split_cells
+                     for sub_node in get_cell_nodes(low_node, cell_step // 2)}
+        if not cells:
+            break
+
+    # In the order of the uniform grid
+    return fine_positions[sorted(fine_nodes[node] for node in selected)]
@@ -1,23 +1,57 @@
 import sys
 import os
-import subprocess
+import re
 
 import pandas     as pd
 from   typing import List
-from   time   import sleep
+from   typing import Tuple
+from   typing import Union
+from   typing import Optional
 
 # Specific LightTable stuff
+from general_functions import NEXUS_PATHS
+from general_functions import SLURM_TIME_LIMIT_MINUTES
 from general_functions import get_host_name
 from general_functions import get_seed
 from general_functions import give_tmp_harvard_path
+from cache_functions   import get_dst_stamp
+from index_functions   import CompletionIndex
+from index_functions   import add_to_completion_index
+from index_functions   import get_completed_photons
+from pack_functions    import get_pack_shell_line
+from reduction_functions import get_reduce_shell_line
+from reduction_functions import get_raw_dst_path
+from reduction_functions import RAW_DST_DIR
+from pack_functions    import PackIndex
+from pack_functions    import split_pack_spec
+from pack_functions    import get_packed_spec
+from pack_functions    import get_dst_file
 
 
 
 ###
-def make_init_file(det_name     : str,
-                   init_fname   : str,
-                   config_fname : str
-                  )            -> None :
+def get_detector_string(det_name : str) -> str :
+
+    # Detector String for parameters
+    if   ("NEXT_NEW" == det_name): det_str = "NextNew"
+    elif ("DEMOpp"   in det_name): det_str = "NextDemo"
+    elif ("NEXT100"  == det_name): det_str = "Next100"
+    elif ("FLEX"     in det_name): det_str = "NextFlex"
+    elif ("TEST"     == det_name): det_str = "NextFlex"
+    else:
+        print(f"{det_name} is not a valid detector.")
+        sys.exit()
+
+    return det_str
+
+
+
+###
+def make_init_file(det_name       : str,
+                   init_fname     : str,
+                   config_fname   : str,
+                   vertices_fname : Optional[str] = None
+                  )              -> None :
 
     if   ("NEXT100" == det_name): det_name += "_OPT"         # XXX To be deleted asap
     elif ("DEMOpp"  in det_name): det_name  = "NEXT_DEMO"
@@ -26,7 +60,9 @@ def make_init_file(det_name     : str,
     params = locals()
 
     # Getting & formatting the template
+    # (multi-vertex jobs run their vertices macro after initialization)
     template_file = 'templates/init.mac'
+    if vertices_fname: template_file = 'templates/init.multi_vertex.mac'
     template      = open(template_file).read()
     content       = template.format(**params)
 
@@ -47,6 +83,10 @@ def make_config_file(det_name     : str,
                      num_photons  : int
                     )            -> None :
 
+    # Seed got from the DST name, so every point (and shard) gets its own
+    # reproducible seed
+    seed = get_seed(os.path.basename(dst_fname))
+
     if get_host_name() == "harvard":
         dst_fname = give_tmp_harvard_path(dst_fname)
 
@@ -55,15 +95,7 @@ def make_config_file(det_name     : str,
     geometry_content = open(template_file).read()
 
     # Detector String for parameters
-    if   ("NEXT_NEW" == det_name): det_str = "NextNew"
-    elif ("DEMOpp"   in det_name): det_str = "NextDemo"
-    elif ("NEXT100"  == det_name): det_str = "Next100"
-    elif ("FLEX"     in det_name): det_str = "NextFlex"
-    elif ("TEST"     == det_name): det_str = "NextFlex"
-    else:
-        print(f"{det_name} is not a valid detector.")
-        sys.exit()
-
+    det_str = get_detector_string(det_name)
 
     content  = f"{geometry_content}\n"
     
@@ -82,14 +114,15 @@ def make_config_file(det_name     : str,
     content +=  "/PhysicsList/Nexus/electroluminescence  true\n"
     content +=  "/PhysicsList/Nexus/photoelectric        false\n"
 
+    # (run verbosity 1 logs the summary timing every run, for the cost model)
     content +=  "### VERBOSITIES\n"
     content +=  "/control/verbose   0\n"
-    content +=  "/run/verbose       0\n"
+    content +=  "/run/verbose       1\n"
     content +=  "/event/verbose     0\n"
     content +=  "/tracking/verbose  0\n"
 
     content +=  "### CONTROL\n"
-    content += f"/nexus/random_seed            {get_seed()}\n"
+    content += f"/nexus/random_seed            {seed}\n"
     content +=  "/nexus/persistency/start_id   0\n"
     content += f"/nexus/persistency/outputFile {dst_fname}\n"
 
@@ -101,9 +134,86 @@ def make_config_file(det_name     : str,
 
 
 ###
-def get_num_photons(dst_fname : str) -> int:
+def make_vertices_file(det_name          : str,
+                       vertices_fname    : str,
+                       positions         : List[Tuple[float, float, float]],
+                       events_per_vertex : int
+                      )                 -> None :
+
+    # Vertices macro of a multi-vertex job, run by nexus after initialization:
+    # every vertex but the last one is simulated by its own beamOn, and the
+    # last one by the beamOn of the nexus command line (-n events_per_vertex).
+    # Every vertex writes its events from its own first event id.
+    det_str = get_detector_string(det_name)
+
+    content = "### VERTICES\n"
+    for vertex, pos in enumerate(positions):
+        content += f"# Vertex {vertex}\n"
+        content += f"/Geometry/{det_str}/specific_vertex_X  {pos[0]} mm\n"
+        content += f"/Geometry/{det_str}/specific_vertex_Y  {pos[1]} mm\n"
+        content += f"/Geometry/{det_str}/specific_vertex_Z  {pos[2]} mm\n"
+        content += f"/nexus/persistency/start_id   {vertex * events_per_vertex}\n"
+        if vertex < len(positions) - 1:
+            content += f"/run/beamOn {events_per_vertex}\n"
+
+    vertices_file = open(vertices_fname, 'w')
+    vertices_file.write(content)
+    vertices_file.close()
+
+
+
+###
+def get_run_macro(init_fname : str) -> str :
+
+    # Commands run by nexus with an init macro: the ones of its config macro,
+    # followed by the ones of its vertices macro (multi-vertex jobs)
+    init_content   = open(init_fname).read()
+    config_fname   = re.search(r"/nexus/RegisterMacro\s+(\S+)", init_content).group(1)
+    vertices_fname = re.search(r"/nexus/RegisterDelayedMacro\s+(\S+)", init_content)
+
+    run_macro = open(config_fname).read()
+    if vertices_fname:
+        run_macro += open(vertices_fname.group(1)).read()
+
+    return run_macro
+
+
+
+###
+def get_photons_per_event(dst_fname : Union[str, pd.HDFStore],
+                          dst_root  : str = "/"
+                         )         -> int:
+    # Packed points are read from their group of the pack (dst_root of a store)
+    if isinstance(dst_fname, str):
+        dst_fname, dst_root = split_pack_spec(dst_fname)
+
+    try :
+        mcConfig = pd.read_hdf(dst_fname, dst_root + 'MC/configuration')
+        mcConfig.set_index("param_key", inplace = True)
+        return int(mcConfig.at["/Generator/ScintGenerator/nphotons" , "param_value"])
+    except KeyError:
+        print("  No 'nphotons' info in the config table.")
+        return 0
+    except:
+        print("  File corrupted.")
+        return 0
+
+
+
+###
+def get_num_photons(dst_fname : Union[str, pd.HDFStore, List[str]],
+                    dst_root  : str = "/"
+                   )         -> int:
+    # The photons of a set of DSTs (i.e. the shards of a point) are summed
+    if isinstance(dst_fname, list):
+        return sum(get_num_photons(fname) for fname in dst_fname)
+
+    # Packed points are read from their group of the pack (dst_root of a store)
+    if isinstance(dst_fname, str):
+        dst_fname, dst_root = split_pack_spec(dst_fname)
+
     try :
-        mcConfig = pd.read_hdf(dst_fname, 'MC/configuration')
+        mcConfig = pd.read_hdf(dst_fname, dst_root + 'MC/configuration')
         mcConfig.set_index("param_key", inplace = True)
         num_photons_event = int(mcConfig.at["/Generator/ScintGenerator/nphotons" , "param_value"])
         num_events        = int(mcConfig.at["num_events" , "param_value"])
@@ -117,12 +227,59 @@ def get_num_photons(dst_fname : str) -> int:
 
 
 
+###
+def get_previous_photons(completion_index : CompletionIndex,
+                         index_fname      : str,
+                         dst_fname        : str,
+                         pack_index       : Optional[PackIndex] = None
+                        )                -> Optional[int] :
+
+    # Number of photons of a DST already simulated, None if it does NOT EXIST.
+    # Taken from the completion index, opening the DST only if it is
+    # not indexed or its entry is suspect.
+    # DSTs packed (and not simulated again since) are the point of their pack,
+    # indexed with the size of the pack.
+    dst_spec  = dst_fname
+    dst_stamp = get_dst_stamp(dst_fname)
+    if (dst_stamp is None) and pack_index:
+        dst_spec  = get_packed_spec(pack_index, dst_fname) or dst_fname
+        dst_stamp = get_dst_stamp(get_dst_file(dst_spec))
+    if dst_stamp is None:
+        return None
+
+    dst_size     = dst_stamp[0]
+    prev_photons = get_completed_photons(completion_index, dst_fname, dst_size)
+    if prev_photons is None:
+        prev_photons = get_num_photons(dst_spec)
+        add_to_completion_index(index_fname, dst_fname, prev_photons, dst_size)
+
+    return prev_photons
+
+
+
+###
+def get_reduce_status_line(dst_h5_fname   : str,
+                           reduce_sensors : List[str],
+                           raw_path       : Optional[str]
+                          )              -> str :
+    # Shell line of the job scripts reducing a DST on the node if nexus
+    # succeeded (the point failing if its reduction fails)
+    return f"[ $nexus_status -eq 0 ] && " + \
+           f"{{ {get_reduce_shell_line(dst_h5_fname, reduce_sensors, raw_path)}; nexus_status=$?; }}\n"
+
+
+
 ###
 def make_majorana_script(script_fname : str,
                          exe_path     : str,
                          init_fnames  : List[str],
                          log_fnames   : List[str],
-                         num_evts     : int
+                         num_evts     : int,
+                         index_lines  : Optional[List[str]] = None,
+                         dst_fnames   : Optional[List[str]] = None,
+                         pack_line    : Optional[str]       = None,
+                         reduce_sensors : Optional[List[str]] = None,
+                         keep_raw_dsts  : bool                = True
                         )            -> None :
     
     content  =  ""
@@ -136,8 +293,21 @@ def make_majorana_script(script_fname : str,
     content +=  "source $HOME/.bashrc\n"
     content +=  "source $HOME/.setNEXUS2\n"
 
+    # Packed outputs: the points nexus succeeded in are packed at the end
+    if pack_line: content += "pack_args=()\n"
+
     for i in range(len(init_fnames)):
-        content += f"{exe_path}nexus -b {init_fnames[i]} -n {num_evts} > {log_fnames[i]}\n"
+        content += f"{exe_path}nexus -b {init_fnames[i]} -n {num_evts} > {log_fnames[i]}"
+        # Reducing the DST on the node (reduce_sensors)
+        if reduce_sensors:
+            raw_path = get_raw_dst_path(dst_fnames[i]) if keep_raw_dsts else None
+            content += f" && {get_reduce_shell_line(dst_fnames[i] + '.h5', reduce_sensors, raw_path)}"
+        # Recording the point in the completion index if nexus succeeded
+        if   pack_line  : content += f" && pack_args+=({init_fnames[i]} {dst_fnames[i]}.h5 {log_fnames[i]})"
+        elif index_lines: content += f" && {index_lines[i]}"
+        content +=  "\n"
+
+    if pack_line: content += pack_line + "\n"
 
     script_file = open(script_fname, 'w')
     script_file.write(content)
@@ -151,13 +321,17 @@ def make_harvard_script(script_fname : str,
                         init_fnames  : List[str],
                         dst_fnames   : List[str],
                         log_fnames   : List[str],
-                        num_evts     : int
+                        num_evts     : int,
+                        index_lines  : Optional[List[str]] = None,
+                        pack_line    : Optional[str]       = None,
+                        reduce_sensors : Optional[List[str]] = None,
+                        keep_raw_dsts  : bool                = True
                        )            -> None :
     content = "#!/bin/bash\n"
 
     content += "#SBATCH -n 1               # Number of cores requested\n"
     content += "#SBATCH -N 1               # Ensure that all cores are on one machine\n"
-    content += "#SBATCH -t 2200            # Runtime in minutes\n"
+    content += f"#SBATCH -t {SLURM_TIME_LIMIT_MINUTES}            # Runtime in minutes\n"
     content += "#SBATCH -p guenette        # Partition to submit to\n"
     content += "#SBATCH --mem=1500         # Memory per cpu in MB (see also –mem-per-cpu)\n"
     content += "#SBATCH -o tmp/%j.out      # Standard out goes to this file\n"
@@ -166,15 +340,147 @@ def make_harvard_script(script_fname : str,
     content +=  "source /n/home11/jmunozv/.bashrc\n"
     content +=  "source /n/home11/jmunozv/.setNEXUS\n"
 
+    # Packed outputs: the points nexus succeeded in are packed at the end,
+    # straight from the tmp PATH
+    if pack_line: content += "pack_args=()\n"
+
     for i in range(len(init_fnames)):
         tmp_log_fname = give_tmp_harvard_path(log_fnames[i])
         tmp_dst_fname = give_tmp_harvard_path(dst_fnames[i])
 
         content += f"{exe_path}nexus -b {init_fnames[i]} -n {num_evts} > {tmp_log_fname}\n"
+        content +=  "nexus_status=$?\n"
+
+        # Reducing the DST on the node, before moving it into place (reduce_sensors)
+        if reduce_sensors:
+            raw_path = get_raw_dst_path(dst_fnames[i]) if keep_raw_dsts else None
+            content += get_reduce_status_line(tmp_dst_fname + '.h5', reduce_sensors, raw_path)
+
+        if pack_line:
+            content += f"[ $nexus_status -eq 0 ] && " + \
+                       f"pack_args+=({init_fnames[i]} {tmp_dst_fname}.h5 {tmp_log_fname})\n"
+            content += f"[ $nexus_status -ne 0 ] && mv {tmp_log_fname}    {log_fnames[i]}\n"
+            content += f"[ $nexus_status -ne 0 ] && mv {tmp_dst_fname}.h5 {dst_fnames[i]}.h5\n"
+            continue
 
         content += f"mv {tmp_log_fname}    {log_fnames[i]}\n"
         content += f"mv {tmp_dst_fname}.h5 {dst_fnames[i]}.h5\n"
 
+        # Recording the point in the completion index if nexus succeeded
+        if index_lines:
+            content += f"[ $nexus_status -eq 0 ] && {index_lines[i]}\n"
+
+    if pack_line: content += pack_line + "\n"
+
+
+    script_file = open(script_fname, 'w')
+    script_file.write(content)
+    script_file.close()
+
+
+
+###
+def make_slurm_manifest(manifest_fname : str,
+                        jobs           : List[Tuple]
+                       )              -> None :
+
+    # One line per point: "<task_id> <init_fname> <dst_fname> <log_fname>"
+    # where every job (init_fnames, dst_fnames, log_fnames) is one array task.
+    # Jobs with packed outputs (init_fnames, dst_fnames, log_fnames, pack_fname,
+    # tar_fname) add their pack & tar to every line.
+    with open(manifest_fname, 'w') as manifest_file:
+        for task_id, (init_fnames, dst_fnames, log_fnames, *pack_fnames) in enumerate(jobs):
+            for init_fname, dst_fname, log_fname in zip(init_fnames, dst_fnames, log_fnames):
+                manifest_file.write(" ".join([str(task_id), init_fname, dst_fname, log_fname] +
+                                             pack_fnames) + "\n")
+
+
+
+###
+def make_slurm_array_script(script_fname   : str,
+                            exe_path       : str,
+                            manifest_fname : str,
+                            num_evts       : int,
+                            tmp_path       : Optional[str] = None,
+                            index_fname    : Optional[str] = None,
+                            num_photons    : int           = 0,
+                            pack_index_fname : Optional[str] = None,
+                            reduce_sensors : Optional[List[str]] = None,
+                            keep_raw_dsts  : bool                = True
+                           )              -> None :
+    content = "#!/bin/bash\n"
+
+    content += "#SBATCH -n 1               # Number of cores requested\n"
+    content += "#SBATCH -N 1               # Ensure that all cores are on one machine\n"
+    content += f"#SBATCH -t {SLURM_TIME_LIMIT_MINUTES}            # Runtime in minutes\n"
+    content += "#SBATCH -p guenette        # Partition to submit to\n"
+    content += "#SBATCH --mem=1500         # Memory per cpu in MB (see also –mem-per-cpu)\n"
+    content += "#SBATCH -o tmp/%A_%a.out   # Standard out goes to this file\n"
+    content += "#SBATCH -e tmp/%A_%a.err   # Standard err goes to this filehostname\n"
+
+    content +=  "source /n/home11/jmunozv/.bashrc\n"
+    content +=  "source /n/home11/jmunozv/.setNEXUS\n"
+
+    # Every array task runs the points of its job, read from the manifest.
+    # TASK_OFFSET allows splitting the jobs in several arrays.
+    content +=  "task_id=$((SLURM_ARRAY_TASK_ID + ${TASK_OFFSET:-0}))\n"
+
+    # Reducing every DST on the node (reduce_sensors), in the tmp PATH (if any)
+    # before moving it into place
+    reduce_line = ""
+    if reduce_sensors:
+        reduce_fname = f"{tmp_path}$(basename $dst_fname).h5" if tmp_path else "$dst_fname.h5"
+        raw_path     = "$(dirname $dst_fname)/" + RAW_DST_DIR if keep_raw_dsts else None
+        reduce_line  = "    " + get_reduce_status_line(reduce_fname, reduce_sensors, raw_path)
+
+    # Packed outputs (with a pack_index_fname): the points nexus succeeded in
+    # are packed at the end, into the pack & tar of the task in the manifest
+    if pack_index_fname:
+        content +=  "pack_args=()\n"
+        content +=  "while read init_fname dst_fname log_fname pack_fname tar_fname; do\n"
+        content +=  "    task_pack_fname=$pack_fname; task_tar_fname=$tar_fname\n"
+        if tmp_path:
+            content += f"    {exe_path}nexus -b $init_fname -n {num_evts} " + \
+                       f"> {tmp_path}$(basename $log_fname) < /dev/null\n"
+            content +=  "    nexus_status=$?\n"
+            content +=  reduce_line
+            content += f"    [ $nexus_status -eq 0 ] && pack_args+=($init_fname " + \
+                       f"{tmp_path}$(basename $dst_fname).h5 {tmp_path}$(basename $log_fname))\n"
+            content += f"    [ $nexus_status -ne 0 ] && mv {tmp_path}$(basename $log_fname)    $log_fname\n"
+            content += f"    [ $nexus_status -ne 0 ] && mv {tmp_path}$(basename $dst_fname).h5 $dst_fname.h5\n"
+        else:
+            content += f"    {exe_path}nexus -b $init_fname -n {num_evts} > $log_fname < /dev/null\n"
+            content +=  "    nexus_status=$?\n"
+            content +=  reduce_line
+            content +=  "    [ $nexus_status -eq 0 ] && pack_args+=($init_fname $dst_fname.h5 $log_fname)\n"
+        content += f"done < <(awk -v task_id=$task_id '$1 == task_id {{print $2, $3, $4, $5, $6}}' " + \
+                   f"{manifest_fname})\n"
+        content += get_pack_shell_line("$task_pack_fname", "$task_tar_fname", pack_index_fname,
+                                       index_fname, num_photons) + "\n"
+
+    else:
+        content += f"awk -v task_id=$task_id '$1 == task_id {{print $2, $3, $4}}' {manifest_fname} |\n"
+        content +=  "while read init_fname dst_fname log_fname; do\n"
+
+        # Running in the tmp PATH (if any), and moving the outputs into place
+        if tmp_path:
+            content += f"    {exe_path}nexus -b $init_fname -n {num_evts} " + \
+                       f"> {tmp_path}$(basename $log_fname) < /dev/null\n"
+            content +=  "    nexus_status=$?\n"
+            content +=  reduce_line
+            content += f"    mv {tmp_path}$(basename $log_fname)    $log_fname\n"
+            content += f"    mv {tmp_path}$(basename $dst_fname).h5 $dst_fname.h5\n"
+        else:
+            content += f"    {exe_path}nexus -b $init_fname -n {num_evts} > $log_fname < /dev/null\n"
+            content +=  "    nexus_status=$?\n"
+            content +=  reduce_line
+
+        # Recording the point in the completion index if nexus succeeded
+        if index_fname:
+            content += f'    [ $nexus_status -eq 0 ] && echo "$(basename $dst_fname).h5 {num_photons} ' + \
+                       f'$(stat -c %s $dst_fname.h5)" >> {index_fname}\n'
+
+        content +=  "done\n"
 
     script_file = open(script_fname, 'w')
     script_file.write(content)
@@ -183,52 +489,63 @@ def make_harvard_script(script_fname : str,
 
 
 ###
-def run_sims(init_fnames : List[str],
-             dst_fnames  : List[str],
-             log_fnames  : List[str],
-             num_evts    : int
-            )           -> None :
+def submit_slurm_array(script_fname   : str,
+                       num_tasks      : int,
+                       max_running    : int,
+                       max_array_size : int = 1000
+                      )              -> None :
+
+    # A single sbatch per array, throttled to max_running tasks at once.
+    # Arrays are limited to max_array_size tasks, so the jobs are split
+    # in several arrays if needed.
+    for first_task in range(0, num_tasks, max_array_size):
+        array_size = min(max_array_size, num_tasks - first_task)
+        print(f"* Submitting job array with tasks {first_task} - {first_task + array_size - 1}")
+        os.system(f"sbatch --array=0-{array_size - 1}%{max_running} " +
+                  f"--export=ALL,TASK_OFFSET={first_task} {script_fname}")
+
+
+
+###
+def run_sims_array(jobs           : List[Tuple],
+                   num_evts       : int,
+                   manifest_fname : str,
+                   index_fname    : Optional[str] = None,
+                   num_photons    : int           = 0,
+                   max_running    : int           = 400,
+                   max_array_size : int           = 1000,
+                   pack_index_fname : Optional[str] = None,
+                   reduce_sensors : Optional[List[str]] = None,
+                   keep_raw_dsts  : bool                = True,
+                   exe_path       : Optional[str]       = None
+                  )              -> None :
+
+    # Jobs with packed outputs (pack_index_fname) are
+    # (init_fnames, dst_fnames, log_fnames, pack_fname, tar_fname)
+    # The nexus PATH is the one of the host unless given.
 
     # Getting local host
     host = get_host_name()
 
-    ## Runing locally
-    if host == "local":
-        # Locally only 1 point per job, so check
-        assert len(init_fnames) == 1, "When running locally, points_per_job MUST BE 1"
-        
-        exe_path = "/Users/Javi/Development/nexus/bin/"
-        inst = [exe_path + "nexus", "-b", init_fnames[0], "-n", str(num_evts), ">", log_fnames[0]]
-        
-        #os.system("source /Users/Javi/.profile")
-        #os.system("source /Users/Javi/.setNEXUS")
-        my_env = os.environ.copy()
-        subprocess.run(inst, env=my_env)
-        
-
-    ## Runing in MAJORANA queue system
-    elif host == "majorana":
-        script_fname = "sim.script"
-        exe_path = "/home/jmunoz/Development/nexus/bin/"
-        make_majorana_script(script_fname, exe_path, init_fnames, log_fnames, num_evts)
-        
-        os.system(f"qsub -N tst {script_fname}")
-    
-
     ## Runing in HARVARD queue system
-    elif host == "harvard":
-
-        # Limit the maximum number of jobt to run at the same time
-        while int(os.popen('squeue -u $USER | wc -l').read()) > 400:
-            sleep(30)
+    if host == "harvard":
+        tmp_path = give_tmp_harvard_path("")
 
-        script_fname = "sim.slurm"
-        exe_path = "/n/holystore01/LABS/guenette_lab/Users/jmunozv/Development/nexus/bin/"
-        make_harvard_script(script_fname, exe_path, init_fnames, dst_fnames, log_fnames, num_evts)        
-        os.system(f"sbatch {script_fname}")
-    
+    ## Runing locally (only useful with the fake Slurm in utils/fake_slurm)
+    elif host == "local":
+        tmp_path = None
 
     # No other machine is supported yet
     else:
-        print(f"Light Table simulations in {host} are not supported yet.")
+        print(f"Light Table simulations as Slurm job arrays in {host} are not supported yet.")
         sys.exit()
+
+    if exe_path is None:
+        exe_path = NEXUS_PATHS[host]
+
+    script_fname = "sim_array.slurm"
+    make_slurm_manifest(manifest_fname, jobs)
+    make_slurm_array_script(script_fname, exe_path, manifest_fname, num_evts,
+                            tmp_path, index_fname, num_photons, pack_index_fname,
+                            reduce_sensors, keep_raw_dsts)
+    submit_slurm_array(script_fname, len(jobs), max_running, max_array_size)
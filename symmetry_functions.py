@@ -0,0 +1,200 @@
+import os
+
+import numpy      as np
+from   typing import List
+from   typing import Tuple
+
+# Specific IC stuff
+from invisible_cities.io.mcinfo_io import load_mcsensor_positions
+
+# Specific LightTable stuff
+from pos_functions     import make_positions
+from pack_functions    import get_dst_file
+from pack_functions    import is_pack_fname
+
+
+# Symmetry ops of every sensor plane symmetry: (swap_xy, sign_x, sign_y),
+# mapping (x, y) -> (sign_x * (y if swap_xy else x), sign_y * (x if swap_xy else y)).
+# The first one is always the identity.
+QUADRANT_OPS   = [(False, 1, 1), (False, -1, 1), (False, 1, -1), (False, -1, -1)]
+SYMMETRY_OPS   = {'quadrant' : QUADRANT_OPS,
+                  'octant'   : QUADRANT_OPS + [(True,  1, 1), (True, -1, 1),
+                                               (True,  1, -1), (True, -1, -1)]}
+
+# Points out of the fundamental domain simulated to check the symmetry,
+# and max. deviation (in sigmas) allowed between them and the folded ones
+SYMMETRY_CHECK_POINTS = 4
+SYMMETRY_CHECK_SIGMAS = 5.
+
+
+
+###
+def apply_symmetry_op(op : Tuple[bool, int, int],
+                      xs : np.ndarray,
+                      ys : np.ndarray
+                     )  -> Tuple[np.ndarray, np.ndarray] :
+    swap_xy, sign_x, sign_y = op
+    if swap_xy: xs, ys = ys, xs
+    return sign_x * xs, sign_y * ys
+
+
+
+###
+def in_fundamental_domain(xs       : np.ndarray,
+                          ys       : np.ndarray,
+                          symmetry : str
+                         )        -> np.ndarray :
+    in_domain = (xs >= 0) & (ys >= 0)
+    if symmetry == 'octant':
+        in_domain &= (ys <= xs)
+    return in_domain
+
+
+
+###
+def fold_xys(xs       : np.ndarray,
+             ys       : np.ndarray,
+             symmetry : str
+            )        -> Tuple[np.ndarray, np.ndarray, np.ndarray] :
+
+    # (x, y) of every point folded into the fundamental domain, and the index
+    # of the symmetry op mapping the folded point back to the original one.
+    fold_xs, fold_ys = np.abs(xs), np.abs(ys)
+    if symmetry == 'octant':
+        fold_xs, fold_ys = np.maximum(fold_xs, fold_ys), np.minimum(fold_xs, fold_ys)
+
+    op_idx = np.full(len(xs), -1)
+    for idx, op in enumerate(SYMMETRY_OPS[symmetry]):
+        op_xs, op_ys = apply_symmetry_op(op, fold_xs, fold_ys)
+        op_idx[(op_idx < 0) & (op_xs == xs) & (op_ys == ys)] = idx
+
+    return fold_xs, fold_ys, op_idx
+
+
+
+###
+def get_folded_positions(table_positions : np.ndarray,
+                         symmetry        : str
+                        )               -> np.ndarray :
+
+    # Table positions to be simulated: the ones in the fundamental domain,
+    # plus a few out of it to check the symmetry at build time.
+    in_domain  = in_fundamental_domain(table_positions['x'], table_positions['y'], symmetry)
+    out_domain = np.flatnonzero(~in_domain)
+
+    num_checks = min(SYMMETRY_CHECK_POINTS, len(out_domain))
+    check_idx  = np.linspace(0, len(out_domain) - 1, num_checks).astype(int)
+    in_domain[out_domain[check_idx]] = True
+
+    return table_positions[in_domain]
+
+
+
+###
+def get_sensor_xys(dst_fname  : str,
+                   sensor_ids : List[int]
+                  )          -> np.ndarray :
+    # (x, y) of the sensors, in the sensor_ids order
+    sns_positions = load_mcsensor_positions(get_dst_file(dst_fname)).set_index('sensor_id')
+    return sns_positions.loc[sensor_ids, ['x', 'y']].values.astype(float)
+
+
+
+###
+def get_sensor_permutations(sensor_xys : np.ndarray,
+                            symmetry   : str
+                           )          -> List[np.ndarray] :
+
+    # For every symmetry op, the index of the sensor each sensor is mapped to.
+    # Positions are matched to 0.1 mm, as they are stored in single precision.
+    sensor_idx = {xy: idx for idx, xy in enumerate(map(tuple, np.round(sensor_xys, 1).tolist()))}
+
+    permutations = []
+    for op in SYMMETRY_OPS[symmetry]:
+        op_xs, op_ys = apply_symmetry_op(op, sensor_xys[:, 0], sensor_xys[:, 1])
+        op_xys       = zip(np.round(op_xs, 1).tolist(), np.round(op_ys, 1).tolist())
+        permutation  = [sensor_idx.get(xy, -1) for xy in op_xys]
+        assert (-1 not in permutation) and (len(set(permutation)) == len(permutation)), \
+            f"Sensor plane without {symmetry} symmetry"
+        permutations.append(np.array(permutation))
+
+    return permutations
+
+
+
+###
+def check_plane_symmetry(dst_path    : str,
+                         sensor_name : str,
+                         symmetry    : str
+                        )           -> bool :
+
+    # Checking the symmetry declared for the sensor plane with the sensor_name
+    # sensor positions of any DST (or pack) of the detector in dst_path, so a
+    # wrong declaration is caught before the folded table is simulated.
+    # Returns False if there is no DST to check it with.
+    if not os.path.isdir(dst_path):
+        return False
+    dst_names = sorted(dst_name for dst_name in os.listdir(dst_path)
+                       if dst_name.endswith(".h5") and
+                       ((".next" in dst_name) or is_pack_fname(dst_name)))
+    if not dst_names:
+        return False
+
+    sns_positions = load_mcsensor_positions(dst_path + dst_names[0])
+    sensor_xys    = sns_positions[sns_positions.sensor_name == sensor_name][['x', 'y']]
+    assert len(sensor_xys), f"No {sensor_name} sensors in {dst_path + dst_names[0]}"
+    get_sensor_permutations(sensor_xys.values.astype(float), symmetry)
+    return True
+
+
+
+###
+def unfold_table_data(sim_positions   : np.ndarray,
+                      sim_data        : np.ndarray,
+                      sim_photons     : np.ndarray,
+                      table_positions : np.ndarray,
+                      sensor_xys      : np.ndarray,
+                      symmetry        : str
+                     )               -> Tuple[np.ndarray, np.ndarray] :
+
+    # Table data (one row per table position, one column per sensor) from the
+    # data of the simulated positions. The simulated positions keep their own
+    # data, and the rest take the data of their folded position, with the
+    # sensors permuted. Returns the data and the mask of positions with data.
+    fold_xs, fold_ys, op_idx = fold_xys(table_positions['x'], table_positions['y'], symmetry)
+    fold_positions = make_positions(fold_xs, fold_ys, table_positions['z'])
+    permutations   = get_sensor_permutations(sensor_xys, symmetry)
+
+    sim_idx  = {pos: idx for idx, pos in enumerate(sim_positions.tolist())}
+    own_idx  = np.array([sim_idx.get(pos, -1) for pos in table_positions.tolist()])
+    fold_idx = np.array([sim_idx[pos]         for pos in fold_positions .tolist()])
+
+    is_simulated = own_idx >= 0
+    src_idx      = np.where(is_simulated, own_idx, fold_idx)
+    src_op       = np.where(is_simulated, 0,       op_idx)
+
+    table_data = np.zeros((len(table_positions), sim_data.shape[1]))
+    for idx, permutation in enumerate(permutations):
+        rows = np.flatnonzero(src_op == idx)
+        table_data[np.ix_(rows, permutation)] = sim_data[src_idx[rows]]
+
+    # Checking the simulated positions out of the fundamental domain against
+    # their folded ones (relative errors from the Poisson stats of the charges)
+    checks = np.flatnonzero(is_simulated & (op_idx > 0))
+    checks = checks[(sim_photons[own_idx[checks]] > 0) & (sim_photons[fold_idx[checks]] > 0)]
+    max_deviation = 0.
+    for check in checks:
+        permutation = permutations[op_idx[check]]
+        own_data    = sim_data[own_idx[check]][permutation]
+        fold_data   = sim_data[fold_idx[check]]
+        variance    = own_data  / sim_photons[own_idx[check]] + \
+                      fold_data / sim_photons[fold_idx[check]]
+        if (variance > 0).any():
+            deviation     = np.abs(own_data - fold_data)[variance > 0] / np.sqrt(variance[variance > 0])
+            max_deviation = max(max_deviation, deviation.max())
+
+    print(f"* Symmetry check: max. deviation of {max_deviation:.2f} sigmas in {len(checks)} points")
+    assert max_deviation < SYMMETRY_CHECK_SIGMAS, \
+        f"Table data not consistent with the {symmetry} symmetry"
+
+    return table_data, sim_photons[src_idx] > 0
@@ -0,0 +1,130 @@
+import numpy      as np
+import tables     as tb
+from   typing import List
+from   typing import Tuple
+
+# Specific LightTable stuff
+from detectors         import get_detector_dimensions
+
+
+# Synthetic sensor planes: (sensor_name, first sensor_id, pitch) of the square
+# grids of sensors within ACTIVE, sized to the real ones
+SYNTHETIC_SENSORS = {
+    'NEXT_NEW' : [('PmtR11410',    0, 110.0), ('SiPM', 1000, 10.0 )],
+    'NEXT100'  : [('PmtR11410',    0, 115.0), ('SiPM', 1000, 15.55)],
+    'TEST'     : [('PmtR11410',    0, 115.0), ('SiPM', 1000, 15.55)],
+}
+
+# Synthetic response: fraction of the photons detected by a sensor right
+# under the source, and attenuation length (mm) with the xy distance
+SYNTHETIC_RESPONSE = {'PmtR11410' : (1.e-3, 500.0),
+                      'SiPM'      : (5.e-4,  20.0)}
+
+# Same layout as the nexus DST tables
+CONFIGURATION_DTYPE = [('param_key',   'S300'), ('param_value', 'S300')]
+SNS_RESPONSE_DTYPE  = [('event_id',    '<i8'),  ('sensor_id',   '<u4'),
+                       ('time_bin',    '<u8'),  ('charge',      '<u4')]
+SNS_POSITIONS_DTYPE = [('sensor_id',   '<u4'),  ('sensor_name', 'S20'),
+                       ('x',           '<f8'),  ('y',           '<f8'), ('z', '<f8')]
+
+
+
+###
+def get_synthetic_sensors(det_name : str
+                         )        -> Tuple[np.ndarray, List[str], np.ndarray] :
+
+    # (sensor_ids, sensor_names, sensor_xys) of the synthetic sensor planes of
+    # the detector: square grids, centered at the origin, within ACTIVE.
+    # The SiPM closest to the reference sensor gets its id.
+    det_dim = get_detector_dimensions(det_name)
+    det_rad = det_dim["ACTIVE_radius"]
+
+    sensor_ids, sensor_names, sensor_xys = [], [], []
+    for sensor_name, first_id, pitch in SYNTHETIC_SENSORS[det_name]:
+        grid   = np.arange(-det_rad + pitch/2., det_rad, pitch)
+        grid  -= (grid[0] + grid[-1]) / 2.
+        xs, ys = np.meshgrid(grid, grid, indexing = 'ij')
+        in_active = (xs**2 + ys**2) < det_rad**2
+
+        sensor_xys   .append(np.c_[xs[in_active], ys[in_active]])
+        sensor_ids   .append(first_id + np.arange(in_active.sum()))
+        sensor_names += [sensor_name] * in_active.sum()
+
+    sensor_ids = np.concatenate(sensor_ids)
+    sensor_xys = np.concatenate(sensor_xys)
+
+    ref_id, ref_xy = det_dim["ref_sensor"]
+    is_sipm   = np.array(sensor_names) == 'SiPM'
+    ref_dists = np.where(is_sipm, np.hypot(*(sensor_xys - ref_xy).T), np.inf)
+    ref_idx   = ref_dists.argmin()
+    sensor_ids[sensor_ids == ref_id] = sensor_ids[ref_idx]
+    sensor_ids[ref_idx]              = ref_id
+
+    return sensor_ids, sensor_names, sensor_xys
+
+
+
+###
+def write_synthetic_dst(dst_fname         : str,
+                        det_name          : str,
+                        pos               : Tuple[float, float, float],
+                        photons_per_event : int,
+                        num_events        : int = 1,
+                        time_bins         : int = 1,
+                        seed              : int = 0
+                       )                 -> None :
+    # DST of num_events events of a source at pos
+    write_synthetic_job_dst(dst_fname, det_name, [(pos, 0, num_events)],
+                            photons_per_event, time_bins, seed)
+
+
+
+###
+def write_synthetic_job_dst(dst_fname         : str,
+                            det_name          : str,
+                            vertices          : List[Tuple[Tuple[float, float, float], int, int]],
+                            photons_per_event : int,
+                            time_bins         : int = 1,
+                            seed              : int = 0
+                           )                 -> None :
+
+    # DST with the MC/configuration, MC/sns_response and MC/sns_positions
+    # tables written by nexus, for the sources of vertices: (pos, first_event,
+    # num_events) each. The charge of every sensor is Poisson distributed
+    # around an exponential response with its xy distance to the source,
+    # split into time_bins time bins.
+    sensor_ids, sensor_names, sensor_xys = get_synthetic_sensors(det_name)
+    response = np.array([SYNTHETIC_RESPONSE[sensor_name] for sensor_name in sensor_names])
+
+    rng = np.random.default_rng(seed)
+    sns_response = []
+    for pos, first_event, num_events in vertices:
+        sensor_dists = np.hypot(sensor_xys[:, 0] - pos[0], sensor_xys[:, 1] - pos[1])
+        mean_charges = photons_per_event * response[:, 0] * np.exp(-sensor_dists / response[:, 1])
+
+        for event_id in range(first_event, first_event + num_events):
+            charges  = rng.poisson(mean_charges / time_bins, size = (time_bins, len(sensor_ids)))
+            bins, sensors = np.nonzero(charges)
+            event_response = np.empty(len(bins), dtype = SNS_RESPONSE_DTYPE)
+            event_response['event_id']  = event_id
+            event_response['sensor_id'] = sensor_ids[sensors]
+            event_response['time_bin']  = bins
+            event_response['charge']    = charges[bins, sensors]
+            sns_response.append(event_response[np.argsort(sensors, kind = 'stable')])
+
+    total_events  = sum(num_events for _, _, num_events in vertices)
+    configuration = np.array([(b"/Generator/ScintGenerator/nphotons", str(photons_per_event).encode()),
+                              (b"num_events",                         str(total_events)     .encode())],
+                             dtype = CONFIGURATION_DTYPE)
+
+    sns_positions = np.empty(len(sensor_ids), dtype = SNS_POSITIONS_DTYPE)
+    sns_positions['sensor_id']   = sensor_ids
+    sns_positions['sensor_name'] = sensor_names
+    sns_positions['x']           = sensor_xys[:, 0]
+    sns_positions['y']           = sensor_xys[:, 1]
+    sns_positions['z']           = 0.
+
+    with tb.open_file(dst_fname, 'w') as h5file:
+        h5file.create_table('/MC', 'configuration', configuration, createparents = True)
+        h5file.create_table('/MC', 'sns_response',  np.concatenate(sns_response))
+        h5file.create_table('/MC', 'sns_positions', sns_positions)
@@ -1,171 +1,505 @@
-import os
-
 import numpy      as np
 import pandas     as pd
-from   typing import Tuple
+from   typing          import Tuple
+from   typing          import List
+from   typing          import Callable
+from   typing          import Iterator
+from   typing          import Optional
+from   functools       import partial
+from   multiprocessing import get_context
 
 # Specific IC stuff
-from invisible_cities.io.mcinfo_io import load_mcsensor_response_df
 from invisible_cities.io.mcinfo_io import get_sensor_types
 
 # Specific LightTable stuff
 from sim_functions     import get_num_photons
-from general_functions import get_host_name
-from pos_functions     import get_energy_table_positions
-from pos_functions     import get_tracking_table_positions
+from sim_functions     import get_photons_per_event
+from pos_functions     import get_position_tuples
+from plan_functions    import CampaignPlan
+from plan_functions    import make_campaign_plan
+from plan_functions    import get_point_dst_sets
+
+from cache_functions   import ReductionCache
+from cache_functions   import get_dst_stamp
+from cache_functions   import is_cached
+from cache_functions   import load_reduction_cache
+from cache_functions   import save_reduction_cache
+
+from symmetry_functions import get_sensor_xys
+from symmetry_functions import unfold_table_data
+
+from vertex_functions  import EventRange
+from vertex_functions  import split_dst_spec
+
+from pack_functions    import split_pack_spec
+from pack_functions    import get_dst_file
+
+from reduction_functions import check_reduced_sensors
+
+from metrics_functions import ProgressReporter
+from metrics_functions import call_with_metrics
+from metrics_functions import merge_metrics
+from metrics_functions import count
+from metrics_functions import timer
 
 from detectors         import get_detector_dimensions
 
 
+# DST node with the sensor response, and number of its rows read at once
+SNS_RESPONSE_NODE  = "MC/sns_response"
+SNS_RESPONSE_CHUNK = 1000000
+
+# Number of rows of every chunk of the streamed light tables
+TABLE_STREAM_ROWS  = 100000
+
 
 ###
-def get_working_paths(det_name : str
-                     )        -> Tuple[str, str, str, str] :
+def get_table_fname(det_name    : str,
+                    table_type  : str,
+                    signal_type : str,
+                    sensor_name : str
+                   )           -> str :
+    return f"{det_name}.{table_type}.{signal_type}.{sensor_name}.LightTable.h5"
 
-    # Getting local host
-    host = get_host_name()
 
-    # Setting base PATH
-    if host == "local":
-        base_path = f"/Users/Javi/Development/NextLightTable/data/{det_name}/"
 
-    elif host == "majorana":
-        base_path = f"/home/jmunoz/Development/NextLightTable/data/{det_name}/"
+###
+def get_cache_fname(det_name    : str,
+                    table_type  : str,
+                    signal_type : str,
+                    sensor_name : str
+                   )           -> str :
+    return f"{det_name}.{table_type}.{signal_type}.{sensor_name}.ReductionCache.pkl"
+
 
-    elif host == "neutrinos":
-        base_path = f"./NextLightTable/data/{det_name}/"
 
-    elif host == "harvard":
-        base_path = f"/n/holystore01/LABS/guenette_lab/Users/jmunozv/Development/NextLightTable/data/{det_name}/"
+###
+def load_sensor_charges(dst_fname  : str,
+                        sensor_ids : List[int]
+                       )          -> Tuple[int, np.ndarray] :
 
-    else:
-        print("get_working_paths::Not valid host name.")
-        exit(0)
+    # sensor_ids MUST BE sorted, as the charges are returned in that order
+    sensor_ids  = np.asarray(sensor_ids)
+    sns_charges = np.zeros(len(sensor_ids))
 
-    if not os.path.isdir(base_path): os.makedirs(base_path)
+    # (packed points are read from their group of the pack)
+    dst_file, dst_root = split_pack_spec(dst_fname)
+    with timer("dst_open"):
+        store = pd.HDFStore(dst_file, mode = 'r')
 
-    # Making working PATHs
-    config_path = base_path + 'config/'
-    if not os.path.isdir(config_path): os.makedirs(config_path)
+    with store:
 
-    log_path = base_path    + 'log/'
-    if not os.path.isdir(log_path): os.makedirs(log_path)
+        # Getting the number of photons from the same file handle
+        with timer("dst_open"):
+            num_photons = get_num_photons(store, dst_root)
 
-    dst_path = base_path    + 'dst/'
-    if not os.path.isdir(dst_path): os.makedirs(dst_path)
+        # Scanning the sensor response in chunks, keeping just the sensor_id
+        # and charge fields and summing the charge of the requested sensors.
+        # The rows are stored contiguously, so every chunk is read just once.
+        sns_response = store.get_node(dst_root + SNS_RESPONSE_NODE)
+        for start in range(0, sns_response.nrows, SNS_RESPONSE_CHUNK):
+            with timer("dst_read"):
+                chunk  = sns_response.read(start, start + SNS_RESPONSE_CHUNK)
+                ids    = chunk['sensor_id']
+                charge = chunk['charge']
 
-    table_path = base_path  + 'table/'
-    if not os.path.isdir(table_path): os.makedirs(table_path)
+            with timer("dst_reduce"):
+                cols  = np.searchsorted(sensor_ids, ids).clip(max = len(sensor_ids) - 1)
+                found = sensor_ids[cols] == ids
+                sns_charges += np.bincount(cols[found], weights   = charge[found],
+                                                        minlength = len(sensor_ids))
+            count("dst_rows", len(chunk))
 
-    return config_path, log_path, dst_path, table_path
+    count("dsts_read")
+    return num_photons, sns_charges
 
 
 
 ###
-def get_table_fname(det_name    : str,
-                    table_type  : str,
-                    signal_type : str,
-                    sensor_name : str
-                   )           -> str :
-    return f"{det_name}.{table_type}.{signal_type}.{sensor_name}.LightTable.h5"
+def load_event_range_charges(dst_fname    : str,
+                             sensor_ids   : List[int],
+                             event_ranges : List[EventRange]
+                            )            -> List[Optional[Tuple[int, np.ndarray]]] :
+
+    # Same as load_sensor_charges for every event range [first_event, stop_event)
+    # of a multi-vertex job DST, reading the DST just once. Event ranges with
+    # no sensor response (the vertex was not simulated) get None.
+    # sensor_ids MUST BE sorted, as the charges are returned in that order
+    sensor_ids   = np.asarray(sensor_ids)
+    range_order  = np.argsort([first_event for first_event, _ in event_ranges])
+    first_events = np.array([event_ranges[idx][0] for idx in range_order])
+    stop_events  = np.array([event_ranges[idx][1] for idx in range_order])
+    num_ranges   = len(event_ranges)
+    sns_charges  = np.zeros(num_ranges * len(sensor_ids))
+    with_events  = np.zeros(num_ranges, dtype = bool)
+
+    dst_file, dst_root = split_pack_spec(dst_fname)
+    with timer("dst_open"):
+        store = pd.HDFStore(dst_file, mode = 'r')
+
+    with store:
+
+        with timer("dst_open"):
+            photons_per_event = get_photons_per_event(store, dst_root)
+
+        # Same chunked scan as load_sensor_charges, binning the charge by
+        # event range & sensor
+        sns_response = store.get_node(dst_root + SNS_RESPONSE_NODE)
+        for start in range(0, sns_response.nrows, SNS_RESPONSE_CHUNK):
+            with timer("dst_read"):
+                chunk  = sns_response.read(start, start + SNS_RESPONSE_CHUNK)
+                evts   = chunk['event_id']
+                ids    = chunk['sensor_id']
+                charge = chunk['charge']
+
+            with timer("dst_reduce"):
+                ranges   = (np.searchsorted(first_events, evts, side = 'right') - 1).clip(min = 0)
+                in_range = (evts >= first_events[ranges]) & (evts < stop_events[ranges])
+                cols     = np.searchsorted(sensor_ids, ids).clip(max = len(sensor_ids) - 1)
+                found    = (sensor_ids[cols] == ids) & in_range
+                sns_charges += np.bincount(ranges[found] * len(sensor_ids) + cols[found],
+                                           weights   = charge[found],
+                                           minlength = len(sns_charges))
+                with_events[ranges[in_range]] = True
+            count("dst_rows", len(chunk))
+
+    count("dsts_read")
+    sns_charges   = sns_charges.reshape(num_ranges, len(sensor_ids))
+    range_charges = [None] * num_ranges
+    for sorted_idx, range_idx in enumerate(range_order):
+        if with_events[sorted_idx]:
+            first_event, stop_event = event_ranges[range_idx]
+            range_charges[range_idx] = (photons_per_event * (stop_event - first_event),
+                                        sns_charges[sorted_idx])
+    return range_charges
 
 
 
 ###
-def get_fnames(det_name : str,
-               pos      : Tuple[float, float, float]
-              )        -> Tuple[str, str, str, str] :
-    
-    config_path, log_path, dst_path, table_path = get_working_paths(det_name)
-    
-    base_fname =  f"{det_name}.x_{pos[0]}.y_{pos[1]}.z_{pos[2]}"
-    
-    init_fname   = config_path + base_fname + ".init"
-    config_fname = config_path + base_fname + ".config"
-    log_fname    = log_path    + base_fname + ".log"
-    dst_fname    = dst_path    + base_fname + ".next"
-  
-    return init_fname, config_fname, log_fname, dst_fname
+def map_points(func        : Callable,
+               dst_fnames  : List,
+               num_workers : int = 1
+              )           -> Iterator :
+
+    # Serial path
+    if num_workers <= 1:
+        yield from map(func, dst_fnames)
+        return
+
+    # Parallel path: every worker returns just the reduced data of its points
+    # (and the metrics of its reduction), and imap yields the results in the
+    # same order as dst_fnames. 'fork' is used so workers do not re-import
+    # the main script.
+    chunksize = max(1, len(dst_fnames) // (4 * num_workers))
+    with get_context("fork").Pool(num_workers) as pool:
+        for result, worker_metrics in pool.imap(partial(call_with_metrics, func),
+                                                dst_fnames, chunksize):
+            merge_metrics(worker_metrics)
+            yield result
+
+
+
+###
+def reduce_dst(dst_item   : Tuple[str, List[Optional[EventRange]]],
+               sensor_ids : List[int]
+              )          -> List[Optional[Tuple[int, np.ndarray]]] :
+
+    # Getting the number of photons from the file, as it could be different
+    # from the one included in the setup, and the charge of the sensors requested,
+    # for every event range of the DST (a single None range for the whole DST).
+    dst_fname, event_ranges = dst_item
+    if event_ranges == [None]:
+        return [load_sensor_charges(dst_fname, sensor_ids)]
+    return load_event_range_charges(dst_fname, sensor_ids, event_ranges)
+
+
+
+###
+def reduce_points(dst_fnames  : List[str],
+                  sensor_ids  : List[int],
+                  num_workers : int                      = 1,
+                  cache       : Optional[ReductionCache] = None
+                 )           -> Iterator[Optional[Tuple[int, np.ndarray]]] :
+
+    # Yields (num_photons, sns_charges) of every DST in order, or None if the
+    # DST does NOT EXIST. Only the DSTs missing in the cache are read, and
+    # the cache is updated with them. With no cache, nothing is kept.
+    # dst_fnames can also be event ranges of multi-vertex job DSTs
+    # (see vertex_functions), every job DST being read just once.
+    keep_reduced = cache is not None
+    if cache is None: cache = {}
+
+    selection  = tuple(sensor_ids)
+    dst_stamps = [get_dst_stamp(get_dst_file(dst_fname)) for dst_fname in dst_fnames]
+    dst_cached = [(dst_stamp is not None) and is_cached(cache, dst_fname, dst_stamp, selection)
+                  for dst_fname, dst_stamp in zip(dst_fnames, dst_stamps)]
+
+    # Event ranges to read of every DST
+    to_reduce = {}
+    for dst_fname, dst_stamp, cached in zip(dst_fnames, dst_stamps, dst_cached):
+        if (dst_stamp is not None) and not cached:
+            dst_file, event_range = split_dst_spec(dst_fname)
+            to_reduce.setdefault(dst_file, []).append(event_range)
+
+    if cache:
+        print(f"\n* Reading {len(to_reduce)} DSTs not found in the reduction cache ...")
+    reduced = map_points(partial(reduce_dst, sensor_ids = sensor_ids),
+                         list(to_reduce.items()), num_workers)
+    count("dsts_cached", sum(dst_cached))
+
+    # Reduced data of the event ranges read but not yielded yet
+    reduced_order  = iter(to_reduce)
+    reduced_ranges = {}
+
+    progress = ProgressReporter("DSTs reduced", len(dst_fnames))
+    for dst_fname, dst_stamp, cached in zip(dst_fnames, dst_stamps, dst_cached):
+        progress.update()
+        if dst_stamp is None:
+            print(f"  WARNING: {dst_fname} NOT exist.")
+            count("dsts_missing")
+            yield None
+
+        elif cached:
+            _, _, num_photons, sns_charges = cache[dst_fname]
+            yield num_photons, sns_charges
+
+        else:
+            dst_range = split_dst_spec(dst_fname)
+            while dst_range not in reduced_ranges:
+                dst_file = next(reduced_order)
+                reduced_ranges.update(zip([(dst_file, event_range) for event_range in to_reduce[dst_file]],
+                                          next(reduced)))
+            dst_data = reduced_ranges.pop(dst_range)
 
+            if dst_data is None:
+                print(f"  WARNING: No events of {dst_fname}")
+                count("event_ranges_missing")
+                yield None
+                continue
 
+            num_photons, sns_charges = dst_data
+            if keep_reduced:
+                cache[dst_fname] = (dst_stamp, selection, num_photons, sns_charges)
+            yield num_photons, sns_charges
 
 
 
+###
+def reduce_point_sets(dst_sets    : List[List[str]],
+                      sensor_ids  : List[int],
+                      num_workers : int                      = 1,
+                      cache       : Optional[ReductionCache] = None
+                     )           -> Iterator[Optional[Tuple[int, np.ndarray]]] :
+
+    # Yields (num_photons, sns_charges) of every point, summed over all its DSTs,
+    # or None if the point has no DST.
+    dst_fnames = [dst_fname for dst_set in dst_sets for dst_fname in dst_set]
+    reduced    = reduce_points(dst_fnames, sensor_ids, num_workers, cache)
+
+    for dst_set in dst_sets:
+        num_photons, sns_charges = 0, None
+        for dst_data in (next(reduced) for _ in dst_set):
+            if dst_data is not None:
+                num_photons += dst_data[0]
+                sns_charges  = dst_data[1] if sns_charges is None else sns_charges + dst_data[1]
+
+        yield None if sns_charges is None else (num_photons, sns_charges)
+
+
+
+###
+def get_sensor_ids(dst_fname   : str,
+                   sensor_name : str
+                  )           -> List[int] :
+    # Sorted ids of the sensor_name sensors
+    check_reduced_sensors(dst_fname, sensor_name)
+    sensor_types = get_sensor_types(get_dst_file(dst_fname))
+    return sorted(sensor_types[sensor_types.sensor_name == sensor_name].sensor_id.tolist())
+
+
+
+###
+def make_energy_table(positions   : np.ndarray,
+                      table_data  : np.ndarray,
+                      signal_type : str,
+                      sensor_name : str,
+                      sensor_ids  : List[int]
+                     )           -> pd.DataFrame :
+
+    # Building the LightTable DataFrame on top of the data buffer (no copy)
+    index_names = ['x', 'y', 'z'] if (signal_type == 'S1') else ['x', 'y']
+    index = pd.MultiIndex.from_arrays([positions[name].astype(float) for name in index_names],
+                                      names = index_names)
+
+    light_table_columns = [f"{sensor_name}_{sensor_id}" for sensor_id in sensor_ids] + \
+                          [f"{sensor_name}_total"]
+    return pd.DataFrame(table_data, index = index,
+                        columns = light_table_columns, copy = False)
+
+
 
 ###
-def build_energy_table(det_name, signal_type, sensor_name, pitch):
+def build_energy_table(det_name    : str,
+                       signal_type : str,
+                       sensor_name : str,
+                       pitch       : Tuple[float, float, float],
+                       num_workers : int                    = 1,
+                       cache_fname : Optional[str]          = None,
+                       plan        : Optional[CampaignPlan] = None
+                      )           -> pd.DataFrame :
     
-    table_positions = get_energy_table_positions(det_name, signal_type, pitch)
+    if plan is None:
+        plan = make_campaign_plan(det_name, "energy", signal_type, pitch, 0)
+    table_positions = plan['positions']
+    dst_sets        = get_point_dst_sets(plan)
+    dst_fnames      = [dst_fname for dst_set in dst_sets for dst_fname in dst_set]
     
     # Initial list to be filled with data.
-    _, _, _, dst_fname = get_fnames(det_name, table_positions[0])
-    sensor_types = get_sensor_types(dst_fname + ".h5")
+    sensor_ids = get_sensor_ids(dst_fnames[0], sensor_name)
 
-    sensor_ids = sensor_types[sensor_types.sensor_name == sensor_name].sensor_id.tolist()
-    sensor_ids.sort()
+    # Preallocated table data: one row per point, one column per sensor + total
+    num_sensors      = len(sensor_ids)
+    light_table_data = np.zeros((len(table_positions), num_sensors + 1))
+    pos_with_data    = np.zeros(len(table_positions), dtype = bool)
+    pos_photons      = np.zeros(len(table_positions))
+    num_rows         = 0
 
-    light_table_columns = np.append(['x', 'y', 'z'], np.append(sensor_ids, 'total'))
-    light_table_data    = []
-    
     # Getting the table data from sims
-    for pos in table_positions:
-    
-        print(f"\n* Getting data from {det_name} - {pos} ...")
+    cache  = load_reduction_cache(cache_fname) if cache_fname else None
+    points = reduce_point_sets(dst_sets, sensor_ids, num_workers, cache)
 
-        # Getting the right DST file name
-        _, _, _, dst_fname = get_fnames(det_name ,pos)
-        dst_fname += ".h5"
-
-        if os.path.isfile(dst_fname):
-    
-            # Getting the number of photons from the file, as it could be different
-            # from the one included in the setup.
-            num_photons = get_num_photons(dst_fname)
-            print(f"  Simulation run with {num_photons:9} initial photons.")
-
-            # Getting the sensor response of the sns_type requested
-            sns_response = load_mcsensor_response_df(dst_fname)
-            sns_response = sns_response.loc[pd.IndexSlice[:,sensor_ids], :]
-            sns_charge   = sns_response.groupby('sensor_id').charge.sum().tolist()
-            sns_charge   = np.divide(sns_charge, num_photons)
-            sns_charge   = np.append(sns_charge, sum(sns_charge))
-        
-            # Composing & storing this position data
-            pos_data = np.append([pos[0], pos[1], pos[2]], sns_charge)
-            light_table_data.append(pos_data)
-            
-            # Verbosity
-            #print(f"  {sns_type} behaviour: {sns_response.charge.describe()}")
-    
-        # If the DST file does NOT EXIST
+    for pos_idx, point_data in enumerate(points):
+        # Storing this position data, skipping the points with no DST
+        if point_data is None:
+            print(f"  WARNING: No DST for {plan['base_fnames'][pos_idx]}")
         else:
-            print(f"  WARNING: {dst_fname} NOT exist.")
-    
-    
-    # Building the LightTable DataFrame
-    light_table = pd.DataFrame(light_table_data, columns = light_table_columns)
+            num_photons, sns_charge = point_data
+            light_table_data[num_rows, :num_sensors] = sns_charge / num_photons
+            pos_with_data[pos_idx] = True
+            pos_photons  [pos_idx] = num_photons
+            num_rows += 1
 
-    # Setting indices
-    if(signal_type == 'S1'):
-        light_table.set_index(['x', 'y', 'z'], inplace = True)
-    else:
-        light_table.drop(columns='z', inplace = True)
-        light_table.set_index(['x', 'y'], inplace = True)
+    if cache_fname:
+        save_reduction_cache(cache_fname, {dst_fname: cache[dst_fname]
+                                           for dst_fname in dst_fnames if dst_fname in cache})
 
-    light_table.sort_index() # Not sure if needed to speed access
+    light_table_data = light_table_data[:num_rows]
+    light_table_pos  = table_positions [pos_with_data]
+
+    # Rebuilding the full table from its fundamental domain
+    if plan['symmetry'] is not None:
+        sim_data = np.zeros((len(table_positions), num_sensors))
+        sim_data[pos_with_data] = light_table_data[:, :num_sensors]
+        sensor_xys = get_sensor_xys(dst_fnames[0], sensor_ids)
+
+        full_data, full_with_data = unfold_table_data(table_positions, sim_data, pos_photons,
+                                                      plan['table_positions'], sensor_xys,
+                                                      plan['symmetry'])
+        light_table_data = np.zeros((full_with_data.sum(), num_sensors + 1))
+        light_table_data[:, :num_sensors] = full_data[full_with_data]
+        light_table_pos  = plan['table_positions'][full_with_data]
 
-    light_table = light_table.rename(columns = lambda name: sensor_name + '_' + name)
+    light_table_data[:, num_sensors] = light_table_data[:, :num_sensors].sum(axis = 1)
+
+    light_table = make_energy_table(light_table_pos, light_table_data,
+                                    signal_type, sensor_name, sensor_ids)
+
+    light_table.sort_index() # Not sure if needed to speed access
 
     return light_table
 
 
 
 ###
-def build_tracking_table(det_name, signal_type, sensor_name, pitch, tracking_maxDist):
+def stream_energy_table(table_fname : str,
+                        det_name    : str,
+                        signal_type : str,
+                        sensor_name : str,
+                        pitch       : Tuple[float, float, float],
+                        num_workers : int                    = 1,
+                        plan        : Optional[CampaignPlan] = None,
+                        chunk_rows  : int                    = TABLE_STREAM_ROWS
+                       )           -> int :
+
+    # Same table as build_energy_table, but appended to table_fname (as
+    # /LightTable) in chunks of chunk_rows rows while the DSTs are reduced,
+    # so the memory needed is set by chunk_rows and not by the table size.
+    # The reduction cache is not used, as it holds the data of the whole table.
+    # Returns the number of rows written.
+    if plan is None:
+        plan = make_campaign_plan(det_name, "energy", signal_type, pitch, 0)
+    assert plan['symmetry'] is None, "Folded tables can not be streamed"
+
+    table_positions = plan['positions']
+    dst_sets        = get_point_dst_sets(plan)
+    first_dst_set   = next(dst_set for dst_set in dst_sets if dst_set)
+    sensor_ids      = get_sensor_ids(first_dst_set[0], sensor_name)
+
+    # Chunk buffers: table data and position index of every row
+    num_sensors = len(sensor_ids)
+    chunk_data  = np.zeros((chunk_rows, num_sensors + 1))
+    chunk_pos   = np.zeros(chunk_rows, dtype = int)
+    chunk_len   = 0
+    num_rows    = 0
+
+    with pd.HDFStore(table_fname, mode = 'w') as store:
+
+        def write_chunk(chunk_len : int) -> None :
+            chunk_data[:chunk_len, num_sensors] = chunk_data[:chunk_len, :num_sensors].sum(axis = 1)
+            store.append('LightTable',
+                         make_energy_table(table_positions[chunk_pos[:chunk_len]],
+                                           chunk_data[:chunk_len], signal_type,
+                                           sensor_name, sensor_ids),
+                         format = 'table', data_columns = True)
+            # pandas numbers the rows of every chunk from 0, so they are
+            # renumbered as if the whole table was written at once
+            store.get_storer('LightTable').table.modify_column(
+                start  = num_rows, stop = num_rows + chunk_len,
+                column = np.arange(num_rows, num_rows + chunk_len), colname = 'index')
+
+        points = reduce_point_sets(dst_sets, sensor_ids, num_workers)
+        for pos_idx, point_data in enumerate(points):
+            if point_data is None:
+                print(f"  WARNING: No DST for {plan['base_fnames'][pos_idx]}")
+                continue
+
+            num_photons, sns_charge = point_data
+            chunk_data[chunk_len, :num_sensors] = sns_charge / num_photons
+            chunk_pos [chunk_len] = pos_idx
+            chunk_len += 1
+
+            if chunk_len == chunk_rows:
+                with timer("table_write"): write_chunk(chunk_len)
+                num_rows += chunk_len
+                chunk_len = 0
+
+        if chunk_len:
+            with timer("table_write"): write_chunk(chunk_len)
+            num_rows += chunk_len
+
+    return num_rows
 
-    table_positions = get_tracking_table_positions(det_name, pitch, tracking_maxDist)
 
-    # Getting needed data
+
+###
+def build_tracking_table(det_name         : str,
+                         signal_type      : str,
+                         sensor_name      : str,
+                         pitch            : Tuple[float, float, float],
+                         tracking_maxDist : float,
+                         num_workers      : int                    = 1,
+                         cache_fname      : Optional[str]          = None,
+                         plan             : Optional[CampaignPlan] = None,
+                         aggregate_sensors: bool                   = False
+                        )                -> pd.DataFrame :
+
+    if plan is None:
+        plan = make_campaign_plan(det_name, "tracking", signal_type, pitch, tracking_maxDist)
+    table_positions = plan['positions']
+    dst_sets        = get_point_dst_sets(plan)
+    dst_fnames      = [dst_fname for dst_set in dst_sets for dst_fname in dst_set]
+
+    # Getting needed data
     det_dim         = get_detector_dimensions(det_name)
     sns_id, sns_pos = det_dim["ref_sensor"]
 
@@ -173,50 +507,71 @@ def build_tracking_table(det_name, signal_type, sensor_name, pitch, tracking_max
     pitch_z   = pitch[2]    
     
     # Initial list to be filled with data.
-    dist_xys = list(set((pos[0] - sns_pos_x)  for pos in table_positions))
-    zs       = list(set((pos[2] - pitch_z/2.) for pos in table_positions))
-    dist_xys.sort()
-    zs      .sort(reverse=True)
+    # Aggregating all the sensors, the distances cover tracking_maxDist
+    # whatever the positions simulated.
+    if aggregate_sensors:
+        dist_xys = np.arange(0, tracking_maxDist, pitch[0]).astype(float).tolist()
+    else:
+        dist_xys = np.unique(table_positions['x'] - sns_pos_x)  .tolist()
+    zs       = np.unique(table_positions['z'] - pitch_z/2.)[::-1].tolist()
+    dist_idx = {dist: i for i, dist in enumerate(dist_xys)}
+    z_idx    = {z   : i for i, z    in enumerate(zs)}
 
     light_table_columns = ['dist_xy'] + ['z_m' + str(int(-z)) for z in zs]
     light_table_probs   = np.zeros((len(dist_xys), len(zs)))
 
     # Getting the table data from sims
-    for pos in table_positions:
+    cache  = load_reduction_cache(cache_fname) if cache_fname else None
+
+    # Aggregating the charge of every sensor_name sensor, binned by its xy
+    # distance to the source (closest table distance), and the photons it saw.
+    if aggregate_sensors:
+        first_dst_set = next(dst_set for dst_set in dst_sets if dst_set)
+        sensor_ids    = get_sensor_ids(first_dst_set[0], sensor_name)
+        sensor_xys    = get_sensor_xys(first_dst_set[0], sensor_ids)
+        charge_sums   = np.zeros((len(dist_xys), len(zs)))
+        photon_sums   = np.zeros((len(dist_xys), len(zs)))
+        points = reduce_point_sets(dst_sets, sensor_ids, num_workers, cache)
+    else:
+        if dst_fnames: check_reduced_sensors(dst_fnames[0], sensor_name)
+        points = reduce_point_sets(dst_sets, [sns_id], num_workers, cache)
+
+    for pos, point_data in zip(get_position_tuples(table_positions), points):
+        if point_data is None:
+            print(f"  WARNING: No DST for position {pos}")
+
+        elif aggregate_sensors:
+            z = pos[2] - pitch_z/2.
+
+            num_photons, sns_charge = point_data
+            sns_dists = np.hypot(sensor_xys[:, 0] - pos[0], sensor_xys[:, 1] - pos[1])
+            dist_bins = np.rint(sns_dists / pitch[0]).astype(int)
+            in_table  = dist_bins < len(dist_xys)
+
+            charge_sums[:, z_idx[z]] += np.bincount(dist_bins[in_table], weights = sns_charge[in_table],
+                                                    minlength = len(dist_xys))
+            photon_sums[:, z_idx[z]] += np.bincount(dist_bins[in_table],
+                                                    minlength = len(dist_xys)) * num_photons
 
-        dist = pos[0] - sns_pos_x
-        z    = pos[2] - pitch_z/2.
-        print(f"\n* Getting data from {det_name} - Distance {dist} mm - Z = {z} mm ...")
-    
-        # Getting the right DST file name
-        _, _, _, dst_fname = get_fnames(det_name ,pos)
-        dst_fname += ".h5"
-        print(f"  {dst_fname}")
-
-        if os.path.isfile(dst_fname):
-            
-            # Getting the number of photons from the file, as it could be different
-            # from the one included in the setup.
-            num_photons = get_num_photons(dst_fname)
-            print(f"  Simulation run with {num_photons:9} initial photons.")
-
-            # Getting the sensor response of the sns_type requested
-            sns_response = load_mcsensor_response_df(dst_fname)
-            try:
-                sns_charge   = sns_response.loc[pd.IndexSlice[:, sns_id], 'charge'].sum()
-            except KeyError:
-                sns_charge = 0
-            sns_prob = sns_charge / num_photons
-            print(f"  Charge: {sns_charge:6} -> Sensor prob: {sns_prob:2.3e}")
-            
-            light_table_probs[dist_xys.index(dist), zs.index(z)] = sns_prob        
-        
-        # If the DST file does NOT EXIST
         else:
-            print(f"  WARNING: {dst_fname} NOT exist.")
+            dist = pos[0] - sns_pos_x
+            z    = pos[2] - pitch_z/2.
+
+            num_photons, sns_charge = point_data
+            sns_prob = sns_charge[0] / num_photons
+
+            light_table_probs[dist_idx[dist], z_idx[z]] = sns_prob
+
+    if aggregate_sensors:
+        with np.errstate(invalid = 'ignore', divide = 'ignore'):
+            light_table_probs = np.where(photon_sums > 0, charge_sums / photon_sums, 0.)
+
+    if cache_fname:
+        save_reduction_cache(cache_fname, {dst_fname: cache[dst_fname]
+                                           for dst_fname in dst_fnames if dst_fname in cache})
 
     # Building the LightTable DataFrame
-    dist_xys = [round(dist,1) for dist in dist_xys] # Taking just one decimal for the index
+    dist_xys = [round(dist,1) for dist in dist_xys] # Taking just one decimal for the index
     light_table_data = np.c_[dist_xys, light_table_probs]
     light_table = pd.DataFrame(light_table_data, columns = light_table_columns)
     light_table.set_index("dist_xy", inplace = True)
@@ -232,11 +587,17 @@ def build_table(det_name         : str,
                 signal_type      : str,
                 sensor_name      : str,
                 pitch            : Tuple[float, float, float],
-                tracking_maxDist : float
+                tracking_maxDist : float,
+                num_workers      : int                    = 1,
+                cache_fname      : Optional[str]          = None,
+                plan             : Optional[CampaignPlan] = None,
+                aggregate_sensors: bool                   = False
                )                -> pd.DataFrame :
     
     if table_type == "energy":
-        return build_energy_table(det_name, signal_type, sensor_name, pitch)
+        return build_energy_table(det_name, signal_type, sensor_name, pitch,
+                                  num_workers, cache_fname, plan)
     
     elif table_type == "tracking":
-        return build_tracking_table(det_name, signal_type, sensor_name, pitch, tracking_maxDist)
+        return build_tracking_table(det_name, signal_type, sensor_name, pitch, tracking_maxDist,
+                                    num_workers, cache_fname, plan, aggregate_sensors)
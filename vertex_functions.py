@@ -0,0 +1,81 @@
+import re
+import zlib
+
+from   typing import List
+from   typing import Tuple
+from   typing import Optional
+
+
+# Separator of the DST file name and the event range of a point simulated
+# in a multi-vertex job: "<dst_fname>@<first_event>:<stop_event>"
+EVENT_RANGE_SEP = "@"
+
+# Event range [first_event, stop_event) of a point
+EventRange = Tuple[int, int]
+
+
+
+###
+def get_dst_spec(dst_fname   : str,
+                 first_event : int,
+                 stop_event  : int
+                )           -> str :
+    # The events [first_event, stop_event) of a multi-vertex job DST
+    return f"{dst_fname}{EVENT_RANGE_SEP}{first_event}:{stop_event}"
+
+
+
+###
+def split_dst_spec(dst_spec : str
+                  )        -> Tuple[str, Optional[EventRange]] :
+    # DST file name and event range (None for the whole DST) of a DST spec
+    if EVENT_RANGE_SEP not in dst_spec:
+        return dst_spec, None
+    dst_fname, event_range = dst_spec.rsplit(EVENT_RANGE_SEP, 1)
+    first_event, stop_event = event_range.split(":")
+    return dst_fname, (int(first_event), int(stop_event))
+
+
+
+###
+def get_job_base_fname(det_name          : str,
+                       base_fnames       : List[str],
+                       events_per_vertex : int
+                      )                 -> str :
+
+    # File stem of a multi-vertex job, from the points it simulates (in order)
+    # and their events, so a job DST is never taken for one of other points
+    job_key = "\n".join(base_fnames) + f"\nevents_{events_per_vertex}"
+    return f"{det_name}.job_{zlib.crc32(job_key.encode()):08x}"
+
+
+
+###
+def get_vertex_event_ranges(num_vertices      : int,
+                            events_per_vertex : int
+                           )                 -> List[EventRange] :
+    # Event range of every vertex of a multi-vertex job
+    return [(vertex * events_per_vertex, (vertex + 1) * events_per_vertex)
+            for vertex in range(num_vertices)]
+
+
+
+###
+def get_macro_vertices(macro_content : str,
+                       num_evts      : int
+                      )             -> List[Tuple[Tuple[float, float, float], int, int]] :
+
+    # (pos, first_event, num_events) simulated by the nexus macro commands: one
+    # vertex per beamOn, plus the one of the nexus command line (num_evts)
+    pos, start_id, vertices = [0., 0., 0.], 0, []
+    for line in macro_content.splitlines():
+        vertex_coord = re.match(r"/Geometry/\w+/specific_vertex_([XYZ])\s+(\S+)", line)
+        if vertex_coord:
+            pos["XYZ".index(vertex_coord.group(1))] = float(vertex_coord.group(2))
+        elif line.startswith("/nexus/persistency/start_id"):
+            start_id = int(line.split()[1])
+        elif line.startswith("/run/beamOn"):
+            vertices.append((tuple(pos), start_id, int(line.split()[1])))
+
+    vertices.append((tuple(pos), start_id, num_evts))
+    return vertices